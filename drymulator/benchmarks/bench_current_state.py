@@ -0,0 +1,64 @@
+"""CPU time per `/state/current` request under bursts of concurrent requests.
+
+Every burst fires `size` simultaneous requests at the app (in process, no
+network), with and without single-flight coalescing.
+
+    pixi run bench-current-state
+"""
+
+import os
+import tempfile
+
+# the benchmark must not touch the development database
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench-current-state.db"
+)
+
+import asyncio
+from datetime import datetime
+import itertools
+import time
+
+from fastapi.encoders import jsonable_encoder
+import httpx
+
+from drymulator import server
+from drymulator.models import ConfigCreate
+
+BURSTS = 5
+SIZES = (1, 10, 50)
+
+
+async def run_bursts(client: httpx.AsyncClient, size: int) -> tuple[float, int]:
+    calls = server.current_state_flights.calls
+    start = time.process_time()
+    for _ in range(BURSTS):
+        await asyncio.gather(*(client.get("/state/current") for _ in range(size)))
+    cpu = time.process_time() - start
+    return cpu / (BURSTS * size), server.current_state_flights.calls - calls
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://drymulator"
+        ) as client:
+            config = ConfigCreate(start_time=datetime.now(), time_speed=10)
+            await client.post("/command/reset", json=jsonable_encoder(config))
+
+            print(f"{'burst':>6} {'mode':>10} {'computations':>13} {'cpu/request':>12}")
+            coalesced_key = server.current_state_key
+            unique = itertools.count()
+            for size in SIZES:
+                for mode in ("coalesced", "baseline"):
+                    if mode == "baseline":
+                        # a unique key per request disables the coalescing
+                        server.current_state_key = lambda *args: next(unique)
+                    cpu, calls = await run_bursts(client, size)
+                    server.current_state_key = coalesced_key
+                    print(f"{size:>6} {mode:>10} {calls:>13} {cpu * 1e6:>10.0f}us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""How injected faults propagate into the latency of an agent turn.
+
+An agent turn is modelled as `CALLS` sequential `/state/current` requests,
+as the Cheshire Cat plugin tools make them (no retries). Every fault profile
+is injected through `server.faults` and the turn latency percentiles and
+failure rate are reported.
+
+    pixi run bench-faults
+"""
+
+import os
+import tempfile
+
+# the benchmark must not touch the development database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench-faults.db")
+os.environ.setdefault("FAULT_SEED", "0")
+
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+from drymulator import server
+from drymulator.models import FaultCreate
+
+TURNS = 200
+CALLS = 3
+PROFILES = {
+    "none": [],
+    "slow": [FaultCreate(latency_ms=5, latency_sigma=0.3)],
+    "heavy tail": [FaultCreate(latency_ms=2, latency_sigma=1.5)],
+    "flaky": [
+        FaultCreate(
+            latency_ms=2, error_rate=0.02, dropout_rate=0.002, dropout_seconds=0.1
+        )
+    ],
+}
+
+
+async def turn(client: httpx.AsyncClient) -> tuple[float, bool]:
+    start = time.perf_counter()
+    ok = True
+    for _ in range(CALLS):
+        ok &= (await client.get("/state/current")).status_code == 200
+    return time.perf_counter() - start, ok
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://drymulator"
+        ) as client:
+            print(f"{'profile':>15} {'p50':>8} {'p95':>8} {'p99':>8} {'failed':>7}")
+            for name, faults in PROFILES.items():
+                for fault in faults:
+                    server.faults.add(fault)
+                results = [await turn(client) for _ in range(TURNS)]
+                for fault in server.faults.faults():
+                    server.faults.remove(fault.id)
+
+                latency = np.array([seconds for seconds, _ in results]) * 1000
+                failed = 1 - np.mean([ok for _, ok in results])
+                p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+                print(
+                    f"{name:>15} {p50:>6.1f}ms {p95:>6.1f}ms {p99:>6.1f}ms"
+                    f" {failed:>6.1%}"
+                )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Cost of a tick of the fleet stream hub, against encoding per subscriber.
+
+`DRYERS` sensor-backed dryers on `LINES` tagged lines send a reading every
+tick, `CHANGED` of them at a time. Subscribers are split among one filter
+per line plus the whole fleet; a tenth of them never read their frames.
+
+    pixi run bench-hub
+"""
+
+import json
+import time
+
+import numpy as np
+
+from drymulator.fleet import Fleet
+from drymulator.hub import StateHub
+from drymulator.live import LiveDryers
+from drymulator.models import ReadingCreate
+from drymulator.simulation import SimulationRegistry
+
+DRYERS = 1000
+LINES = 10
+CHANGED = 0.2
+SUBSCRIBERS = (10, 100, 1000)
+TICKS = 20
+
+
+def readings(rng, tick: int, fraction: float) -> list[ReadingCreate]:
+    dryers = np.flatnonzero(rng.random(DRYERS) < fraction)
+    return [
+        ReadingCreate(
+            dryer_id=f"dryer-{dryer}",
+            time_seconds=tick,
+            fraction_initial=0.9 - tick * 1e-4,
+            weight=300.0 - tick * 0.03 - dryer * 1e-3,
+        )
+        for dryer in dryers
+    ]
+
+
+def naive_tick(fleet: Fleet, filters: list[list[str]], now: float) -> int:
+    """Every subscriber gets the full state of its dryers, encoded for it."""
+    sent = 0
+    for where in filters:
+        ids, columns = fleet.state(now)
+        rows = np.flatnonzero(fleet.mask(ids, columns, where))
+        states = {
+            ids[row]: {
+                "time_seconds": int(columns["time_seconds"][row]),
+                "fraction_initial": float(columns["fraction_initial"][row]),
+                "weight": float(columns["weight"][row]),
+            }
+            for row in rows
+        }
+        sent += len(f"data: {json.dumps(states)}\n\n")
+    return sent
+
+
+def main():
+    print(f"{'subscribers':>11} {'hub ms':>7} {'naive ms':>9} {'dropped':>8}")
+    for subscribers in SUBSCRIBERS:
+        rng = np.random.default_rng(0)
+        fleet = Fleet(SimulationRegistry(max_forks=1), LiveDryers())
+        fleet.live.ingest(readings(rng, 0, 1.0))
+        for dryer in range(DRYERS):
+            fleet.tags[f"dryer-{dryer}"] = {"line": str(dryer % LINES)}
+        hub = StateHub(fleet)
+        filters = [
+            [f"line={number % (LINES + 1)}"] if number % (LINES + 1) < LINES else []
+            for number in range(subscribers)
+        ]
+        hub_subscribers = [hub.subscribe(where) for where in filters]
+        now = time.time()
+        hub.tick(now)
+
+        hub_seconds = naive_seconds = 0.0
+        for tick in range(1, TICKS + 1):
+            fleet.live.ingest(readings(rng, tick, CHANGED))
+            start = time.perf_counter()
+            hub.tick(now + tick)
+            hub_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            naive_tick(fleet, filters, now + tick)
+            naive_seconds += time.perf_counter() - start
+            # the slow tenth never reads
+            for number, subscriber in enumerate(hub_subscribers):
+                if number % 10:
+                    while not subscriber.frames.empty():
+                        subscriber.frames.get_nowait()
+        dropped = sum(subscriber.dropped for subscriber in hub_subscribers)
+        print(
+            f"{subscribers:>11} {hub_seconds / TICKS * 1e3:>7.2f}"
+            f" {naive_seconds / TICKS * 1e3:>9.2f} {dropped:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Readings per second sustained by `POST /ingest`.
+
+`DRYERS` dryers send a reading every second, batched by a gateway into
+requests of `BATCH` readings. The requests go to the app in process (no
+network), and the readings stored in the database are counted at the end.
+
+    pixi run bench-ingest
+"""
+
+import os
+import tempfile
+
+# the benchmark must not touch the development database
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench-ingest.db")
+
+import asyncio
+import time
+
+import httpx
+from sqlmodel import Session, func, select
+
+from drymulator import server
+from drymulator.models import Reading
+
+DRYERS = 1000
+SECONDS = 50
+BATCHES = (100, 1000)
+
+
+def batches(size: int):
+    readings = (
+        {
+            "dryer_id": f"dryer-{dryer}",
+            "time_seconds": second,
+            "fraction_initial": 0.9 - second * 1e-4,
+            "weight": 300.0 - second * 0.03,
+        }
+        for second in range(SECONDS)
+        for dryer in range(DRYERS)
+    )
+    batch = []
+    for reading in readings:
+        batch.append(reading)
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://drymulator"
+        ) as client:
+            print(f"{'batch':>6} {'readings':>9} {'readings/s':>11}")
+            for size in BATCHES:
+                start = time.perf_counter()
+                for batch in batches(size):
+                    await client.post("/ingest", json=batch)
+                await server.flush_readings()
+                elapsed = time.perf_counter() - start
+                total = DRYERS * SECONDS
+                print(f"{size:>6} {total:>9} {total / elapsed:>11.0f}")
+
+    with Session(server.engine) as session:
+        stored = session.exec(select(func.count()).select_from(Reading)).one()
+    print(f"stored {stored} readings")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
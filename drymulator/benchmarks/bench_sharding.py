@@ -0,0 +1,109 @@
+"""Throughput of a sharded fleet against the number of nodes.
+
+`NODES` drymulator nodes and a router run as local processes. `FORKS` forks
+are created through the router, then `CONCURRENCY` clients ask for Monte
+Carlo ensembles (CPU bound, a few ms each) of random forks for `SECONDS`.
+Throughput scales with the nodes as long as there are cores for them.
+
+    pixi run bench-sharding
+"""
+
+import asyncio
+import os
+from pathlib import Path
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+NODES = (1, 2, 4)
+FORKS = 100
+CONCURRENCY = 32
+SECONDS = 10
+ENSEMBLE = {"target_weight": 100, "n": 5000, "steps": 200}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def start(app: str, directory: str, **env) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).parents[1] / "src"), **env}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--no-access-log"],
+        env=env,
+        cwd=directory,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"http://localhost:{port}"
+
+
+def wait(url: str):
+    for _ in range(200):
+        try:
+            httpx.get(f"{url}/trajectories").raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not start")
+
+
+async def load(url: str) -> float:
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        forks = [
+            (await client.post("/command/fork")).json()["dryer_id"]
+            for _ in range(FORKS)
+        ]
+        done = 0
+        deadline = time.perf_counter() + SECONDS
+
+        async def worker():
+            nonlocal done
+            while time.perf_counter() < deadline:
+                params = {**ENSEMBLE, "dryer_id": random.choice(forks)}
+                response = await client.get("/state/ensemble", params=params)
+                response.raise_for_status()
+                done += 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        return done / (time.perf_counter() - start_time)
+
+
+def main():
+    print(f"{os.cpu_count()} cpus")
+    print(f"{'nodes':>5} {'requests/s':>11}")
+    for nodes in NODES:
+        directory = tempfile.mkdtemp()
+        processes, urls = [], []
+        for number in range(nodes):
+            process, url = start(
+                "drymulator.server:app",
+                directory,
+                DATABASE_URL=f"sqlite:///{directory}/node-{number}.db",
+            )
+            processes.append(process)
+            urls.append(url)
+        router, router_url = start(
+            "drymulator.router:app", directory, ROUTER_NODES=",".join(urls)
+        )
+        processes.append(router)
+        try:
+            for url in urls + [router_url]:
+                wait(url)
+            print(f"{nodes:>5} {asyncio.run(load(router_url)):>11.1f}")
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == "__main__":
+    main()
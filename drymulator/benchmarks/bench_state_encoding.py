@@ -0,0 +1,94 @@
+"""CPU time per request of pre-encoded samples against the Pydantic path.
+
+The "pydantic" rows rebuild what `/state/time` did before: look the sample
+up, validate it into a `StatePublic` and let FastAPI encode it. The
+"pre-encoded" rows slice the bytes built when the trajectory loaded.
+
+    pixi run bench-state-encoding
+"""
+
+import os
+import tempfile
+
+# the benchmark must not touch the development database
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench-state-encoding.db"
+)
+
+import asyncio
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+import httpx
+from sqlmodel import Session, func, select
+
+from drymulator import server
+from drymulator.library import DEFAULT_TRAJECTORY
+from drymulator.models import HistoryState, StatePublic
+
+ENCODINGS = 20_000
+REQUESTS = 200
+
+
+@server.app.get("/bench/state/time")
+async def pydantic_state_time(second_after: int) -> StatePublic:
+    with Session(server.engine) as session:
+        state = session.exec(
+            select(HistoryState).order_by(
+                func.abs(HistoryState.time_seconds - second_after)
+            )
+        ).first()
+        return StatePublic.model_validate(state)
+
+
+def cpu_per_call(fn, calls: int) -> float:
+    start = time.process_time()
+    for _ in range(calls):
+        fn()
+    return (time.process_time() - start) / calls
+
+
+def bench_encoding():
+    trajectory = server.library.get(DEFAULT_TRAJECTORY)
+    indexes = [random.randrange(len(trajectory)) for _ in range(ENCODINGS)]
+    rows = [HistoryState.model_validate(trajectory.state(i)) for i in indexes]
+    pydantic_rows, encoded_indexes = iter(rows), iter(indexes)
+
+    def pydantic():
+        state = StatePublic.model_validate(next(pydantic_rows))
+        return JSONResponse(jsonable_encoder(state)).body
+
+    def encoded():
+        index = next(encoded_indexes)
+        return Response(trajectory.json(index), media_type="application/json").body
+
+    return cpu_per_call(pydantic, ENCODINGS), cpu_per_call(encoded, ENCODINGS)
+
+
+async def bench_requests(client: httpx.AsyncClient, path: str) -> float:
+    start = time.process_time()
+    for _ in range(REQUESTS):
+        second_after = random.randrange(0, 172_800)
+        response = await client.get(path, params={"second_after": second_after})
+        response.raise_for_status()
+    return (time.process_time() - start) / REQUESTS
+
+
+async def main():
+    transport = httpx.ASGITransport(app=server.app)
+    async with server.app.router.lifespan_context(server.app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://drymulator"
+        ) as client:
+            pydantic, encoded = bench_encoding()
+            print(f"{'':>24} {'pydantic':>10} {'pre-encoded':>12}")
+            print(f"{'encoding':>24} {pydantic * 1e6:>8.1f}us {encoded * 1e6:>10.1f}us")
+            pydantic = await bench_requests(client, "/bench/state/time")
+            encoded = await bench_requests(client, "/state/time")
+            print(f"{'request':>24} {pydantic * 1e6:>8.0f}us {encoded * 1e6:>10.0f}us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
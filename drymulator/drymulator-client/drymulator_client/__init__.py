@@ -1,8 +1,12 @@
 """A client library for accessing FastAPI"""
 
 from .client import AuthenticatedClient, Client
+from .shared import aclose_client, close_client, get_client
 
 __all__ = (
     "AuthenticatedClient",
     "Client",
+    "aclose_client",
+    "close_client",
+    "get_client",
 )
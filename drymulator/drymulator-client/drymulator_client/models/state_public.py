@@ -1,23 +1,37 @@
-from typing import Any, TypeVar
+from typing import Any, TypeVar, Union, cast
 
 from attrs import define as _attrs_define
 from attrs import field as _attrs_field
 
+from ..types import UNSET, Unset
+
 T = TypeVar("T", bound="StatePublic")
 
 
 @_attrs_define
 class StatePublic:
-    """
+    """A state with the quantities derived from it, None when unknown.
+
+    `fraction_initial` is the water left as a fraction of the initial
+    weight, and `f0` its initial value.
+
     Attributes:
         time_seconds (int):
         fraction_initial (float):
         weight (float):
+        dry_basis_moisture (Union[None, Unset, float]):
+        moisture_ratio (Union[None, Unset, float]):
+        drying_rate (Union[None, Unset, float]):
+        anomalies (Union[None, Unset, list[str]]):
     """
 
     time_seconds: int
     fraction_initial: float
     weight: float
+    dry_basis_moisture: Union[None, Unset, float] = UNSET
+    moisture_ratio: Union[None, Unset, float] = UNSET
+    drying_rate: Union[None, Unset, float] = UNSET
+    anomalies: Union[None, Unset, list[str]] = UNSET
     additional_properties: dict[str, Any] = _attrs_field(init=False, factory=dict)
 
     def to_dict(self) -> dict[str, Any]:
@@ -27,6 +41,33 @@ class StatePublic:
 
         weight = self.weight
 
+        dry_basis_moisture: Union[None, Unset, float]
+        if isinstance(self.dry_basis_moisture, Unset):
+            dry_basis_moisture = UNSET
+        else:
+            dry_basis_moisture = self.dry_basis_moisture
+
+        moisture_ratio: Union[None, Unset, float]
+        if isinstance(self.moisture_ratio, Unset):
+            moisture_ratio = UNSET
+        else:
+            moisture_ratio = self.moisture_ratio
+
+        drying_rate: Union[None, Unset, float]
+        if isinstance(self.drying_rate, Unset):
+            drying_rate = UNSET
+        else:
+            drying_rate = self.drying_rate
+
+        anomalies: Union[None, Unset, list[str]]
+        if isinstance(self.anomalies, Unset):
+            anomalies = UNSET
+        elif isinstance(self.anomalies, list):
+            anomalies = self.anomalies
+
+        else:
+            anomalies = self.anomalies
+
         field_dict: dict[str, Any] = {}
         field_dict.update(self.additional_properties)
         field_dict.update(
@@ -36,6 +77,14 @@ class StatePublic:
                 "weight": weight,
             }
         )
+        if dry_basis_moisture is not UNSET:
+            field_dict["dry_basis_moisture"] = dry_basis_moisture
+        if moisture_ratio is not UNSET:
+            field_dict["moisture_ratio"] = moisture_ratio
+        if drying_rate is not UNSET:
+            field_dict["drying_rate"] = drying_rate
+        if anomalies is not UNSET:
+            field_dict["anomalies"] = anomalies
 
         return field_dict
 
@@ -48,10 +97,58 @@ class StatePublic:
 
         weight = d.pop("weight")
 
+        def _parse_dry_basis_moisture(data: object) -> Union[None, Unset, float]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, float], data)
+
+        dry_basis_moisture = _parse_dry_basis_moisture(d.pop("dry_basis_moisture", UNSET))
+
+        def _parse_moisture_ratio(data: object) -> Union[None, Unset, float]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, float], data)
+
+        moisture_ratio = _parse_moisture_ratio(d.pop("moisture_ratio", UNSET))
+
+        def _parse_drying_rate(data: object) -> Union[None, Unset, float]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            return cast(Union[None, Unset, float], data)
+
+        drying_rate = _parse_drying_rate(d.pop("drying_rate", UNSET))
+
+        def _parse_anomalies(data: object) -> Union[None, Unset, list[str]]:
+            if data is None:
+                return data
+            if isinstance(data, Unset):
+                return data
+            try:
+                if not isinstance(data, list):
+                    raise TypeError()
+                anomalies_type_0 = cast(list[str], data)
+
+                return anomalies_type_0
+            except:  # noqa: E722
+                pass
+            return cast(Union[None, Unset, list[str]], data)
+
+        anomalies = _parse_anomalies(d.pop("anomalies", UNSET))
+
         state_public = cls(
             time_seconds=time_seconds,
             fraction_initial=fraction_initial,
             weight=weight,
+            dry_basis_moisture=dry_basis_moisture,
+            moisture_ratio=moisture_ratio,
+            drying_rate=drying_rate,
+            anomalies=anomalies,
         )
 
         state_public.additional_properties = d
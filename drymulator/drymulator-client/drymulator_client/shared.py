@@ -0,0 +1,72 @@
+"""A process-wide client shared by every caller, so that calls reuse pooled connections"""
+
+import asyncio
+import importlib.util
+import threading
+from typing import Optional
+
+import httpx
+
+from .client import Client
+
+# calls come at the pace of a conversation, keep their connections longer than httpx's 5 seconds
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120.0)
+
+_lock = threading.Lock()
+_client: Optional[Client] = None
+_key: Optional[tuple[str, bool]] = None
+
+
+def get_client(base_url: str, *, http2: bool = False) -> Client:
+    """Get the shared client for `base_url`, creating it on first use
+
+    Both its `httpx.Client` and `httpx.AsyncClient` keep their connections alive across calls (use the async one from a
+    single event loop, its connections belong to it). The client is rebuilt when `base_url` or `http2` change, e.g.
+    after the settings have been edited, and the previous one closed.
+
+    HTTP/2 needs the `h2` package (`pip install drymulator-client[http2]`), without it the client uses HTTP/1.1.
+    """
+    global _client, _key
+    base_url = str(base_url)
+    key = (base_url, http2 and importlib.util.find_spec("h2") is not None)
+    previous = None
+    with _lock:
+        if _client is None or _key != key:
+            previous = _client
+            client = Client(base_url=base_url, httpx_args={"limits": LIMITS, "http2": key[1]})
+            # created now rather than on first use, where concurrent callers could each create one
+            client.get_httpx_client()
+            client.get_async_httpx_client()
+            _client, _key = client, key
+        client = _client
+    if previous is not None:
+        _close(previous)
+    return client
+
+
+def _close(client: Client) -> None:
+    client.get_httpx_client().close()
+    try:
+        asyncio.get_running_loop().create_task(client.get_async_httpx_client().aclose())
+    except RuntimeError:
+        # no event loop to close it on, its connections are dropped with it
+        pass
+
+
+def close_client() -> None:
+    """Close the shared client, the next `get_client` creates a new one"""
+    global _client, _key
+    with _lock:
+        client, _client, _key = _client, None, None
+    if client is not None:
+        client.get_httpx_client().close()
+
+
+async def aclose_client() -> None:
+    """Close the shared client from an event loop, the next `get_client` creates a new one"""
+    global _client, _key
+    with _lock:
+        client, _client, _key = _client, None, None
+    if client is not None:
+        client.get_httpx_client().close()
+        await client.get_async_httpx_client().aclose()
@@ -14,5 +14,6 @@ setup(
     packages=find_packages(),
     python_requires=">=3.9, <4",
     install_requires=["httpx >= 0.20.0, < 0.29.0", "attrs >= 22.2.0", "python-dateutil >= 2.8.0, < 3"],
+    extras_require={"http2": ["httpx[http2] >= 0.20.0, < 0.29.0"]},
     package_data={"drymulator_client": ["py.typed"]},
 )
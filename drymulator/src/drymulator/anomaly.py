@@ -0,0 +1,175 @@
+from typing import Optional
+
+import numpy as np
+
+from .columns import Columns
+from .estimation import reading_ranks
+from .models import ReadingCreate
+
+# a reading far from the recent drying rates (rolling z-score)
+SPIKE = 1
+# weight loss slowing down for a while (CUSUM of the z-scores)
+STALL = 2
+# weight changing faster than physically possible (rate bound)
+JUMP = 4
+
+ANOMALIES = {"spike": SPIKE, "stall": STALL, "jump": JUMP}
+
+
+def anomaly_names(flags: int) -> list[str]:
+    return [name for name, flag in ANOMALIES.items() if flags & flag]
+
+
+class AnomalyDetector:
+    """Streaming detectors of anomalies in the readings of sensor-backed dryers.
+
+    Every reading gives a drying rate (weight change per hour since the
+    previous one) that is checked against:
+
+    - its exponentially weighted mean and variance (weight `alpha` for the
+      new rate): a z-score beyond `z_threshold` is a spike;
+    - a one-sided CUSUM of the z-scores with slack `cusum_k`: above
+      `cusum_h` the rate has stayed closer to zero than usual, a stall, which
+      lasts until the rate is back to what it was;
+    - `max_rate`: a weight change faster than that is a jump.
+
+    z-scores are clipped to `z_threshold` before updating the mean, variance
+    and CUSUM, so a single bad reading does not hide the next ones. Flags are
+    those of the latest batch of readings of a dryer. Like `MoistureFilter`,
+    the state of every dryer is a few columns and a batch of readings takes a
+    few array operations per reading of its busiest dryer, whatever the fleet
+    size.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        z_threshold: float = 6.0,
+        cusum_k: float = 0.5,
+        cusum_h: float = 10.0,
+        max_rate: float = 300.0,
+        warmup: int = 20,
+    ):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.max_rate = max_rate
+        # rates seen before the z-scores are trusted
+        self.warmup = warmup
+        self.states = Columns(
+            {
+                "time_seconds": np.float64,
+                "weight": np.float64,
+                # weighted mean and variance of the rate, in weight per hour
+                "mean": np.float64,
+                "variance": np.float64,
+                "count": np.int64,
+                "cusum": np.float64,
+                # anomalies of the latest batch of readings
+                "flags": np.int64,
+            }
+        )
+
+    def __contains__(self, dryer_id: str) -> bool:
+        return dryer_id in self.states
+
+    def update(self, readings: list[ReadingCreate]):
+        states = self.states
+        new = {}
+        for reading in readings:
+            if reading.dryer_id not in states and reading.dryer_id not in new:
+                new[reading.dryer_id] = reading
+        for dryer_id, reading in new.items():
+            states.set(
+                dryer_id,
+                time_seconds=-np.inf,
+                weight=reading.weight,
+                mean=0.0,
+                variance=0.0,
+                count=0,
+                cusum=0.0,
+                flags=0,
+            )
+        rows = np.fromiter(
+            (states.row(reading.dryer_id) for reading in readings),
+            dtype=np.intp,
+            count=len(readings),
+        )
+        # anomalies of any reading of the batch, not only of the latest one
+        states["flags"][rows] = 0
+        time_seconds = np.fromiter(
+            (reading.time_seconds for reading in readings), np.float64, len(readings)
+        )
+        weight = np.fromiter(
+            (reading.weight for reading in readings), np.float64, len(readings)
+        )
+        rank = reading_ranks(rows, time_seconds)
+        for step in range(rank.max(initial=-1) + 1):
+            batch = rank == step
+            self._update(rows[batch], time_seconds[batch], weight[batch])
+
+    def _update(self, rows: np.ndarray, time_seconds: np.ndarray, weight: np.ndarray):
+        s = self.states
+        dt = time_seconds - s["time_seconds"][rows]
+        # late readings are dropped, the first one of a dryer only starts it
+        first = np.isinf(dt)
+        s["time_seconds"][rows[first]] = time_seconds[first]
+        s["weight"][rows[first]] = weight[first]
+        keep = (dt > 0) & ~first
+        rows, time_seconds, weight, dt = (
+            array[keep] for array in (rows, time_seconds, weight, dt)
+        )
+        rate = (weight - s["weight"][rows]) / dt * 3600
+        mean, variance = s["mean"][rows], s["variance"][rows]
+        count = s["count"][rows]
+
+        jump = np.abs(rate) > self.max_rate
+        warm = count >= self.warmup
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where(warm, (rate - mean) / np.sqrt(variance), 0.0)
+        z = np.nan_to_num(z, nan=0.0, posinf=np.inf, neginf=-np.inf)
+        # a single reading moves the sum and the statistics a bounded amount
+        clipped = np.clip(z, -self.z_threshold, self.z_threshold)
+        cusum = s["cusum"][rows]
+        cusum = np.where(jump, cusum, np.maximum(cusum + clipped - self.cusum_k, 0))
+        # bounded too, for a stall to clear soon after the drying resumes
+        cusum = np.minimum(cusum, 2 * self.cusum_h)
+        stall = cusum > self.cusum_h
+        spike = warm & (np.abs(z) > self.z_threshold) & ~(stall | jump)
+
+        # the statistics keep the rate from before a stall, until it is over
+        update = ~(jump | stall)
+        winsorized = np.where(warm, mean + clipped * np.sqrt(variance), rate)
+        difference = winsorized - mean
+        increment = self.alpha * difference
+        s["mean"][rows] = np.where(update, mean + increment, mean)
+        s["variance"][rows] = np.where(
+            update, (1 - self.alpha) * (variance + difference * increment), variance
+        )
+        s["count"][rows] = count + update
+        s["cusum"][rows] = cusum
+        s["flags"][rows] |= SPIKE * spike | STALL * stall | JUMP * jump
+        s["time_seconds"][rows] = time_seconds
+        s["weight"][rows] = weight
+
+    def flags(self, dryer_ids: list[str]) -> np.ndarray:
+        """Anomaly flags of the latest readings of the dryers, 0 if unknown."""
+        states = self.states
+        rows = np.fromiter(
+            (
+                states.row(dryer_id) if dryer_id in states else -1
+                for dryer_id in dryer_ids
+            ),
+            dtype=np.intp,
+            count=len(dryer_ids),
+        )
+        flags = np.zeros(len(dryer_ids), dtype=np.int64)
+        known = rows >= 0
+        flags[known] = states["flags"][rows[known]]
+        return flags
+
+    def anomalies(self, dryer_id: str) -> Optional[list[str]]:
+        if dryer_id not in self.states:
+            return None
+        return anomaly_names(int(self.states["flags"][self.states.row(dryer_id)]))
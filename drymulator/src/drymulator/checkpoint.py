@@ -0,0 +1,197 @@
+"""Compact checkpoints of the dryer sessions, for a fast recovery on restart.
+
+A checkpoint is a single `.npz` file with the clocks of the forks (anchor,
+pause offset, speed), their tags and rules, the latest readings, Kalman and
+anomaly detector states of the sensor-backed dryers, and the live simulation
+config. It is taken on the event loop (copies of a few arrays) and written
+from a thread to a temporary file that replaces the previous checkpoint
+atomically, so a crash while writing leaves the last complete one.
+"""
+
+from datetime import datetime
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .anomaly import AnomalyDetector
+from .columns import Columns
+from .estimation import MoistureFilter
+from .library import TrajectoryLibrary
+from .live import LiveDryers
+from .models import ConfigPublic, RuleCreate, RulePublic
+from .rules import RuleEngine
+from .simulation import Simulation, SimulationRegistry
+
+VERSION = 1
+
+
+def _columns(prefix: str, columns: Columns) -> dict[str, np.ndarray]:
+    arrays = {f"{prefix}/keys": np.array(columns.keys, dtype=str)}
+    for name, array in columns._arrays.items():
+        if array.dtype != object:
+            arrays[f"{prefix}/{name}"] = columns[name].copy()
+    return arrays
+
+
+def _restore_columns(prefix: str, columns: Columns, data: dict[str, np.ndarray]):
+    if f"{prefix}/keys" not in data:
+        return
+    names = [name for name in columns._arrays if f"{prefix}/{name}" in data]
+    for row, key in enumerate(data[f"{prefix}/keys"].tolist()):
+        columns.set(key, **{name: data[f"{prefix}/{name}"][row] for name in names})
+
+
+def take(
+    registry: SimulationRegistry,
+    tags: dict[str, dict[str, str]],
+    rules: RuleEngine,
+    live: LiveDryers,
+    estimates: MoistureFilter,
+    anomalies: AnomalyDetector,
+    config: ConfigPublic,
+    paused_seconds: int,
+) -> dict[str, np.ndarray]:
+    """Arrays of a checkpoint, independent of the live objects."""
+    simulations = [registry.simulations[key] for key in registry.clocks.keys]
+    session = {
+        "version": VERSION,
+        "taken_at": datetime.now().isoformat(),
+        "config": config.model_dump(mode="json"),
+        # state the live simulation serves while paused
+        "paused_seconds": paused_seconds,
+        "tags": tags,
+        "rules": [rule.model_dump() for rule in rules.rules()],
+    }
+    return {
+        "session": np.array(json.dumps(session)),
+        **_columns("forks", registry.clocks),
+        "forks/trajectory": np.array(
+            [simulation.trajectory_name for simulation in simulations], dtype=str
+        ),
+        "forks/parent_id": np.array(
+            [simulation.parent_id or "" for simulation in simulations], dtype=str
+        ),
+        **_columns("live", live.latest),
+        **_columns("estimates", estimates.states),
+        **_columns("anomalies", anomalies.states),
+    }
+
+
+class CheckpointWriter:
+    """Writes checkpoints to `path`, one at a time and never an older one.
+
+    A periodic write still running in a thread when the final one is taken
+    on shutdown must not replace it.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._written = -1.0
+
+    def write(self, arrays: dict[str, np.ndarray], taken: float):
+        """Write a checkpoint taken at `taken` (a `time.monotonic` time)."""
+        with self._lock:
+            if taken <= self._written:
+                return
+            with tempfile.NamedTemporaryFile(
+                dir=self.path.parent, prefix=f".{self.path.name}.", delete=False
+            ) as file:
+                np.savez(file, **arrays)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(file.name, self.path)
+            self._written = taken
+
+
+def load(path: str) -> Optional[dict[str, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def session(data: dict[str, np.ndarray]) -> dict:
+    """Config, paused state, tags and rules of a checkpoint."""
+    return json.loads(data["session"].item())
+
+
+def restore(
+    data: dict[str, np.ndarray],
+    registry: SimulationRegistry,
+    library: TrajectoryLibrary,
+    tags: dict[str, dict[str, str]],
+    rules: RuleEngine,
+    live: LiveDryers,
+    estimates: MoistureFilter,
+    anomalies: AnomalyDetector,
+) -> int:
+    """Restore the forks and sensor-backed dryers, returns the forks restored.
+
+    Forks whose trajectory is no longer in the library are skipped, rules
+    start over as if just added.
+    """
+    restored = 0
+    columns = ("anchor_time", "anchor_seconds", "time_speed", "is_active")
+    keys = data["forks/keys"].tolist()
+    # checkpoints from before the versions start them at 0
+    versions = data["forks/version"] if "forks/version" in data else [0] * len(keys)
+    forks = zip(
+        keys,
+        data["forks/trajectory"].tolist(),
+        data["forks/parent_id"].tolist(),
+        *(data[f"forks/{name}"].tolist() for name in columns),
+        list(map(int, versions)),
+    )
+    for (
+        dryer_id,
+        name,
+        parent_id,
+        anchor_time,
+        seconds,
+        speed,
+        active,
+        version,
+    ) in forks:
+        try:
+            trajectory = library.get(name)
+        except KeyError:
+            continue
+        registry.simulations[dryer_id] = Simulation(
+            trajectory,
+            name,
+            datetime.fromtimestamp(anchor_time),
+            seconds,
+            speed,
+            active,
+            parent_id or None,
+            version,
+        )
+        registry.sync(dryer_id)
+        restored += 1
+    _restore_columns("live", live.latest, data)
+    if "live/keys" in data and "live/f0" not in data:
+        # from before the derived quantities: the latest reading is the
+        # earliest one known, with no drying rate yet
+        latest = live.latest
+        rows = [latest.row(key) for key in data["live/keys"].tolist()]
+        latest["f0"][rows] = latest["fraction_initial"][rows]
+        latest["drying_rate"][rows] = np.nan
+    _restore_columns("estimates", estimates.states, data)
+    _restore_columns("anomalies", anomalies.states, data)
+
+    saved = session(data)
+    tags.update(
+        (dryer_id, dryer_tags)
+        for dryer_id, dryer_tags in saved["tags"].items()
+        if dryer_id in registry or dryer_id in live
+    )
+    for rule in map(RulePublic.model_validate, saved["rules"]):
+        if rule.dryer_id is None or rule.dryer_id in registry or rule.dryer_id in live:
+            rules.add(RuleCreate.model_validate(rule.model_dump()), rule_id=rule.id)
+    return restored
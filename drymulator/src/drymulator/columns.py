@@ -0,0 +1,68 @@
+from typing import Hashable
+
+import numpy as np
+
+
+class Columns:
+    """Struct of arrays with one row per key.
+
+    Rows stay contiguous: a removed row is replaced by the last one, so every
+    column is a dense array that whole-fleet computations can use as is. The
+    arrays grow by doubling.
+    """
+
+    def __init__(self, dtypes: dict[str, np.dtype], capacity: int = 64):
+        self.keys: list[Hashable] = []
+        self._rows: dict[Hashable, int] = {}
+        self._arrays = {
+            name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """View of a column, valid until the next row is added or removed."""
+        return self._arrays[name][: len(self.keys)]
+
+    def row(self, key: Hashable) -> int:
+        return self._rows[key]
+
+    def add(self, key: Hashable) -> int:
+        """Row of `key`, appended (uninitialized) if it is not there yet."""
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        row = len(self.keys)
+        capacity = len(next(iter(self._arrays.values())))
+        if row == capacity:
+            for name, array in self._arrays.items():
+                grown = np.empty(2 * capacity, dtype=array.dtype)
+                grown[:row] = array[:row]
+                self._arrays[name] = grown
+        self.keys.append(key)
+        self._rows[key] = row
+        return row
+
+    def set(self, key: Hashable, **values):
+        row = self.add(key)
+        for name, value in values.items():
+            self._arrays[name][row] = value
+
+    def remove(self, key: Hashable):
+        row = self._rows.pop(key)
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            for array in self._arrays.values():
+                array[row] = array[last]
+            self.keys[row] = moved
+            self._rows[moved] = row
+        self.keys.pop()
+        for array in self._arrays.values():
+            if array.dtype == object:
+                # don't keep the removed object alive
+                array[last] = None
@@ -0,0 +1,85 @@
+from typing import Optional
+
+import numpy as np
+
+from .kinetics import PageModel
+from .models import EnsemblePublic
+
+PERCENTILES = (5, 50, 95)
+
+
+def _percentiles(values: np.ndarray) -> np.ndarray:
+    """Nearest-rank percentiles along the last axis.
+
+    A single partition is much cheaper than `np.percentile`, and never
+    interpolating keeps infinite values (never reached targets) intact.
+    """
+    n = values.shape[-1]
+    kth = [max(int(np.ceil(p / 100 * n)) - 1, 0) for p in PERCENTILES]
+    return np.moveaxis(np.partition(values, kth, axis=-1)[..., kth], -1, 0)
+
+
+def run_ensemble(
+    model: PageModel,
+    n: int,
+    start_seconds: float,
+    horizon_seconds: float,
+    steps: int,
+    target_weight: float,
+    k_sigma: float = 0.1,
+    n_sigma: float = 0.02,
+    weight_sigma: float = 0.02,
+    noise_sigma: float = 0.1,
+    seed: Optional[int] = None,
+) -> EnsemblePublic:
+    """Monte Carlo ensemble of `n` perturbed runs of the drying kinetics.
+
+    Every run draws its own rate `k` (log-normal), exponent `n` and initial
+    weight (relative normal perturbations); sensor noise is added to each
+    weight reading. All runs are evaluated at once on a `steps x n` float32
+    grid starting at `start_seconds`, with the runs on the contiguous axis so
+    the percentiles are computed row by row.
+    """
+    rng = np.random.default_rng(seed)
+    k = (model.k * np.exp(rng.normal(0.0, k_sigma, n))).astype(np.float32)
+    exponent = np.maximum(model.n * (1 + rng.normal(0.0, n_sigma, n)), 0.05)
+    w0 = model.w0 * (1 + rng.normal(0.0, weight_sigma, n))
+
+    time_seconds = np.linspace(start_seconds, start_seconds + horizon_seconds, steps)
+    # t**n as exp(n ln t) on the whole grid, t = 0 gives a moisture ratio of 1
+    with np.errstate(divide="ignore"):
+        log_time = np.log(time_seconds).astype(np.float32)
+    weight = np.exp(np.multiply.outer(log_time, exponent.astype(np.float32)))
+    # the grid is updated in place: t**n -> moisture ratio -> weight
+    weight *= -k
+    np.exp(weight, out=weight)
+    weight *= model.f0 - model.f_eq
+    weight += 1 - model.f0 + model.f_eq
+    weight *= w0.astype(np.float32)
+    weight += noise_sigma * rng.standard_normal(weight.shape, dtype=np.float32)
+
+    # invert the model to get when every run reaches the target weight
+    target_ratio = (target_weight / w0 - 1 + model.f0 - model.f_eq) / (
+        model.f0 - model.f_eq
+    )
+    with np.errstate(divide="ignore"):
+        target_seconds = (-np.log(np.clip(target_ratio, 0.0, 1.0)) / k) ** (
+            1 / exponent
+        )
+    remaining = np.maximum(target_seconds - start_seconds, 0.0)
+    time_p5, time_p50, time_p95 = (
+        float(p) if np.isfinite(p) else None for p in _percentiles(remaining)
+    )
+    weight_p5, weight_p50, weight_p95 = _percentiles(weight)
+    return EnsemblePublic(
+        n=n,
+        target_weight=target_weight,
+        reachable_fraction=float(np.isfinite(remaining).mean()),
+        time_seconds=time_seconds.tolist(),
+        weight_p5=weight_p5.tolist(),
+        weight_p50=weight_p50.tolist(),
+        weight_p95=weight_p95.tolist(),
+        time_to_target_p5=time_p5,
+        time_to_target_p50=time_p50,
+        time_to_target_p95=time_p95,
+    )
@@ -0,0 +1,136 @@
+from typing import Optional
+
+import numpy as np
+
+from .columns import Columns
+from .models import EstimatePublic, ReadingCreate
+
+
+def reading_ranks(rows: np.ndarray, time_seconds: np.ndarray) -> np.ndarray:
+    """Rank of every reading among those of its dryer (its row), by time."""
+    order = np.lexsort((time_seconds, rows))
+    first = np.r_[True, rows[order][1:] != rows[order][:-1]]
+    start = np.maximum.accumulate(np.where(first, np.arange(len(order)), 0))
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order)) - start
+    return rank
+
+
+class MoistureFilter:
+    """Kalman filter of the weight and drying rate of sensor-backed dryers.
+
+    Every dryer has a constant rate model (state: weight and its derivative,
+    with white noise on the rate of spectral density `rate_noise`) and weight
+    readings with noise `weight_sigma`. The states and covariances of all
+    dryers are columns, so a batch of readings is filtered with a handful of
+    array operations; a dryer with several readings in the batch takes one
+    round per reading.
+
+    The fraction initial is derived from the filtered weight, taking the first
+    reading of a dryer as its initial weight `w0` and moisture `f0`:
+    `fraction_initial = f0 + (weight - w0) / w0`.
+    """
+
+    def __init__(
+        self, weight_sigma: float, rate_noise: float, rate_sigma: float = 0.01
+    ):
+        self.weight_variance = weight_sigma**2
+        self.rate_noise = rate_noise
+        self.rate_variance = rate_sigma**2
+        self.states = Columns(
+            {
+                "time_seconds": np.float64,
+                "weight": np.float64,
+                # derivative of the weight, per second
+                "rate": np.float64,
+                # covariance of (weight, rate)
+                "p00": np.float64,
+                "p01": np.float64,
+                "p11": np.float64,
+                "w0": np.float64,
+                "f0": np.float64,
+            }
+        )
+
+    def __contains__(self, dryer_id: str) -> bool:
+        return dryer_id in self.states
+
+    def _rows(self, readings: list[ReadingCreate]) -> np.ndarray:
+        states = self.states
+        for reading in readings:
+            if reading.dryer_id not in states:
+                # diffuse prior on the weight, the first update sets it
+                states.set(
+                    reading.dryer_id,
+                    time_seconds=reading.time_seconds,
+                    weight=reading.weight,
+                    rate=0.0,
+                    p00=1e12,
+                    p01=0.0,
+                    p11=self.rate_variance,
+                    w0=reading.weight,
+                    f0=reading.fraction_initial,
+                )
+        return np.fromiter(
+            (states.row(reading.dryer_id) for reading in readings),
+            dtype=np.intp,
+            count=len(readings),
+        )
+
+    def update(self, readings: list[ReadingCreate]):
+        rows = self._rows(readings)
+        time_seconds = np.fromiter(
+            (reading.time_seconds for reading in readings), np.float64, len(readings)
+        )
+        weight = np.fromiter(
+            (reading.weight for reading in readings), np.float64, len(readings)
+        )
+        rank = reading_ranks(rows, time_seconds)
+        for step in range(rank.max(initial=-1) + 1):
+            batch = rank == step
+            self._update(rows[batch], time_seconds[batch], weight[batch])
+
+    def _update(self, rows: np.ndarray, time_seconds: np.ndarray, z: np.ndarray):
+        s = self.states
+        dt = time_seconds - s["time_seconds"][rows]
+        # late readings are dropped
+        rows, time_seconds, z, dt = (
+            array[dt >= 0] for array in (rows, time_seconds, z, dt)
+        )
+        weight, rate = s["weight"][rows], s["rate"][rows]
+        p00, p01, p11 = s["p00"][rows], s["p01"][rows], s["p11"][rows]
+
+        # predict
+        q = self.rate_noise
+        weight = weight + rate * dt
+        p00 = p00 + 2 * dt * p01 + dt**2 * p11 + q * dt**3 / 3
+        p01 = p01 + dt * p11 + q * dt**2 / 2
+        p11 = p11 + q * dt
+
+        # update
+        innovation = z - weight
+        k0 = p00 / (p00 + self.weight_variance)
+        k1 = p01 / (p00 + self.weight_variance)
+        s["weight"][rows] = weight + k0 * innovation
+        s["rate"][rows] = rate + k1 * innovation
+        s["p11"][rows] = p11 - k1 * p01
+        s["p00"][rows] = (1 - k0) * p00
+        s["p01"][rows] = (1 - k0) * p01
+        s["time_seconds"][rows] = time_seconds
+
+    def estimate(self, dryer_id: str) -> Optional[EstimatePublic]:
+        if dryer_id not in self.states:
+            return None
+        s, row = self.states, self.states.row(dryer_id)
+        w0 = s["w0"][row]
+        weight, rate = s["weight"][row], s["rate"][row]
+        weight_std = np.sqrt(s["p00"][row])
+        return EstimatePublic(
+            time_seconds=int(s["time_seconds"][row]),
+            weight=weight,
+            weight_std=weight_std,
+            fraction_initial=s["f0"][row] + (weight - w0) / w0,
+            fraction_initial_std=weight_std / w0,
+            drying_rate=-rate * 3600,
+            drying_rate_std=np.sqrt(s["p11"][row]) * 3600,
+        )
@@ -0,0 +1,178 @@
+from datetime import datetime
+from itertools import chain, pairwise
+from typing import Callable, Iterable, Iterator, Literal
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .models import ConfigChange
+from .trajectory import Trajectory
+
+ExportFormat = Literal["parquet", "arrow"]
+
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+TRAJECTORY_SCHEMA = pa.schema(
+    [
+        ("time_seconds", pa.int64()),
+        ("fraction_initial", pa.float64()),
+        ("weight", pa.float64()),
+    ]
+)
+
+STATES_SCHEMA = pa.schema(
+    [
+        # when the state started being served
+        ("wallclock", pa.timestamp("us")),
+        ("trajectory", pa.string()),
+        *TRAJECTORY_SCHEMA,
+    ]
+)
+
+COMMANDS_SCHEMA = pa.schema(
+    [
+        ("changed_at", pa.timestamp("us")),
+        ("start_time", pa.timestamp("us")),
+        ("time_speed", pa.float64()),
+        ("is_active", pa.bool_()),
+        ("trajectory", pa.string()),
+        ("time_seconds", pa.int64()),
+    ]
+)
+
+READINGS_SCHEMA = pa.schema([("dryer_id", pa.string()), *TRAJECTORY_SCHEMA])
+
+
+class _Sink:
+    """Write-only file that hands over what was written since the last `take`."""
+
+    def __init__(self):
+        self.closed = False
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+def stream_batches(
+    schema: pa.Schema, batches: Iterable[pa.RecordBatch], format: ExportFormat
+) -> Iterator[bytes]:
+    """Encode record batches as Parquet (a row group each) or Arrow IPC stream.
+
+    The bytes of every batch are yielded as soon as it is written, so only a
+    batch at a time is in memory whatever the length of the run.
+    """
+    sink = _Sink()
+    if format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for batch in batches:
+        writer.write_batch(batch)
+        if chunk := sink.take():
+            yield chunk
+    writer.close()
+    yield sink.take()
+
+
+def _slices(length: int, batch_size: int) -> Iterator[slice]:
+    for start in range(0, length, batch_size):
+        yield slice(start, min(start + batch_size, length))
+
+
+def trajectory_batches(
+    trajectory: Trajectory, batch_size: int
+) -> Iterator[pa.RecordBatch]:
+    for rows in _slices(len(trajectory), batch_size):
+        yield pa.record_batch(
+            [
+                trajectory.time_seconds[rows].astype(np.int64),
+                trajectory.fraction_initial[rows],
+                trajectory.weight[rows],
+            ],
+            schema=TRAJECTORY_SCHEMA,
+        )
+
+
+def row_batches(
+    rows: Iterable[tuple], schema: pa.Schema, batch_size: int
+) -> Iterator[pa.RecordBatch]:
+    """Rows of database columns, in the order of `schema`, as record batches."""
+    batch = []
+    for row in chain(rows, [None]):
+        if row is not None:
+            batch.append(row)
+        if batch and (row is None or len(batch) == batch_size):
+            columns = zip(zip(*batch), schema)
+            yield pa.record_batch(
+                [pa.array(column, field.type) for column, field in columns],
+                schema=schema,
+            )
+            batch = []
+
+
+def served_batches(
+    changes: Iterable[ConfigChange],
+    get_trajectory: Callable[[str], Trajectory],
+    until: datetime,
+    batch_size: int,
+) -> Iterator[pa.RecordBatch]:
+    """States served by the live simulation, replayed from its config changes.
+
+    There is a row every time the served sample changed: while running, the
+    sample switches to the next one when the simulated time passes half way
+    between them (as `nearest_index` does), while paused it stays the same.
+    """
+    for change, following in pairwise(chain(changes, [None])):
+        trajectory = get_trajectory(change.trajectory)
+        end = following.changed_at if following is not None else until
+        speed = change.time_speed if change.is_active else 0.0
+
+        def seconds(wallclock: datetime) -> float:
+            if speed <= 0:
+                return change.time_seconds
+            return (wallclock - change.start_time).total_seconds() * speed
+
+        first = trajectory.nearest_index(seconds(change.changed_at))
+        last = max(trajectory.nearest_index(seconds(end)), first)
+        times = trajectory.time_seconds
+        for rows in _slices(last - first + 1, batch_size):
+            index = np.arange(first + rows.start, first + rows.stop)
+            # switch time of every sample but the first, served from the change
+            switch = np.empty(len(index), dtype="datetime64[us]")
+            midpoint = (times[np.maximum(index - 1, 0)] + times[index]) / 2
+            if speed > 0:
+                offset = (midpoint / speed * 1e6).astype("timedelta64[us]")
+                switch[:] = np.datetime64(change.start_time, "us") + offset
+            if rows.start == 0:
+                switch[0] = np.datetime64(change.changed_at, "us")
+            yield pa.record_batch(
+                [
+                    switch,
+                    pa.repeat(pa.scalar(change.trajectory), len(index)),
+                    times[index].astype(np.int64),
+                    trajectory.fraction_initial[index],
+                    trajectory.weight[index],
+                ],
+                schema=STATES_SCHEMA,
+            )
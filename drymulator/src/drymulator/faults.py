@@ -0,0 +1,182 @@
+import asyncio
+from fnmatch import fnmatchcase
+import json
+import math
+import random
+import time
+from typing import Optional
+from urllib.parse import parse_qs
+
+import yaml
+
+from .models import FaultCreate, FaultPublic
+
+
+def _json_response(status: int, detail: str, fault: str) -> list[dict]:
+    body = json.dumps({"detail": detail}).encode()
+    return [
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-injected-fault", fault.encode()),
+            ],
+        },
+        {"type": "http.response.body", "body": body},
+    ]
+
+
+class FaultInjector:
+    """Faults injected in the responses of matching endpoints and dryers.
+
+    The first fault (in insertion order) matching a request applies: it adds
+    its latency, then either fails the request, reports a sensor dropout,
+    replays a stale response or lets the request through.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+        self._next_id = 1
+        self._faults: dict[int, FaultPublic] = {}
+        # (fault id, dryer id) -> monotonic time at which the dropout ends
+        self._dropouts: dict[tuple[int, Optional[str]], float] = {}
+        # (fault id, method, path, query string, accept) -> messages of the
+        # last response
+        self._responses: dict[tuple, list[dict]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._faults)
+
+    def faults(self) -> list[FaultPublic]:
+        return list(self._faults.values())
+
+    def add(self, fault: FaultCreate) -> FaultPublic:
+        fault = FaultPublic(id=self._next_id, **fault.model_dump())
+        self._next_id += 1
+        self._faults[fault.id] = fault
+        return fault
+
+    def remove(self, fault_id: int) -> Optional[FaultPublic]:
+        fault = self._faults.pop(fault_id, None)
+        if fault is not None:
+            self._dropouts = {
+                key: end for key, end in self._dropouts.items() if key[0] != fault_id
+            }
+            self._responses = {
+                key: messages
+                for key, messages in self._responses.items()
+                if key[0] != fault_id
+            }
+        return fault
+
+    def load(self, path):
+        """Add the faults listed in a YAML or JSON file."""
+        with open(path) as file:
+            for fault in yaml.safe_load(file) or []:
+                self.add(FaultCreate.model_validate(fault))
+
+    def match(self, path: str, dryer_id: Optional[str]) -> Optional[FaultPublic]:
+        for fault in self._faults.values():
+            if fnmatchcase(path, fault.path) and (
+                fault.dryer_id is None or fault.dryer_id == dryer_id
+            ):
+                return fault
+        return None
+
+    def latency(self, fault: FaultPublic) -> float:
+        """Seconds to wait before answering."""
+        if not fault.latency_ms:
+            return 0.0
+        factor = math.exp(self.random.gauss(0.0, fault.latency_sigma))
+        return fault.latency_ms * factor / 1000
+
+    def in_dropout(self, fault: FaultPublic, dryer_id: Optional[str]) -> bool:
+        now = time.monotonic()
+        end = self._dropouts.get((fault.id, dryer_id))
+        if end is not None and now < end:
+            return True
+        if fault.dropout_rate and self.random.random() < fault.dropout_rate:
+            self._dropouts[fault.id, dryer_id] = now + fault.dropout_seconds
+            return True
+        return False
+
+    def stale_response(self, fault: FaultPublic, key) -> Optional[list[dict]]:
+        """Previous response to replay instead of the current one, if any."""
+        previous = self._responses.get((fault.id, *key))
+        if previous is not None and self.random.random() < fault.stale_rate:
+            return previous
+        return None
+
+    def record_response(self, fault: FaultPublic, key, messages: list[dict]):
+        self._responses[fault.id, *key] = messages
+
+
+class FaultInjectionMiddleware:
+    """ASGI middleware applying the faults of a `FaultInjector`.
+
+    Injected responses have an `X-Injected-Fault` header (`error`, `dropout`
+    or `stale`). Without faults a request only costs a truthiness check.
+    """
+
+    def __init__(self, app, injector: FaultInjector, skip_paths=()):
+        self.app = app
+        self.injector = injector
+        self.skip_paths = tuple(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not self.injector
+            or scope["path"].startswith(self.skip_paths)
+        ):
+            return await self.app(scope, receive, send)
+
+        query = parse_qs(scope["query_string"].decode())
+        dryer_id = query.get("dryer_id", [None])[0]
+        fault = self.injector.match(scope["path"], dryer_id)
+        if fault is None:
+            return await self.app(scope, receive, send)
+
+        delay = self.injector.latency(fault)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if fault.error_rate and self.injector.random.random() < fault.error_rate:
+            messages = _json_response(fault.error_status, "Injected error", "error")
+        elif self.injector.in_dropout(fault, dryer_id):
+            messages = _json_response(503, "Sensor dropout", "dropout")
+        else:
+            messages = None
+        if messages is not None:
+            for message in messages:
+                await send(message)
+            return
+
+        # only reads can be replayed, a command has to reach the endpoint
+        if not fault.stale_rate or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+
+        # the accepted media types pick the content type of the response
+        accept = next(
+            (value for name, value in scope["headers"] if name == b"accept"), b""
+        )
+        key = (scope["method"], scope["path"], scope["query_string"], accept)
+        previous = self.injector.stale_response(fault, key)
+        if previous is not None:
+            start, *body = previous
+            headers = [*start["headers"], (b"x-injected-fault", b"stale")]
+            for message in [{**start, "headers": headers}, *body]:
+                await send(message)
+            return
+
+        captured = []
+
+        async def send_and_capture(message):
+            captured.append(message)
+            await send(message)
+
+        await self.app(scope, receive, send_and_capture)
+        if captured and captured[0].get("status") == 200:
+            self.injector.record_response(fault, key, captured)
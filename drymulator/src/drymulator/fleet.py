@@ -0,0 +1,226 @@
+import operator
+import re
+from typing import Optional
+
+import numpy as np
+
+from .anomaly import AnomalyDetector, anomaly_names
+from .live import LiveDryers
+from .models import FleetDryerPublic, FleetGroupPublic
+from .simulation import SimulationRegistry
+from .trajectory import Trajectory
+
+METRICS = ("time_seconds", "fraction_initial", "weight", "remaining_seconds")
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+    "!=": operator.ne,
+}
+
+CONDITION = re.compile(r"\s*([\w.-]+)\s*(<=|>=|!=|<|>|=)\s*(.*?)\s*")
+
+
+def _finish_seconds(trajectory: Trajectory, target_fraction: Optional[float]):
+    """Simulated time at which a trajectory reaches the target, inf if never."""
+    if target_fraction is None:
+        return float(trajectory.time_seconds[-1])
+    reached = np.flatnonzero(trajectory.fraction_initial <= target_fraction)
+    return float(trajectory.time_seconds[reached[0]]) if len(reached) else np.inf
+
+
+class Fleet:
+    """Filters, top-k and aggregates over all the forks and sensor-backed dryers.
+
+    Every query computes the state of the whole fleet in one vectorized pass
+    over the fork clocks (grouped by trajectory) and the latest readings of
+    the sensor-backed dryers. Dryers can be tagged (e.g. `line=2`) to filter
+    and group them. The live simulation is not part of the fleet.
+    """
+
+    def __init__(
+        self,
+        registry: SimulationRegistry,
+        live: LiveDryers,
+        anomalies: Optional[AnomalyDetector] = None,
+    ):
+        self.registry = registry
+        self.live = live
+        self.anomalies = anomalies
+        self.tags: dict[str, dict[str, str]] = {}
+
+    def __contains__(self, dryer_id: str) -> bool:
+        return dryer_id in self.registry or dryer_id in self.live
+
+    def state(
+        self, now: float, target_fraction: Optional[float] = None
+    ) -> tuple[list[str], dict[str, np.ndarray]]:
+        """Dryer ids and `METRICS` columns of the whole fleet at `now`.
+
+        `remaining_seconds` is the real time until the fraction initial
+        reaches `target_fraction` (the end of the trajectory by default), NaN
+        for sensor-backed dryers and for paused forks that have not reached it.
+        An `anomalies` column has the anomaly flags of the sensor-backed
+        dryers, 0 for the forks, and a `sample` column the index of the sample
+        of every fork in its trajectory, -1 for the sensor-backed dryers.
+        """
+        clocks = self.registry.clocks
+        n = len(clocks)
+        active = clocks["is_active"]
+        speed = clocks["time_speed"]
+        seconds = clocks["anchor_seconds"].copy()
+        seconds[active] += (now - clocks["anchor_time"][active]) * speed[active]
+
+        columns = {metric: np.full(n, np.nan) for metric in METRICS}
+        samples = np.full(n, -1, dtype=np.intp)
+        trajectories = clocks["trajectory"]
+        codes = np.fromiter(map(id, trajectories), dtype=np.int64, count=n)
+        _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(first) + 1))
+        for group, start in enumerate(first):
+            rows = order[bounds[group] : bounds[group + 1]]
+            trajectory = trajectories[start]
+            index = trajectory.nearest_indices(seconds[rows])
+            samples[rows] = index
+            columns["time_seconds"][rows] = trajectory.time_seconds[index]
+            columns["fraction_initial"][rows] = trajectory.fraction_initial[index]
+            columns["weight"][rows] = trajectory.weight[index]
+
+            left = _finish_seconds(trajectory, target_fraction) - seconds[rows]
+            moving = active[rows] & (speed[rows] > 0)
+            remaining = np.full(len(rows), np.nan)
+            remaining[moving] = left[moving] / speed[rows][moving]
+            remaining[left <= 0] = 0.0
+            remaining[np.isinf(remaining)] = np.nan
+            columns["remaining_seconds"][rows] = remaining
+
+        latest = self.live.latest
+        readings = {
+            "time_seconds": latest["time_seconds"],
+            "fraction_initial": latest["fraction_initial"],
+            "weight": latest["weight"],
+            "remaining_seconds": np.full(len(latest), np.nan),
+        }
+        columns = {
+            metric: np.concatenate([columns[metric], readings[metric]])
+            for metric in METRICS
+        }
+        columns["anomalies"] = np.zeros(len(clocks) + len(latest), dtype=np.int64)
+        if self.anomalies is not None:
+            columns["anomalies"][n:] = self.anomalies.flags(latest.keys)
+        columns["sample"] = np.concatenate(
+            [samples, np.full(len(latest), -1, dtype=np.intp)]
+        )
+        return clocks.keys + latest.keys, columns
+
+    def _tag(self, ids: list[str], name: str) -> np.ndarray:
+        return np.array(
+            [self.tags.get(dryer_id, {}).get(name) for dryer_id in ids], dtype=object
+        )
+
+    def mask(
+        self, ids: list[str], columns: dict[str, np.ndarray], where: list[str]
+    ) -> np.ndarray:
+        """Dryers matching all the conditions, e.g. `remaining_seconds<3600`.
+
+        A condition compares a metric with a number or a tag with a string
+        (`line=2`, `line!=2`).
+        """
+        keep = np.ones(len(ids), dtype=bool)
+        for condition in where:
+            match = CONDITION.fullmatch(condition)
+            if match is None:
+                raise ValueError(f"Invalid condition {condition!r}")
+            name, op, value = match.groups()
+            if name in METRICS:
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise ValueError(f"Invalid number in {condition!r}") from None
+                keep &= OPERATORS[op](columns[name], value)
+            elif op in ("=", "!="):
+                keep &= OPERATORS[op](self._tag(ids, name), value)
+            else:
+                raise ValueError(f"Tags are compared with = or != only {condition!r}")
+        return keep
+
+    def dryers(
+        self,
+        now: float,
+        where: list[str] = (),
+        sort_by: str = "remaining_seconds",
+        descending: bool = False,
+        k: int = 100,
+        target_fraction: Optional[float] = None,
+    ) -> list[FleetDryerPublic]:
+        """Top `k` matching dryers by `sort_by`, unknown values last."""
+        ids, columns = self.state(now, target_fraction)
+        rows = np.flatnonzero(self.mask(ids, columns, where))
+        key = columns[sort_by][rows]
+        if descending:
+            key = -key
+        if k < len(rows):
+            top = np.argpartition(key, k - 1)[:k]
+            rows, key = rows[top], key[top]
+        rows = rows[np.argsort(key, kind="stable")]
+        return [
+            FleetDryerPublic(
+                dryer_id=ids[row],
+                tags=self.tags.get(ids[row], {}),
+                time_seconds=int(columns["time_seconds"][row]),
+                fraction_initial=columns["fraction_initial"][row],
+                weight=columns["weight"][row],
+                remaining_seconds=(
+                    None
+                    if np.isnan(columns["remaining_seconds"][row])
+                    else columns["remaining_seconds"][row]
+                ),
+                anomalies=anomaly_names(columns["anomalies"][row]),
+            )
+            for row in rows
+        ]
+
+    def aggregate(
+        self,
+        now: float,
+        metric: str,
+        group_by: Optional[str] = None,
+        where: list[str] = (),
+        target_fraction: Optional[float] = None,
+    ) -> list[FleetGroupPublic]:
+        """Count, mean, min and max of a metric, per value of the `group_by` tag."""
+        ids, columns = self.state(now, target_fraction)
+        values = columns[metric]
+        rows = np.flatnonzero(self.mask(ids, columns, where) & ~np.isnan(values))
+        values = values[rows]
+        labels = (
+            self._tag([ids[row] for row in rows], group_by)
+            if group_by is not None
+            else [None] * len(rows)
+        )
+        groups: dict[Optional[str], int] = {}
+        inverse = np.fromiter(
+            (groups.setdefault(label, len(groups)) for label in labels),
+            dtype=np.intp,
+            count=len(rows),
+        )
+        count = np.bincount(inverse, minlength=len(groups))
+        total = np.bincount(inverse, weights=values, minlength=len(groups))
+        minimum = np.full(len(groups), np.inf)
+        np.minimum.at(minimum, inverse, values)
+        maximum = np.full(len(groups), -np.inf)
+        np.maximum.at(maximum, inverse, values)
+        return [
+            FleetGroupPublic(
+                group=label,
+                count=int(count[code]),
+                mean=total[code] / count[code],
+                min=minimum[code],
+                max=maximum[code],
+            )
+            for label, code in groups.items()
+        ]
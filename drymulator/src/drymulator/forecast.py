@@ -0,0 +1,182 @@
+from typing import Optional
+
+import numpy as np
+
+from .kinetics import PageModel
+from .models import ForecastPublic, ReadingCreate
+from .trajectory import Trajectory
+
+
+class PageFit:
+    """Page model fitted incrementally on a stream of samples.
+
+    `PageModel.fit` refits every equilibrium candidate from scratch. Here the
+    candidates are fixed (`candidates` values in `[0, f0)`) and each keeps
+    the sums of its linearised least squares, so new samples only add to the
+    sums. The best candidate is the one with the lowest error on a thinned
+    copy of the samples (at most `keep` of them, evenly spaced), and the
+    model is cached until new samples arrive.
+    """
+
+    def __init__(self, f0: float, w0: float, candidates: int = 400, keep: int = 256):
+        self.f0 = f0
+        self.w0 = w0
+        self.f_eq = np.linspace(0.0, f0, candidates, endpoint=False)
+        # moisture ratio = (f - f_eq) * scale
+        self._scale = 1 / (f0 - self.f_eq)
+        # n, sum x, sum y, sum x^2, sum xy with x = ln t, y = ln(-ln MR)
+        self.sums = np.zeros((5, candidates))
+        self.samples = 0
+        self.min_fraction = f0
+        self.keep = keep
+        self._stride = 1
+        self._kept: list[tuple[float, float]] = []
+        self._model: Optional[PageModel] = None
+        self._fitted = False
+
+    def add(self, time_seconds: np.ndarray, fraction_initial: np.ndarray):
+        t = np.asarray(time_seconds, dtype=np.float64)
+        f = np.asarray(fraction_initial, dtype=np.float64)
+        if not len(t):
+            return
+        # one candidate per row, computed in place: allocating the temporaries
+        # costs more than the arithmetic
+        y = np.subtract(f, self.f_eq[:, None])
+        y *= self._scale[:, None]
+        mask = (y > 0.01) & (y < 0.99) & (t > 0)
+        y[~mask] = 0.5
+        np.log(y, out=y)
+        np.negative(y, out=y)
+        np.log(y, out=y)
+        y[~mask] = 0.0
+        # x does not depend on the candidate: its sums are products with the mask
+        x = np.log(np.where(t > 0, t, 1.0))
+        weights = mask.astype(np.float64)
+        self.sums += np.stack(
+            [weights.sum(1), weights @ x, y.sum(1), weights @ (x * x), y @ x]
+        )
+
+        for sample in zip(t.tolist(), f.tolist()):
+            if self.samples % self._stride == 0:
+                self._kept.append(sample)
+                if len(self._kept) > self.keep:
+                    self._kept = self._kept[::2]
+                    self._stride *= 2
+            self.samples += 1
+        self.min_fraction = min(self.min_fraction, float(f.min()))
+        self._fitted = False
+
+    def model(self) -> Optional[PageModel]:
+        """Best fit so far, None without enough samples."""
+        if self._fitted:
+            return self._model
+        count, sx, sy, sxx, sxy = self.sums
+        with np.errstate(divide="ignore", invalid="ignore"):
+            n = (count * sxy - sx * sy) / (count * sxx - sx**2)
+            ln_k = (sy - n * sx) / count
+        # the equilibrium is below every observed fraction
+        valid = (count >= 2) & (self.f_eq < self.min_fraction) & np.isfinite(n)
+        self._model, self._fitted = None, True
+        if not valid.any():
+            return None
+        t, f = np.array(self._kept).T
+        f_eq = self.f_eq[valid, None]
+        predicted = f_eq + (self.f0 - f_eq) * np.exp(
+            -np.exp(ln_k[valid, None]) * t ** n[valid, None]
+        )
+        best = np.argmin(((predicted - f) ** 2).mean(1))
+        self._model = PageModel(
+            float(np.exp(ln_k[valid][best])),
+            float(n[valid][best]),
+            self.f0,
+            float(self.f_eq[valid][best]),
+            self.w0,
+        )
+        return self._model
+
+
+class Forecasts:
+    """Cached kinetics fits of the dryers, fed with the samples seen so far.
+
+    A sensor-backed dryer is fed with its readings lazily: they are set aside
+    as they are ingested, and added to its fit when it is forecast or once
+    `batch` of them are pending, so that ingesting costs no fitting. A
+    simulation is fed, when forecast, with the samples of its trajectory it
+    went through since the last forecast; its fit starts over if it moved
+    backwards or switched trajectory.
+    """
+
+    def __init__(self, batch: int = 256):
+        self.fits: dict[Optional[str], PageFit] = {}
+        self.batch = batch
+        # times and fractions initial not added to the fit yet, per dryer
+        self._pending: dict[str, tuple[list[float], list[float]]] = {}
+        # trajectory and next sample to feed, for simulations
+        self._followed: dict[Optional[str], tuple[Trajectory, int]] = {}
+
+    def remove(self, dryer_id: Optional[str]):
+        self.fits.pop(dryer_id, None)
+        self._pending.pop(dryer_id, None)
+        self._followed.pop(dryer_id, None)
+
+    def observe(self, readings: list[ReadingCreate]):
+        for reading in readings:
+            pending = self._pending.get(reading.dryer_id)
+            if pending is None:
+                if reading.dryer_id not in self.fits:
+                    self.fits[reading.dryer_id] = PageFit(
+                        reading.fraction_initial, reading.weight
+                    )
+                pending = self._pending[reading.dryer_id] = ([], [])
+            pending[0].append(reading.time_seconds)
+            pending[1].append(reading.fraction_initial)
+            if len(pending[0]) >= self.batch:
+                self._add_pending(reading.dryer_id)
+
+    def _add_pending(self, dryer_id: str):
+        pending = self._pending.pop(dryer_id, None)
+        if pending is not None:
+            self.fits[dryer_id].add(*pending)
+
+    def fit(self, dryer_id: str) -> Optional[PageFit]:
+        """Fit of a sensor-backed dryer with all its readings, None if none."""
+        self._add_pending(dryer_id)
+        return self.fits.get(dryer_id)
+
+    def follow(
+        self, dryer_id: Optional[str], trajectory: Trajectory, index: int
+    ) -> PageFit:
+        """Fit of a simulation that is at sample `index` of `trajectory`."""
+        followed, start = self._followed.get(dryer_id, (None, 0))
+        fit = self.fits.get(dryer_id)
+        if fit is None or followed is not trajectory or index < start - 1:
+            fit = self.fits[dryer_id] = PageFit(
+                float(trajectory.fraction_initial[0]), float(trajectory.weight[0])
+            )
+            start = 0
+        end = index + 1
+        fit.add(
+            trajectory.time_seconds[start:end], trajectory.fraction_initial[start:end]
+        )
+        self._followed[dryer_id] = trajectory, max(start, end)
+        return fit
+
+
+def forecast(
+    model: PageModel, start_seconds: float, horizon_seconds: float, steps: int
+) -> ForecastPublic:
+    end = start_seconds + horizon_seconds
+    time_seconds = np.linspace(start_seconds, end, steps)
+    return ForecastPublic(
+        k=model.k,
+        n=model.n,
+        f_eq=model.f_eq,
+        time_seconds=time_seconds.tolist(),
+        fraction_initial=model.fraction(time_seconds).tolist(),
+        weight=model.weight(time_seconds).tolist(),
+    )
+
+
+def end_seconds(model: PageModel, moisture_ratio: float = 0.01) -> float:
+    """Time at which the model reaches `moisture_ratio`, the end of the run."""
+    return (-np.log(moisture_ratio) / model.k) ** (1 / model.n)
@@ -0,0 +1,161 @@
+import asyncio
+import json
+from typing import Optional
+
+import numpy as np
+
+from .anomaly import anomaly_names
+from .fleet import METRICS, Fleet
+
+
+class Subscriber:
+    """Frames waiting to be sent to one client, at most `max_frames`."""
+
+    def __init__(self, where: tuple[str, ...], max_frames: int):
+        self.where = where
+        self.frames: asyncio.Queue[bytes] = asyncio.Queue(maxsize=max_frames)
+        # next frame is a snapshot of all the matching dryers
+        self.resync = True
+        self.dropped = 0
+
+    def drop_stale(self):
+        while not self.frames.empty():
+            self.frames.get_nowait()
+            self.dropped += 1
+        self.resync = True
+
+
+class StateHub:
+    """Fan-out of the fleet states to many subscribers, one tick at a time.
+
+    A tick computes the state of the whole fleet once, finds the dryers that
+    changed since the previous tick and encodes each of them once. Subscribers
+    with the same filter (`where` conditions as in `Fleet.mask`, e.g.
+    `line=2`) share the same frames: a snapshot of the matching dryers when
+    they join, then deltas with only the dryers that changed, started or
+    stopped matching. The state of a dryer is its `StatePublic` JSON, encoded
+    as `/state/current` serves it: derived quantities included and null when
+    undefined or not finite. A dryer with anomalies in its latest readings has
+    them in its state (`"anomalies":["spike"]`), and is sent again when they
+    clear. A subscriber whose frames are not consumed fast enough has its
+    stale frames dropped and gets a fresh snapshot instead, so a slow client
+    never holds the tick back.
+    """
+
+    def __init__(self, fleet: Fleet, max_frames: int = 8):
+        self.fleet = fleet
+        self.max_frames = max_frames
+        self.subscribers: set[Subscriber] = set()
+        # dryers published by the previous tick, and their encoded state
+        self._rows: dict[str, int] = {}
+        self._columns = {name: np.empty(0) for name in (*METRICS[:3], "anomalies")}
+        self._encoded: dict[str, bytes] = {}
+        # dryers matching each filter at the previous tick
+        self._matched: dict[tuple[str, ...], set[str]] = {}
+
+    def subscribe(self, where: list[str] = ()) -> Subscriber:
+        """Raises ValueError for an invalid filter, as `Fleet.mask` does."""
+        empty = {metric: np.empty(0) for metric in METRICS}
+        self.fleet.mask([], empty, where)
+        subscriber = Subscriber(tuple(where), self.max_frames)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    @staticmethod
+    def _frame(
+        time: float, snapshot: bool, states: list[bytes], removed: list[str]
+    ) -> bytes:
+        return b"".join(
+            [
+                b'data: {"time":%r,"snapshot":%s,"states":{'
+                % (time, b"true" if snapshot else b"false"),
+                b",".join(states),
+                b'},"removed":%s}\n\n' % json.dumps(removed).encode(),
+            ]
+        )
+
+    def _changed(self, ids: list[str], columns: dict[str, np.ndarray]) -> list[str]:
+        """Dryers new or changed since the previous tick, encoded again."""
+        rows = np.fromiter(
+            (self._rows.get(dryer_id, -1) for dryer_id in ids),
+            dtype=np.intp,
+            count=len(ids),
+        )
+        known = rows >= 0
+        changed = ~known
+        for metric, previous in self._columns.items():
+            changed[known] |= previous[rows[known]] != columns[metric][known]
+        changed_rows = np.flatnonzero(changed)
+        changed_ids = [ids[row] for row in changed_rows]
+        # forks have their sample pre-encoded, the readings are encoded at once
+        forks = changed_rows[columns["sample"][changed_rows] >= 0]
+        readings = changed_rows[columns["sample"][changed_rows] < 0]
+        states = {
+            ids[row]: self.fleet.registry.get(ids[row]).trajectory.json(sample)
+            for row, sample in zip(forks, columns["sample"][forks])
+        }
+        encoded = self.fleet.live.encoded([ids[row] for row in readings])
+        for row, state in zip(readings, encoded):
+            if flags := columns["anomalies"][row]:
+                names = json.dumps(anomaly_names(flags)).encode()
+                state = b'%s,"anomalies":%s}' % (state[:-1], names)
+            states[ids[row]] = state
+        for dryer_id, state in states.items():
+            key = json.dumps(dryer_id).encode()
+            self._encoded[dryer_id] = b"%s:%s" % (key, state)
+        for dryer_id in self._rows.keys() - set(ids):
+            del self._encoded[dryer_id]
+        self._rows = {dryer_id: row for row, dryer_id in enumerate(ids)}
+        self._columns = {metric: columns[metric] for metric in self._columns}
+        return changed_ids
+
+    def tick(self, now: float) -> int:
+        """Publish the changes since the previous tick, returns frames queued."""
+        if not self.subscribers:
+            return 0
+        ids, columns = self.fleet.state(now)
+        changed = self._changed(ids, columns)
+
+        groups: dict[tuple[str, ...], list[Subscriber]] = {}
+        for subscriber in self.subscribers:
+            groups.setdefault(subscriber.where, []).append(subscriber)
+        queued = 0
+        for where, subscribers in groups.items():
+            mask = self.fleet.mask(ids, columns, where)
+            matched = [ids[row] for row in np.flatnonzero(mask)]
+            previous = self._matched.get(where, set())
+            matched_set = set(matched)
+            updated = [
+                dryer_id
+                for dryer_id in changed
+                if dryer_id in matched_set and dryer_id in previous
+            ]
+            updated += [dryer_id for dryer_id in matched if dryer_id not in previous]
+            removed = sorted(previous - matched_set)
+            delta: Optional[bytes] = None
+            if updated or removed:
+                states = [self._encoded[dryer_id] for dryer_id in updated]
+                delta = self._frame(now, False, states, removed)
+            snapshot: Optional[bytes] = None
+            for subscriber in subscribers:
+                if subscriber.frames.full():
+                    subscriber.drop_stale()
+                if subscriber.resync:
+                    if snapshot is None:
+                        states = [self._encoded[dryer_id] for dryer_id in matched]
+                        snapshot = self._frame(now, True, states, [])
+                    frame, subscriber.resync = snapshot, False
+                elif delta is not None:
+                    frame = delta
+                else:
+                    continue
+                subscriber.frames.put_nowait(frame)
+                queued += 1
+            self._matched[where] = matched_set
+        # filters nobody subscribes to anymore
+        for where in self._matched.keys() - groups.keys():
+            del self._matched[where]
+        return queued
@@ -0,0 +1,271 @@
+"""Streaming ingestion of dryer logs into the trajectory library.
+
+Logger CSVs can be far bigger than memory, have irregular timestamps and many
+unrelated columns. They are read in blocks parsed by pyarrow, keeping only
+the mapped columns; every block is cleaned (missing values, duplicate and out of
+order timestamps dropped) and resampled to a uniform grid before the next
+one is read, so memory is bounded by the block size and the (much smaller)
+resampled trajectory.
+
+    python -m drymulator.ingest log.csv trajectories/apples/run-1.npz \\
+        --time Timestamp --weight "Mass [g]" --initial-moisture 0.9
+"""
+
+import argparse
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+import sys
+import time
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv
+
+from .library import save_trajectory
+
+
+@dataclass
+class IngestStats:
+    rows: int = 0
+    bytes: int = 0
+    # rows with missing values, duplicate or out of order timestamps
+    dropped: int = 0
+    # samples of the resampled trajectory
+    samples: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        rate = self.bytes / 2**20 / self.seconds if self.seconds else 0.0
+        return (
+            f"{self.rows} rows ({self.bytes / 2**20:.1f} MiB, {rate:.1f} MiB/s),"
+            f" {self.dropped} dropped, {self.samples} samples"
+        )
+
+
+def _seconds(column: pa.ChunkedArray) -> np.ndarray:
+    if pa.types.is_timestamp(column.type):
+        column = pc.cast(pc.cast(column, pa.timestamp("us")), pa.int64())
+        return column.to_numpy(zero_copy_only=False) / 1e6
+    return pc.cast(column, pa.float64()).to_numpy(zero_copy_only=False)
+
+
+def _values(column: Optional[pa.ChunkedArray]) -> Optional[np.ndarray]:
+    if column is None:
+        return None
+    return pc.cast(column, pa.float64()).to_numpy(zero_copy_only=False)
+
+
+class Resampler:
+    """Linear resampling of a stream of samples on a uniform time grid.
+
+    The grid starts at the first sample; the last sample of every block is
+    carried over so that grid points between two blocks are interpolated as
+    well. Samples must have increasing times.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.origin: Optional[float] = None
+        self.next_time = 0.0
+        self._last: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def push(self, time_seconds, fraction_initial, weight):
+        if self._last is not None:
+            last_time, last_fraction, last_weight = self._last
+            time_seconds = np.concatenate([last_time, time_seconds])
+            fraction_initial = np.concatenate([last_fraction, fraction_initial])
+            weight = np.concatenate([last_weight, weight])
+        if not len(time_seconds):
+            return np.empty(0), np.empty(0), np.empty(0)
+        if self.origin is None:
+            self.origin = self.next_time = time_seconds[0]
+        grid = np.arange(self.next_time, time_seconds[-1] + 1e-9, self.interval)
+        if len(grid):
+            self.next_time = grid[-1] + self.interval
+        self._last = time_seconds[-1:], fraction_initial[-1:], weight[-1:]
+        return (
+            grid - self.origin,
+            np.interp(grid, time_seconds, fraction_initial),
+            np.interp(grid, time_seconds, weight),
+        )
+
+
+def _lines(file, block_size: int) -> Iterator[bytes]:
+    """Blocks of about `block_size` bytes, cut after a newline."""
+    rest = b""
+    while block := file.read(block_size):
+        block = rest + block
+        end = block.rfind(b"\n") + 1
+        rest = block[end:]
+        if end:
+            yield block[:end]
+    if rest.strip():
+        yield rest
+
+
+def read_blocks(
+    path,
+    time_column: str,
+    weight_column: str,
+    fraction_column: Optional[str] = None,
+    time_format: Optional[str] = None,
+    delimiter: str = ",",
+    block_size: int = 16 * 2**20,
+) -> Iterator[tuple[np.ndarray, Optional[np.ndarray], np.ndarray, int]]:
+    """Time, fraction initial (None if not mapped) and weight of every block.
+
+    Also yields how many bytes of the file have been read so far. The file
+    is split in blocks here rather than by `pyarrow.csv.open_csv`, which
+    reads ahead without bound; quoted values must not contain newlines.
+    """
+    columns = {"time": time_column, "weight": weight_column}
+    if fraction_column is not None:
+        columns["fraction_initial"] = fraction_column
+    convert_options = pyarrow.csv.ConvertOptions(
+        include_columns=list(columns.values()),
+        column_types={
+            name: pa.float64() for key, name in columns.items() if key != "time"
+        },
+        timestamp_parsers=[time_format] if time_format else None,
+    )
+    parse_options = pyarrow.csv.ParseOptions(delimiter=delimiter)
+    with open(path, "rb") as file:
+        header = file.readline().decode("utf-8-sig")
+        names = next(csv.reader([header], delimiter=delimiter))
+        read_options = pyarrow.csv.ReadOptions(column_names=names)
+        for block in _lines(file, block_size):
+            table = pyarrow.csv.read_csv(
+                pa.BufferReader(block),
+                read_options=read_options,
+                parse_options=parse_options,
+                convert_options=convert_options,
+            )
+            yield (
+                _seconds(table[time_column]),
+                _values(table[fraction_column] if fraction_column else None),
+                _values(table[weight_column]),
+                file.tell(),
+            )
+
+
+def ingest_csv(
+    source,
+    destination,
+    time_column: str = "time_seconds",
+    weight_column: str = "weight",
+    fraction_column: Optional[str] = None,
+    initial_moisture: Optional[float] = None,
+    interval: float = 30.0,
+    time_format: Optional[str] = None,
+    delimiter: str = ",",
+    block_size: int = 16 * 2**20,
+    progress: Optional[Callable[[IngestStats], None]] = None,
+) -> IngestStats:
+    """Clean and resample a CSV log, written as a library trajectory.
+
+    Without a fraction initial column it is derived from the weight, given
+    the `initial_moisture` of the product (wet basis, e.g. 0.9): water is all
+    that is lost, so `fraction_initial = weight / w0 - 1 + initial_moisture`.
+    The time column holds seconds or timestamps (parsed with `time_format` if
+    given); the trajectory time starts at zero on the first sample.
+    """
+    if fraction_column is None and initial_moisture is None:
+        raise ValueError("either fraction_column or initial_moisture is needed")
+    stats = IngestStats()
+    start = time.perf_counter()
+    resampler = Resampler(interval)
+    last_time = -np.inf
+    parts = []
+    for time_seconds, fractions, weights, position in read_blocks(
+        source,
+        time_column,
+        weight_column,
+        fraction_column,
+        time_format,
+        delimiter,
+        block_size,
+    ):
+        stats.rows += len(time_seconds)
+        stats.bytes = position
+        if fractions is None:
+            fractions = np.zeros_like(weights)
+        valid = (
+            np.isfinite(time_seconds) & np.isfinite(weights) & np.isfinite(fractions)
+        )
+        # keep the first of duplicated timestamps, drop those going backwards
+        latest = np.maximum.accumulate(
+            np.concatenate([[last_time], np.where(valid, time_seconds, -np.inf)])
+        )
+        keep = valid & (time_seconds > latest[:-1])
+        last_time = latest[-1]
+        stats.dropped += int(len(keep) - keep.sum())
+
+        grid, fractions, weights = resampler.push(
+            time_seconds[keep], fractions[keep], weights[keep]
+        )
+        parts.append(
+            (
+                np.rint(grid).astype(np.int64),
+                fractions.astype(np.float32),
+                weights.astype(np.float32),
+            )
+        )
+        stats.samples += len(grid)
+        stats.seconds = time.perf_counter() - start
+        if progress is not None:
+            progress(stats)
+
+    time_seconds, fractions, weights = (
+        np.concatenate([part[i] for part in parts]) if parts else np.empty(0)
+        for i in range(3)
+    )
+    if fraction_column is None and len(weights):
+        fractions = weights / weights[0] - 1 + np.float32(initial_moisture)
+    Path(destination).parent.mkdir(parents=True, exist_ok=True)
+    save_trajectory(destination, time_seconds, fractions, weights)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="CSV log")
+    parser.add_argument("destination", help="trajectory file (.npz)")
+    parser.add_argument("--time", default="time_seconds", help="time column")
+    parser.add_argument("--weight", default="weight", help="weight column")
+    parser.add_argument("--fraction-initial", help="fraction initial column")
+    parser.add_argument(
+        "--initial-moisture",
+        type=float,
+        help="wet basis moisture of the product, without a fraction column",
+    )
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds")
+    parser.add_argument("--time-format", help="strptime format of timestamps")
+    parser.add_argument("--delimiter", default=",")
+    parser.add_argument("--block-mb", type=float, default=16.0)
+    args = parser.parse_args(argv)
+
+    def progress(stats):
+        print(f"\r{stats}", end="", file=sys.stderr, flush=True)
+
+    stats = ingest_csv(
+        args.source,
+        args.destination,
+        time_column=args.time,
+        weight_column=args.weight,
+        fraction_column=args.fraction_initial,
+        initial_moisture=args.initial_moisture,
+        interval=args.interval,
+        time_format=args.time_format,
+        delimiter=args.delimiter,
+        block_size=int(args.block_mb * 2**20),
+        progress=progress,
+    )
+    print(f"\r{stats} in {stats.seconds:.1f}s -> {args.destination}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
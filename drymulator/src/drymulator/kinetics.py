@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class PageModel:
+    """Page thin-layer drying model, `MR(t) = exp(-k * t**n)`.
+
+    `fraction_initial` is the water still in the product as a fraction of the
+    initial weight, so it decays from `f0` towards the equilibrium `f_eq` and
+    the weight is `w0 * (1 - f0 + fraction_initial)`.
+    """
+
+    k: float
+    n: float
+    f0: float
+    f_eq: float
+    w0: float
+
+    @classmethod
+    def fit(cls, time_seconds, fraction_initial, weight, candidates: int = 40):
+        """Least squares fit on the linearised model `ln(-ln MR) = ln k + n ln t`.
+
+        The equilibrium fraction is not observable directly, it is picked
+        among `candidates` values below the lowest observed fraction.
+        """
+        t = np.asarray(time_seconds, dtype=np.float64)
+        f = np.asarray(fraction_initial, dtype=np.float64)
+        f0, w0 = float(f[0]), float(weight[0])
+        best, best_error = None, np.inf
+        for f_eq in np.linspace(0.0, f.min(), candidates + 1)[:-1]:
+            moisture_ratio = (f - f_eq) / (f0 - f_eq)
+            mask = (t > 0) & (moisture_ratio > 0.01) & (moisture_ratio < 0.99)
+            if mask.sum() < 2:
+                continue
+            n, ln_k = np.polyfit(
+                np.log(t[mask]), np.log(-np.log(moisture_ratio[mask])), 1
+            )
+            model = cls(float(np.exp(ln_k)), float(n), f0, float(f_eq), w0)
+            error = np.mean((model.fraction(t) - f) ** 2)
+            if error < best_error:
+                best, best_error = model, error
+        if best is None:
+            raise ValueError("not enough samples to fit the drying kinetics")
+        return best
+
+    def fraction(self, time_seconds):
+        t = np.asarray(time_seconds, dtype=np.float64)
+        return self.f_eq + (self.f0 - self.f_eq) * np.exp(-self.k * t**self.n)
+
+    def weight(self, time_seconds):
+        return self.w0 * (1 - self.f0 + self.fraction(time_seconds))
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+import threading
+from typing import Optional
+import weakref
+
+import numpy as np
+
+from .models import TrajectoryPublic
+from .trajectory import Trajectory
+
+DEFAULT_TRAJECTORY = "default"
+SUFFIXES = (".npz", ".csv")
+
+
+def save_trajectory(path, time_seconds, fraction_initial, weight):
+    """Write a trajectory in the compact `.npz` format read by the library."""
+    time_seconds = np.asarray(time_seconds)
+    time_dtype = np.int32 if time_seconds.max(initial=0) < 2**31 else np.int64
+    np.savez(
+        path,
+        time_seconds=time_seconds.astype(time_dtype),
+        fraction_initial=np.asarray(fraction_initial, dtype=np.float32),
+        weight=np.asarray(weight, dtype=np.float32),
+    )
+
+
+def read_columns(path: Path) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Time, fraction initial and weight of a trajectory file."""
+    if path.suffix == ".npz":
+        with np.load(path) as data:
+            return data["time_seconds"], data["fraction_initial"], data["weight"]
+    data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def load_trajectory(path: Path) -> Trajectory:
+    return Trajectory(*read_columns(path), compact=True)
+
+
+class TrajectoryLibrary:
+    """Named trajectories stored in a directory, loaded on first use.
+
+    A trajectory is named after its path relative to the directory, without
+    suffix (e.g. `apples/2024-05-01`). Loaded trajectories are kept in an LRU
+    cache whose total size stays within `memory_budget` bytes. Evicting a
+    trajectory only drops the cache reference, a simulation still replaying it
+    keeps it alive and it is reused, not reloaded, if asked for again.
+
+    The lock only guards the cache: a trajectory is loaded outside of it, so
+    that a cold load does not hold up the others, and concurrent requests
+    for the same trajectory wait for a single load.
+    """
+
+    def __init__(self, directory: Optional[str], memory_budget: int):
+        self.directory = Path(directory) if directory is not None else None
+        self.memory_budget = memory_budget
+        self._resident: OrderedDict[str, Trajectory] = OrderedDict()
+        self._pinned: dict[str, Trajectory] = {}
+        self._alive = weakref.WeakValueDictionary()
+        # loads in progress, by name
+        self._loading: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def pin(self, name: str, trajectory: Trajectory):
+        """Register a trajectory that is never evicted."""
+        self._pinned[name] = trajectory
+
+    def _path(self, name: str) -> Optional[Path]:
+        if self.directory is None:
+            return None
+        root = self.directory.resolve()
+        for suffix in SUFFIXES:
+            path = self.directory / f"{name}{suffix}"
+            # names must not escape the library directory
+            if path.resolve().is_relative_to(root) and path.is_file():
+                return path
+        return None
+
+    def names(self) -> list[str]:
+        names = set(self._pinned)
+        if self.directory is not None and self.directory.is_dir():
+            names.update(
+                path.relative_to(self.directory).with_suffix("").as_posix()
+                for path in self.directory.rglob("*")
+                if path.suffix in SUFFIXES
+            )
+        return sorted(names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._pinned or self._path(name) is not None
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(trajectory.nbytes for trajectory in self._resident.values())
+
+    def _cached(self, name: str) -> Optional[Trajectory]:
+        trajectory = self._resident.get(name)
+        if trajectory is not None:
+            self._resident.move_to_end(name)
+            return trajectory
+        trajectory = self._alive.get(name)
+        if trajectory is not None:
+            self._resident[name] = trajectory
+            self._evict()
+        return trajectory
+
+    def cached(self, name: str) -> Optional[Trajectory]:
+        """The trajectory if it is in memory, None if it has to be loaded."""
+        if name in self._pinned:
+            return self._pinned[name]
+        with self._lock:
+            return self._cached(name)
+
+    def get(self, name: str) -> Trajectory:
+        if name in self._pinned:
+            return self._pinned[name]
+        with self._lock:
+            trajectory = self._cached(name)
+            if trajectory is not None:
+                return trajectory
+            loading = self._loading.get(name)
+            loads = loading is None
+            if loads:
+                loading = self._loading[name] = Future()
+        if not loads:
+            return loading.result()
+        try:
+            path = self._path(name)
+            if path is None:
+                raise KeyError(name)
+            trajectory = load_trajectory(path)
+        except BaseException as error:
+            with self._lock:
+                del self._loading[name]
+            loading.set_exception(error)
+            raise
+        with self._lock:
+            self._alive[name] = trajectory
+            self._resident[name] = trajectory
+            self._evict()
+            del self._loading[name]
+        loading.set_result(trajectory)
+        return trajectory
+
+    def samples(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        """Time and fraction initial of a trajectory, without caching it.
+
+        For a scan of the whole library, which would otherwise evict the
+        trajectories being replayed.
+        """
+        trajectory = self._pinned.get(name)
+        if trajectory is None:
+            trajectory = self._alive.get(name)
+        if trajectory is not None:
+            return trajectory.time_seconds, trajectory.fraction_initial
+        path = self._path(name)
+        if path is None:
+            raise KeyError(name)
+        time_seconds, fraction_initial, _ = read_columns(path)
+        return time_seconds, fraction_initial
+
+    def _evict(self):
+        size = self.resident_bytes
+        # the most recently used trajectory stays even if it alone is too big
+        while size > self.memory_budget and len(self._resident) > 1:
+            _, trajectory = self._resident.popitem(last=False)
+            size -= trajectory.nbytes
+
+    def public(self) -> list[TrajectoryPublic]:
+        trajectories = []
+        for name in self.names():
+            trajectory = self._pinned.get(name)
+            if trajectory is None:
+                trajectory = self._alive.get(name)
+            trajectories.append(
+                TrajectoryPublic(
+                    name=name,
+                    resident=trajectory is not None,
+                    nbytes=trajectory.nbytes if trajectory is not None else None,
+                )
+            )
+        return trajectories
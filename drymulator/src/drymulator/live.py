@@ -0,0 +1,132 @@
+from typing import Optional
+
+import math
+
+import numpy as np
+
+from .columns import Columns
+from .models import ReadingCreate, StatePublic
+from .trajectory import RATE_WINDOW_SECONDS, encode_states
+
+
+class LiveDryers:
+    """Dryers backed by real sensors, fed by batches of readings.
+
+    The latest reading of every dryer is its current state as soon as the
+    batch arrives, while the readings themselves are buffered until `drain`
+    hands them over to be stored in bulk. A reading older than the current
+    state of its dryer (a late one) is stored but does not replace it.
+    """
+
+    def __init__(self):
+        # latest reading, one row per dryer
+        self.latest = Columns(
+            {
+                "time_seconds": np.int64,
+                "fraction_initial": np.float64,
+                "weight": np.float64,
+                # fraction initial of the earliest reading
+                "f0": np.float64,
+                # weight lost per hour, NaN until there are two readings
+                "drying_rate": np.float64,
+            }
+        )
+        self._buffer: list[dict] = []
+
+    def __contains__(self, dryer_id: str) -> bool:
+        return dryer_id in self.latest
+
+    def __len__(self) -> int:
+        return len(self.latest)
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def get(self, dryer_id: str) -> Optional[StatePublic]:
+        if dryer_id not in self.latest:
+            return None
+        latest, row = self.latest, self.latest.row(dryer_id)
+        fraction_initial = float(latest["fraction_initial"][row])
+        f0 = float(latest["f0"][row])
+        drying_rate = float(latest["drying_rate"][row])
+        return StatePublic(
+            time_seconds=int(latest["time_seconds"][row]),
+            fraction_initial=fraction_initial,
+            weight=float(latest["weight"][row]),
+            dry_basis_moisture=fraction_initial / (1 - f0) if f0 != 1 else None,
+            moisture_ratio=fraction_initial / f0 if f0 != 0 else None,
+            drying_rate=drying_rate if not math.isnan(drying_rate) else None,
+        )
+
+    def encoded(self, dryer_ids: list[str]) -> list[bytes]:
+        """`StatePublic` JSON of the state of each dryer, as `get` has it,
+        encoded for all of them at once."""
+        latest = self.latest
+        rows = np.fromiter(
+            map(latest.row, dryer_ids), dtype=np.intp, count=len(dryer_ids)
+        )
+        fraction_initial = latest["fraction_initial"][rows]
+        f0 = latest["f0"][rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dry_basis_moisture = np.where(f0 != 1, fraction_initial / (1 - f0), np.nan)
+            moisture_ratio = np.where(f0 != 0, fraction_initial / f0, np.nan)
+        states = encode_states(
+            {
+                "time_seconds": latest["time_seconds"][rows],
+                "fraction_initial": fraction_initial,
+                "weight": latest["weight"][rows],
+                "dry_basis_moisture": dry_basis_moisture,
+                "moisture_ratio": moisture_ratio,
+                "drying_rate": latest["drying_rate"][rows],
+            }
+        )
+        return [state.encode() for state in states.to_pylist()]
+
+    def ingest(self, readings: list[ReadingCreate]):
+        newest: dict[str, ReadingCreate] = {}
+        earliest: dict[str, ReadingCreate] = {}
+        for reading in readings:
+            current = newest.get(reading.dryer_id)
+            if current is None or reading.time_seconds >= current.time_seconds:
+                newest[reading.dryer_id] = reading
+            first = earliest.get(reading.dryer_id)
+            if first is None or reading.time_seconds < first.time_seconds:
+                earliest[reading.dryer_id] = reading
+        latest = self.latest
+        for dryer_id, reading in newest.items():
+            if dryer_id not in latest:
+                first = earliest[dryer_id]
+                latest.set(
+                    dryer_id,
+                    time_seconds=first.time_seconds,
+                    fraction_initial=first.fraction_initial,
+                    weight=first.weight,
+                    f0=first.fraction_initial,
+                    drying_rate=np.nan,
+                )
+            row = latest.row(dryer_id)
+            elapsed = reading.time_seconds - latest["time_seconds"][row]
+            if elapsed < 0:
+                continue
+            drying_rate = latest["drying_rate"][row]
+            if elapsed > 0:
+                rate = (latest["weight"][row] - reading.weight) / elapsed * 3600
+                if math.isnan(drying_rate):
+                    drying_rate = rate
+                else:
+                    alpha = 1 - math.exp(-elapsed / RATE_WINDOW_SECONDS)
+                    drying_rate += alpha * (rate - drying_rate)
+            latest.set(
+                dryer_id,
+                time_seconds=reading.time_seconds,
+                fraction_initial=reading.fraction_initial,
+                weight=reading.weight,
+                drying_rate=drying_rate,
+            )
+        self._buffer.extend(reading.model_dump() for reading in readings)
+
+    def drain(self) -> list[dict]:
+        """Buffered readings, as rows ready for a bulk insert."""
+        rows, self._buffer = self._buffer, []
+        return rows
@@ -0,0 +1,265 @@
+from typing import Literal, Optional
+
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+from datetime import datetime
+
+
+class ConfigBase(SQLModel):
+    start_time: Optional[datetime] = Field(default=datetime.now())
+    time_speed: Optional[float] = Field(default=10.0)
+    is_active: Optional[bool] = Field(default=True)
+    # name of the trajectory in the library that is replayed
+    trajectory: str = Field(default="default")
+
+
+class Config(ConfigBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+
+class ConfigPublic(ConfigBase):
+    pass
+
+
+class ConfigCreate(ConfigBase):
+    pass
+
+
+class ConfigChange(ConfigBase, table=True):
+    """Config of the live simulation from `changed_at` to the next change."""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    changed_at: datetime = Field(index=True)
+    # simulated time the state is frozen at while paused
+    time_seconds: int
+
+
+class StateBase(SQLModel):
+    time_seconds: int
+    fraction_initial: float
+    weight: float
+
+
+class HistoryState(StateBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+
+class CurrentState(StateBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+
+class StatePublic(StateBase):
+    """A state with the quantities derived from it, None when unknown.
+
+    `fraction_initial` is the water left as a fraction of the initial
+    weight, and `f0` its initial value.
+    """
+
+    # water per unit of dry matter, fraction_initial / (1 - f0)
+    dry_basis_moisture: Optional[float] = None
+    # dry basis moisture over its initial value, fraction_initial / f0
+    moisture_ratio: Optional[float] = None
+    # weight lost per hour, averaged over about ten minutes
+    drying_rate: Optional[float] = None
+    # of the latest batch of readings of a sensor-backed dryer: spike, stall or
+    # jump; None for a simulation, and then left out of the served JSON
+    anomalies: Optional[list[str]] = None
+
+
+class ReadingBase(StateBase):
+    # sensor-backed dryer that sent the reading
+    dryer_id: str
+
+
+class Reading(ReadingBase, table=True):
+    __table_args__ = (Index("ix_reading_dryer_time", "dryer_id", "time_seconds"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+
+class ReadingCreate(ReadingBase):
+    pass
+
+
+class IngestPublic(SQLModel):
+    accepted: int
+    # readings not stored yet
+    pending: int
+
+
+class EstimatePublic(SQLModel):
+    """Filtered state of a sensor-backed dryer, with standard deviations."""
+
+    time_seconds: int
+    weight: float
+    weight_std: float
+    fraction_initial: float
+    fraction_initial_std: float
+    # weight lost per hour
+    drying_rate: float
+    drying_rate_std: float
+    # of the latest batch of readings: spike, stall or jump
+    anomalies: list[str] = Field(default_factory=list)
+
+
+class ForecastPublic(SQLModel):
+    """Predicted curves of a dryer, from a fitted Page drying model."""
+
+    k: float
+    n: float
+    f_eq: float
+    time_seconds: list[float]
+    fraction_initial: list[float]
+    weight: list[float]
+
+
+class SimilarRunPublic(SQLModel):
+    """Past run of the library that dried like the one queried so far."""
+
+    name: str
+    # root mean square difference of the fraction initial so far
+    distance: float
+    duration_seconds: float
+    # how much longer the past run went on after the time queried
+    remaining_seconds: float
+    final_fraction_initial: float
+
+
+class ForkPublic(SQLModel):
+    dryer_id: str
+    parent_id: Optional[str] = None
+    simulated_seconds: float
+    time_speed: float
+    is_active: bool
+    # incremented by every change of the clock
+    version: int = 0
+
+
+class CommandCreate(SQLModel):
+    """Command of a batch, for a fork or the live simulation (no `dryer_id`)."""
+
+    dryer_id: Optional[str] = None
+    command: Literal["reset", "pause", "resume", "fast_forward"]
+    # of a reset
+    config: Optional[ConfigCreate] = None
+    # of a fast-forward, forks only
+    seconds: Optional[float] = None
+    # applied only if the dryer is still at this version (compare-and-set)
+    expected_version: Optional[int] = None
+
+
+class BatchCreate(SQLModel):
+    commands: list[CommandCreate]
+    # all the commands or none of them, otherwise only the failed ones are not
+    atomic: bool = True
+
+
+class CommandResult(SQLModel):
+    dryer_id: Optional[str] = None
+    command: str
+    # as the command alone would have answered, 424 if not applied because
+    # another command of an atomic batch failed
+    status_code: int
+    detail: Optional[str] = None
+    # after the command, the current one if it failed; the live simulation
+    # is at the id of its latest config change
+    version: Optional[int] = None
+    config: Optional[ConfigPublic] = None
+
+
+class BatchPublic(SQLModel):
+    # every command has been applied
+    applied: bool
+    results: list[CommandResult]
+
+
+class EnsemblePublic(SQLModel):
+    n: int
+    target_weight: float
+    # share of the runs that ever reach the target weight
+    reachable_fraction: float
+    time_seconds: list[float]
+    weight_p5: list[float]
+    weight_p50: list[float]
+    weight_p95: list[float]
+    # remaining seconds until the target weight, None if not reached
+    time_to_target_p5: Optional[float] = None
+    time_to_target_p50: Optional[float] = None
+    time_to_target_p95: Optional[float] = None
+
+
+class RuleCreate(SQLModel):
+    # None is the live simulation
+    dryer_id: Optional[str] = None
+    # drying_rate is the weight lost per simulated hour
+    metric: Literal["weight", "fraction_initial", "drying_rate"]
+    op: Literal["below", "above"]
+    value: float
+    # simulated seconds the condition has to hold before triggering
+    for_seconds: float = Field(default=0.0, ge=0)
+
+
+class RulePublic(RuleCreate):
+    id: int
+
+
+class RuleEvent(SQLModel):
+    rule: RulePublic
+    observed: float
+    time_seconds: int
+    triggered_at: datetime
+
+
+class FaultCreate(SQLModel):
+    # endpoint path, shell-style wildcards allowed (e.g. /state/*)
+    path: str = "*"
+    # None matches every dryer, the live simulation included
+    dryer_id: Optional[str] = None
+    # log-normal latency: median in milliseconds and shape (0 is constant)
+    latency_ms: float = Field(default=0.0, ge=0)
+    latency_sigma: float = Field(default=0.0, ge=0)
+    # probability of answering with `error_status` instead of the endpoint
+    error_rate: float = Field(default=0.0, ge=0, le=1)
+    error_status: int = Field(default=500, ge=400, le=599)
+    # probability of replaying the previous response of the same request
+    stale_rate: float = Field(default=0.0, ge=0, le=1)
+    # probability of the sensor dropping out, answering 503 for
+    # `dropout_seconds` (real seconds)
+    dropout_rate: float = Field(default=0.0, ge=0, le=1)
+    dropout_seconds: float = Field(default=10.0, ge=0)
+
+
+class FaultPublic(FaultCreate):
+    id: int
+
+
+# quantities the fleet queries sort and aggregate by
+FleetMetric = Literal["time_seconds", "fraction_initial", "weight", "remaining_seconds"]
+
+
+class FleetDryerPublic(SQLModel):
+    dryer_id: str
+    tags: dict[str, str] = Field(default_factory=dict)
+    time_seconds: int
+    fraction_initial: float
+    weight: float
+    # real seconds until the target is reached, None if unknown or never
+    remaining_seconds: Optional[float] = None
+    # of the latest batch of readings of a sensor-backed dryer
+    anomalies: list[str] = Field(default_factory=list)
+
+
+class FleetGroupPublic(SQLModel):
+    # tag value, None for the dryers without the tag (or without grouping)
+    group: Optional[str] = None
+    # dryers with a value of the metric
+    count: int
+    mean: float
+    min: float
+    max: float
+
+
+class TrajectoryPublic(SQLModel):
+    name: str
+    # loaded in memory, nbytes is only known for resident trajectories
+    resident: bool
+    nbytes: Optional[int] = None
@@ -0,0 +1,180 @@
+from collections import Counter
+from datetime import datetime
+import functools
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+
+import anyio.to_thread
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+
+
+def _c_label(function) -> str:
+    module = getattr(function, "__module__", None) or "builtins"
+    return f"{module}:{getattr(function, '__qualname__', repr(function))}"
+
+
+class _ThreadStack:
+    __slots__ = ("root", "frames", "last")
+
+    def __init__(self, root: tuple[str, ...]):
+        self.root = root
+        self.frames: list[tuple[str, ...]] = []
+        self.last = time.perf_counter_ns()
+
+
+class StackProfiler:
+    """Deterministic profiler recording the time spent in every call stack.
+
+    The result is in the "folded" format (`frame;frame;frame microseconds`)
+    read by flamegraph.pl, inferno and speedscope. It profiles every thread,
+    the stacks of the threads other than the one it is started on having the
+    thread name as their root, so the work an async app hands to the
+    threadpool (sync dependencies, `run_in_threadpool`) is in the profile. It
+    also sees whatever else runs meanwhile, e.g. the other requests of the
+    event loop.
+
+    Before Python 3.12 a profile function can only be set on the current
+    thread, so the threadpool is profiled by setting it inside every call
+    that `anyio.to_thread.run_sync` hands over while profiling.
+    """
+
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self._threads: dict[int, _ThreadStack] = {}
+        self._running = False
+        self._run_sync = None
+
+    def _profile(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if not self._running:
+            # a thread finishing an event while the profiler stops
+            sys.setprofile(None)
+            return
+        thread = self._threads.get(threading.get_ident())
+        if thread is None:
+            thread = self._threads[threading.get_ident()] = _ThreadStack(
+                (threading.current_thread().name,)
+            )
+        if thread.frames:
+            self.stacks[thread.frames[-1]] += now - thread.last
+        if event == "call":
+            self._push(thread, _label(frame))
+        elif event == "c_call":
+            self._push(thread, _c_label(arg))
+        elif thread.frames:  # return, c_return and c_exception
+            thread.frames.pop()
+        thread.last = time.perf_counter_ns()
+
+    def _push(self, thread: _ThreadStack, label: str):
+        parent = thread.frames[-1] if thread.frames else thread.root
+        thread.frames.append(parent + (label,))
+
+    def _run_profiled(self, func, *args):
+        sys.setprofile(self._profile)
+        try:
+            return func(*args)
+        finally:
+            sys.setprofile(None)
+            # the next call on this thread starts from an empty stack
+            self._threads.pop(threading.get_ident(), None)
+
+    def start(self):
+        # seed the stack with the frames already running (this one included,
+        # its return is the first event) so that their returns pop them
+        thread = self._threads[threading.get_ident()] = _ThreadStack(())
+        frames = []
+        frame = sys._getframe()
+        while frame is not None:
+            frames.append(_label(frame))
+            frame = frame.f_back
+        for label in reversed(frames):
+            self._push(thread, label)
+        self._running = True
+        thread.last = time.perf_counter_ns()
+        if hasattr(threading, "setprofile_all_threads"):
+            threading.setprofile_all_threads(self._profile)
+            return
+        run_sync = self._run_sync = anyio.to_thread.run_sync
+
+        def profiled_run_sync(func, *args, **kwargs):
+            func = functools.partial(self._run_profiled, func)
+            return run_sync(func, *args, **kwargs)
+
+        anyio.to_thread.run_sync = profiled_run_sync
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        self._running = False
+        if hasattr(threading, "setprofile_all_threads"):
+            threading.setprofile_all_threads(None)
+            return
+        sys.setprofile(None)
+        anyio.to_thread.run_sync = self._run_sync
+
+    def folded(self) -> str:
+        return "".join(
+            f"{';'.join(stack)} {nanoseconds // 1000}\n"
+            for stack, nanoseconds in list(self.stacks.items())
+            if nanoseconds >= 1000
+        )
+
+
+class ProfilingMiddleware:
+    """ASGI middleware writing a folded-stack profile of sampled requests.
+
+    A request is profiled when it has the `X-Profile` header or, if `every`
+    is set, once every `every` requests. Only one request is profiled at a
+    time, and the profile file name is returned in the `X-Profile-File`
+    header. Add the middleware only when profiling is wanted, requests do not
+    pay anything otherwise.
+    """
+
+    def __init__(self, app, directory: str, every: int = 0, skip_paths=()):
+        self.app = app
+        self.directory = Path(directory)
+        self.every = every
+        self.skip_paths = set(skip_paths)
+        self._count = 0
+        self._profiling = False
+
+    def _should_profile(self, scope) -> bool:
+        if self._profiling or scope["path"] in self.skip_paths:
+            return False
+        self._count += 1
+        if self.every and self._count % self.every == 0:
+            return True
+        return any(name == b"x-profile" for name, _ in scope["headers"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._should_profile(scope):
+            return await self.app(scope, receive, send)
+
+        name = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        path = self.directory / (
+            f"{datetime.now():%Y%m%dT%H%M%S.%f}-{scope['method']}-{name}.folded"
+        )
+        profiler = StackProfiler()
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-file", path.name.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        self._profiling = True
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            profiler.stop()
+            self._profiling = False
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path.write_text(profiler.folded())
@@ -0,0 +1,528 @@
+"""Router partitioning dryers across drymulator nodes.
+
+Dryer ids are placed on nodes by consistent hashing, so adding a node only
+moves the dryers of its share of the ring. The router forwards a request to
+the node of its `dryer_id`, splits ingested readings and batches of commands
+by node and scatter-gathers the fleet queries. The live simulation runs on
+every node: its commands are broadcast so that all the clocks agree,
+everything else without a dryer goes to the first node. Rules and faults are
+added to the node of their dryer, and listed from every node under ids that
+tell the node apart. The event streams of every node are merged into one.
+
+    ROUTER_NODES=http://localhost:8001,http://localhost:8002 \\
+        uvicorn drymulator.router:app --port 8000
+"""
+
+import asyncio
+import bisect
+from contextlib import asynccontextmanager
+from datetime import datetime
+import hashlib
+import json
+from typing import AsyncIterator, Optional
+import uuid
+
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import httpx
+from pydantic_settings import BaseSettings
+from starlette.background import BackgroundTask
+
+from .models import BatchCreate, FaultCreate, FleetMetric, RuleCreate
+
+# not forwarded, they describe a single connection
+HOP_HEADERS = {
+    "host",
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "content-length",
+}
+
+# commands of the live simulation, run on every node
+BROADCAST = {"/command/reset", "/command/pause", "/command/resume"}
+
+
+class RouterSettings(BaseSettings):
+    # drymulator nodes, comma separated; the first one serves what has no dryer
+    router_nodes: str = "http://localhost:8001"
+    # points of every node on the hash ring, more spread the dryers more evenly
+    router_replicas: int = 100
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest())
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, with `replicas` points per node."""
+
+    def __init__(self, nodes: list[str], replicas: int = 100):
+        points = sorted(
+            (_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: str) -> str:
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._nodes[index]
+
+    def key_on(self, node: str) -> str:
+        """A new random dryer id placed on `node`."""
+        while True:
+            key = uuid.uuid4().hex[:12]
+            if self.node(key) == node:
+                return key
+
+
+class Router:
+    def __init__(self, nodes: list[str], replicas: int = 100):
+        self.nodes = nodes
+        self.ring = HashRing(nodes, replicas)
+        self.clients: dict[str, httpx.AsyncClient] = {}
+
+    def open(self):
+        self.clients = {
+            node: httpx.AsyncClient(base_url=node, timeout=None) for node in self.nodes
+        }
+
+    async def close(self):
+        await asyncio.gather(*(client.aclose() for client in self.clients.values()))
+
+    def node(self, dryer_id: Optional[str]) -> str:
+        return self.ring.node(dryer_id) if dryer_id is not None else self.nodes[0]
+
+    def public_id(self, node: str, node_id: int) -> int:
+        """Id of a rule or fault of `node`, unique across the nodes."""
+        return node_id * len(self.nodes) + self.nodes.index(node)
+
+    def owner(self, public_id: int) -> tuple[str, int]:
+        """Node of a rule or fault, and its id there."""
+        return self.nodes[public_id % len(self.nodes)], public_id // len(self.nodes)
+
+    async def forward(
+        self,
+        node: str,
+        request: Request,
+        params: Optional[dict] = None,
+        content: Optional[bytes] = None,
+    ) -> Response:
+        """The response of `node` to the request, streamed back as it comes."""
+        client = self.clients[node]
+        upstream = client.build_request(
+            request.method,
+            request.url.path,
+            params=params if params is not None else request.query_params,
+            content=content if content is not None else await request.body(),
+            headers={
+                name: value
+                for name, value in request.headers.items()
+                if name not in HOP_HEADERS
+            },
+        )
+        response = await client.send(upstream, stream=True)
+        return StreamingResponse(
+            response.aiter_raw(),
+            status_code=response.status_code,
+            headers={
+                name: value
+                for name, value in response.headers.items()
+                if name not in HOP_HEADERS
+            },
+            background=BackgroundTask(response.aclose),
+        )
+
+    async def scatter(
+        self, method: str, path: str, nodes: Optional[list[str]] = None, **kwargs
+    ) -> list[httpx.Response]:
+        nodes = nodes if nodes is not None else self.nodes
+        return await asyncio.gather(
+            *(self.clients[node].request(method, path, **kwargs) for node in nodes)
+        )
+
+    async def streams(self, request: Request) -> list[httpx.Response]:
+        """The response of every node to the request, its body not read yet."""
+        return await asyncio.gather(
+            *(
+                client.send(
+                    client.build_request(
+                        "GET", request.url.path, params=request.query_params
+                    ),
+                    stream=True,
+                )
+                for client in self.clients.values()
+            )
+        )
+
+
+async def _events(
+    responses: list[httpx.Response],
+) -> AsyncIterator[tuple[int, bytes]]:
+    """Server-sent events of every response as they come, with the index of
+    their response; the responses are closed when the iteration stops."""
+    # bounded, so that a slow client slows the reading down and the nodes
+    # drop what it cannot keep up with, as they would for a direct client
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16 * len(responses))
+
+    async def read(index: int, response: httpx.Response):
+        buffer = b""
+        try:
+            async for chunk in response.aiter_bytes():
+                *events, buffer = (buffer + chunk).split(b"\n\n")
+                for event in events:
+                    await queue.put((index, event + b"\n\n"))
+        except httpx.HTTPError:
+            pass
+        await queue.put((index, None))
+
+    tasks = [
+        asyncio.create_task(read(index, response))
+        for index, response in enumerate(responses)
+    ]
+    running = len(tasks)
+    try:
+        while running:
+            index, event = await queue.get()
+            if event is None:
+                running -= 1
+            else:
+                yield index, event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(response.aclose() for response in responses))
+
+
+def _fleet_frame(
+    time: float, snapshot: bool, states: dict, removed: list[str]
+) -> bytes:
+    frame = {"time": time, "snapshot": snapshot, "states": states, "removed": removed}
+    return b"data: %s\n\n" % json.dumps(frame, separators=(",", ":")).encode()
+
+
+async def _fleet_frames(
+    events: AsyncIterator[tuple[int, bytes]], nodes: int
+) -> AsyncIterator[bytes]:
+    """Fleet stream frames of every node, as the stream of a single node.
+
+    The dryers of the nodes are disjoint: the snapshots of all the nodes are
+    merged into the first frame, and a later snapshot of a node (it resynced a
+    client that fell behind) becomes a delta of the dryers of that node.
+    Deltas are passed on as they are.
+    """
+    # dryers every node has sent and not removed since
+    dryers: list[set[str]] = [set() for _ in range(nodes)]
+    waiting = set(range(nodes))
+    first: Optional[dict] = {}
+    async for index, event in events:
+        frame = json.loads(event.removeprefix(b"data: "))
+        states, removed = frame["states"], frame["removed"]
+        if frame["snapshot"]:
+            removed = sorted(dryers[index].difference(states))
+            dryers[index] = set(states)
+            waiting.discard(index)
+        else:
+            dryers[index].difference_update(removed)
+            dryers[index].update(states)
+        if first is not None:
+            first.update(states)
+            for dryer_id in removed:
+                first.pop(dryer_id, None)
+            if not waiting:
+                yield _fleet_frame(frame["time"], True, first, [])
+                first = None
+        elif frame["snapshot"]:
+            yield _fleet_frame(frame["time"], False, states, removed)
+        else:
+            yield event
+
+
+def _error(responses: list[httpx.Response]) -> Optional[Response]:
+    """The first failed response, if any."""
+    for response in responses:
+        if response.is_error:
+            return Response(
+                response.content,
+                status_code=response.status_code,
+                media_type=response.headers.get("content-type"),
+            )
+    return None
+
+
+def create_app(nodes: list[str], replicas: int = 100) -> FastAPI:
+    router = Router(nodes, replicas)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        router.open()
+        yield
+        await router.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.router = router
+
+    @app.post("/command/fork")
+    async def fork(request: Request, dryer_id: Optional[str] = None):
+        """New fork on the node of its parent, or of its id for the live one."""
+        if dryer_id is None:
+            fork_id = uuid.uuid4().hex[:12]
+            node = router.node(fork_id)
+        else:
+            node = router.node(dryer_id)
+            fork_id = router.ring.key_on(node)
+        params = {**request.query_params, "fork_id": fork_id}
+        return await router.forward(node, request, params=params)
+
+    @app.post("/command/batch")
+    async def batch(request: Request, batch: BatchCreate):
+        """Commands split by node, their results put back in order.
+
+        The live simulation runs on every node, so its commands go to all of
+        them and their result is the first node's, or the first failure. A
+        batch on several nodes cannot be all or nothing: an atomic one is
+        rejected, unless it stays on a single node.
+        """
+        # positions of the commands of every node, in the order of the nodes
+        by_node: dict[str, list[int]] = {node: [] for node in router.nodes}
+        for position, command in enumerate(batch.commands):
+            if command.dryer_id is None:
+                for positions in by_node.values():
+                    positions.append(position)
+            else:
+                by_node[router.node(command.dryer_id)].append(position)
+        by_node = {node: positions for node, positions in by_node.items() if positions}
+        if len(by_node) <= 1:
+            return await router.forward(next(iter(by_node), router.nodes[0]), request)
+        if batch.atomic:
+            raise HTTPException(
+                status_code=422,
+                detail="An atomic batch cannot span several nodes, send one "
+                "batch per node or a batch that is not atomic",
+            )
+        commands = [
+            command.model_dump(mode="json", exclude_unset=True)
+            for command in batch.commands
+        ]
+        responses = await asyncio.gather(
+            *(
+                router.clients[node].post(
+                    "/command/batch",
+                    json={
+                        "commands": [commands[position] for position in positions],
+                        "atomic": False,
+                    },
+                )
+                for node, positions in by_node.items()
+            )
+        )
+        if (error := _error(responses)) is not None:
+            return error
+        results: list[Optional[dict]] = [None] * len(commands)
+        for positions, response in zip(by_node.values(), responses):
+            for position, result in zip(positions, response.json()["results"]):
+                previous = results[position]
+                if previous is None or (
+                    previous["status_code"] == 200 and result["status_code"] != 200
+                ):
+                    results[position] = result
+        return {
+            "applied": all(result["status_code"] == 200 for result in results),
+            "results": results,
+        }
+
+    @app.post("/ingest")
+    async def ingest(request: Request):
+        """Readings split by node, the counts are summed."""
+        by_node: dict[str, list] = {}
+        for reading in await request.json():
+            by_node.setdefault(router.node(reading["dryer_id"]), []).append(reading)
+        responses = await asyncio.gather(
+            *(
+                router.clients[node].post("/ingest", json=readings)
+                for node, readings in by_node.items()
+            )
+        )
+        if (error := _error(responses)) is not None:
+            return error
+        counts = [response.json() for response in responses]
+        return {
+            key: sum(count[key] for count in counts) for key in ("accepted", "pending")
+        }
+
+    @app.get("/fleet/dryers")
+    async def fleet_dryers(
+        request: Request,
+        sort_by: FleetMetric = "remaining_seconds",
+        descending: bool = False,
+        k: int = Query(default=100, ge=1, le=10_000),
+    ):
+        """Top k of every node, merged into the top k of the fleet.
+
+        The parameters are parsed as the nodes parse them, so that the merge
+        sorts the way they did.
+        """
+        responses = await router.scatter(
+            "GET", "/fleet/dryers", params=request.query_params
+        )
+        if (error := _error(responses)) is not None:
+            return error
+        dryers = [dryer for response in responses for dryer in response.json()]
+        known = [dryer for dryer in dryers if dryer[sort_by] is not None]
+        known.sort(key=lambda dryer: dryer[sort_by], reverse=descending)
+        unknown = [dryer for dryer in dryers if dryer[sort_by] is None]
+        return (known + unknown)[:k]
+
+    @app.get("/fleet/aggregate")
+    async def fleet_aggregate(request: Request):
+        """Aggregates of every node, merged per group."""
+        responses = await router.scatter(
+            "GET", "/fleet/aggregate", params=request.query_params
+        )
+        if (error := _error(responses)) is not None:
+            return error
+        groups: dict[Optional[str], dict] = {}
+        for response in responses:
+            for group in response.json():
+                merged = groups.get(group["group"])
+                if merged is None:
+                    groups[group["group"]] = group
+                    continue
+                count = merged["count"] + group["count"]
+                merged["mean"] = (
+                    merged["mean"] * merged["count"] + group["mean"] * group["count"]
+                ) / count
+                merged["count"] = count
+                merged["min"] = min(merged["min"], group["min"])
+                merged["max"] = max(merged["max"], group["max"])
+        return list(groups.values())
+
+    async def fan_in(request: Request, frames) -> Response:
+        responses = await router.streams(request)
+        if any(response.is_error for response in responses):
+            # the others would stream on
+            for response in responses:
+                await (response.aread() if response.is_error else response.aclose())
+            return _error(responses)
+        return StreamingResponse(
+            frames(_events(responses)), media_type="text/event-stream"
+        )
+
+    @app.get("/fleet/stream")
+    async def fleet_stream(request: Request):
+        """Fleet streams of every node, merged into one that starts with a
+        snapshot of the whole fleet."""
+        return await fan_in(
+            request, lambda events: _fleet_frames(events, len(router.nodes))
+        )
+
+    @app.get("/events")
+    async def events(request: Request):
+        """Triggered rules of every node, in the order they come."""
+
+        async def frames(events):
+            async for index, event in events:
+                triggered = json.loads(event.removeprefix(b"data: "))
+                rule = triggered["rule"]
+                rule["id"] = router.public_id(router.nodes[index], rule["id"])
+                triggered = json.dumps(triggered, separators=(",", ":"))
+                yield b"data: %s\n\n" % triggered.encode()
+
+        return await fan_in(request, frames)
+
+    # rules and faults live on the node of their dryer (the first node without
+    # one), under an id that tells the node apart
+
+    async def add_owned(path: str, item: RuleCreate | FaultCreate):
+        node = router.node(item.dryer_id)
+        response = await router.clients[node].post(
+            path, json=item.model_dump(mode="json", exclude_unset=True)
+        )
+        if response.is_error:
+            return _error([response])
+        added = response.json()
+        added["id"] = router.public_id(node, added["id"])
+        return added
+
+    async def list_owned(request: Request):
+        responses = await router.scatter(
+            "GET", request.url.path, params=request.query_params
+        )
+        if (error := _error(responses)) is not None:
+            return error
+        return [
+            {**item, "id": router.public_id(node, item["id"])}
+            for node, response in zip(router.nodes, responses)
+            for item in response.json()
+        ]
+
+    async def delete_owned(kind: str, public_id: int):
+        node, node_id = router.owner(public_id)
+        response = await router.clients[node].delete(f"/{kind}s/{node_id}")
+        if response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Unknown {kind} {public_id}")
+        if response.is_error:
+            return _error([response])
+        return {**response.json(), "id": public_id}
+
+    @app.post("/rules")
+    async def add_rule(rule: RuleCreate):
+        return await add_owned("/rules", rule)
+
+    @app.get("/rules")
+    async def list_rules(request: Request):
+        """Rules of every node."""
+        return await list_owned(request)
+
+    @app.delete("/rules/{rule_id}")
+    async def delete_rule(rule_id: int):
+        return await delete_owned("rule", rule_id)
+
+    @app.post("/faults")
+    async def add_fault(fault: FaultCreate):
+        return await add_owned("/faults", fault)
+
+    @app.get("/faults")
+    async def list_faults(request: Request):
+        """Faults of every node."""
+        return await list_owned(request)
+
+    @app.delete("/faults/{fault_id}")
+    async def delete_fault(fault_id: int):
+        return await delete_owned("fault", fault_id)
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
+    async def forward(request: Request, path: str):
+        path = request.url.path
+        dryer_id = request.query_params.get("dryer_id")
+        if path.startswith("/fleet/tags/"):
+            dryer_id = path.removeprefix("/fleet/tags/")
+        if dryer_id is None and path in BROADCAST:
+            content = await request.body()
+            if path == "/command/reset":
+                # the nodes would each default to their own start time
+                config = json.loads(content)
+                config.setdefault("start_time", datetime.now().isoformat())
+                content = json.dumps(config).encode()
+            responses = await router.scatter(
+                request.method,
+                path,
+                params=request.query_params,
+                content=content,
+                headers={"content-type": request.headers.get("content-type", "")},
+            )
+            primary = responses[0]
+            return _error(responses) or JSONResponse(
+                primary.json(), status_code=primary.status_code
+            )
+        return await router.forward(router.node(dryer_id), request)
+
+    return app
+
+
+settings = RouterSettings()
+
+app = create_app(settings.router_nodes.split(","), settings.router_replicas)
@@ -0,0 +1,219 @@
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from datetime import datetime
+import heapq
+from typing import Optional
+
+from .models import RuleCreate, RuleEvent, RulePublic, StatePublic
+
+
+class _RuleState:
+    __slots__ = ("rule", "holds", "due", "fired")
+
+    def __init__(self, rule: RulePublic):
+        self.rule = rule
+        self.holds = False
+        # simulated time at which a held condition triggers, None if not pending
+        self.due: Optional[float] = None
+        self.fired = False
+
+
+class ThresholdIndex:
+    """Thresholds of the rules on one metric of one dryer, kept sorted.
+
+    When the metric moves from `old` to `new` only the rules whose threshold
+    lies between the two values change state, and they are found with two
+    bisections instead of checking every rule.
+    """
+
+    def __init__(self):
+        self.below: list[tuple[float, int]] = []
+        self.above: list[tuple[float, int]] = []
+
+    def __bool__(self) -> bool:
+        return bool(self.below or self.above)
+
+    def add(self, rule: RulePublic):
+        insort(getattr(self, rule.op), (rule.value, rule.id))
+
+    def remove(self, rule: RulePublic):
+        thresholds = getattr(self, rule.op)
+        thresholds.pop(bisect_left(thresholds, (rule.value, rule.id)))
+
+    def crossed(self, old: float, new: float) -> list[int]:
+        low, high = min(old, new), max(old, new)
+        # `x < value` changes for low < value <= high
+        below = self.below[
+            bisect_right(self.below, (low, float("inf"))) : bisect_right(
+                self.below, (high, float("inf"))
+            )
+        ]
+        # `x > value` changes for low <= value < high
+        above = self.above[
+            bisect_left(self.above, (low, -1)) : bisect_left(self.above, (high, -1))
+        ]
+        return [rule_id for _, rule_id in below + above]
+
+
+def _holds(rule: RulePublic, observed: float) -> bool:
+    return observed < rule.value if rule.op == "below" else observed > rule.value
+
+
+class RuleEngine:
+    """Threshold, rate and duration rules evaluated incrementally on each tick.
+
+    The cost of a tick is logarithmic in the number of rules of a dryer plus
+    the number of rules that actually change state, and the dryers to tick are
+    known without going through the rules.
+    """
+
+    def __init__(self):
+        self._next_id = 1
+        self._rules: dict[int, _RuleState] = {}
+        # number of rules of every dryer with any
+        self._counts: dict[Optional[str], int] = {}
+        self._indexes: dict[tuple[Optional[str], str], ThresholdIndex] = defaultdict(
+            ThresholdIndex
+        )
+        # rules added since the last tick of their dryer, not yet in the index
+        self._fresh: dict[Optional[str], list[int]] = defaultdict(list)
+        # per dryer heap of (due, rule id) for duration conditions
+        self._pending: dict[Optional[str], list[tuple[float, int]]] = defaultdict(list)
+        self._last: dict[Optional[str], dict[str, float]] = {}
+        self.subscribers: set[asyncio.Queue] = set()
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def dryer_ids(self) -> list[Optional[str]]:
+        return list(self._counts)
+
+    def rules(self, dryer_id: Optional[str] = None) -> list[RulePublic]:
+        return [
+            state.rule
+            for state in self._rules.values()
+            if dryer_id is None or state.rule.dryer_id == dryer_id
+        ]
+
+    def add(self, rule: RuleCreate, rule_id: Optional[int] = None) -> RulePublic:
+        """Add a rule, with a new id unless restoring one with `rule_id`."""
+        rule_id = rule_id if rule_id is not None else self._next_id
+        rule = RulePublic(id=rule_id, **rule.model_dump())
+        self._next_id = max(self._next_id, rule_id + 1)
+        self._rules[rule.id] = _RuleState(rule)
+        self._counts[rule.dryer_id] = self._counts.get(rule.dryer_id, 0) + 1
+        self._fresh[rule.dryer_id].append(rule.id)
+        return rule
+
+    def remove(self, rule_id: int) -> Optional[RulePublic]:
+        state = self._rules.pop(rule_id, None)
+        if state is None:
+            return None
+        rule = state.rule
+        self._counts[rule.dryer_id] -= 1
+        if not self._counts[rule.dryer_id]:
+            del self._counts[rule.dryer_id]
+        if rule.id in self._fresh[rule.dryer_id]:
+            self._fresh[rule.dryer_id].remove(rule.id)
+        else:
+            self._indexes[rule.dryer_id, rule.metric].remove(rule)
+        return rule
+
+    def remove_dryer(self, dryer_id: Optional[str]):
+        for rule in self.rules(dryer_id):
+            self.remove(rule.id)
+        self._last.pop(dryer_id, None)
+        self._fresh.pop(dryer_id, None)
+        self._pending.pop(dryer_id, None)
+
+    def _observe(self, dryer_id: Optional[str], state: StatePublic) -> dict[str, float]:
+        """Record the metrics of the new state, returns the previous ones."""
+        last = self._last.get(dryer_id, {})
+        observed = {"weight": state.weight, "fraction_initial": state.fraction_initial}
+        elapsed = state.time_seconds - last.get("time_seconds", state.time_seconds)
+        if elapsed > 0:
+            observed["drying_rate"] = (last["weight"] - state.weight) / elapsed * 3600
+        elif "drying_rate" in last:
+            observed["drying_rate"] = last["drying_rate"]
+        observed["time_seconds"] = state.time_seconds
+        self._last[dryer_id] = observed
+        return last
+
+    def _transition(self, state: _RuleState, holds: bool, now: float) -> bool:
+        """Update the condition of a rule, True if it triggers right away."""
+        state.holds = holds
+        if not holds:
+            state.due, state.fired = None, False
+            return False
+        if state.rule.for_seconds == 0:
+            state.fired = True
+            return True
+        state.due = now + state.rule.for_seconds
+        heapq.heappush(self._pending[state.rule.dryer_id], (state.due, state.rule.id))
+        return False
+
+    def update(self, dryer_id: Optional[str], state: StatePublic) -> list[RuleEvent]:
+        """Feed the latest state of a dryer, returns the triggered rules."""
+        previous = self._observe(dryer_id, state)
+        observed = self._last[dryer_id]
+        now = state.time_seconds
+        triggered = []
+        for metric, new in observed.items():
+            index = self._indexes.get((dryer_id, metric))
+            if not index or metric not in previous:
+                continue
+            for rule_id in index.crossed(previous[metric], new):
+                rule_state = self._rules[rule_id]
+                if self._transition(rule_state, _holds(rule_state.rule, new), now):
+                    triggered.append(rule_state)
+
+        fresh, self._fresh[dryer_id] = self._fresh[dryer_id], []
+        for rule_id in fresh:
+            rule_state = self._rules[rule_id]
+            rule = rule_state.rule
+            if rule.metric not in observed:
+                # no rate yet, wait for the next tick
+                self._fresh[dryer_id].append(rule_id)
+                continue
+            self._indexes[dryer_id, rule.metric].add(rule)
+            holds = _holds(rule, observed[rule.metric])
+            if holds and self._transition(rule_state, holds, now):
+                triggered.append(rule_state)
+
+        pending = self._pending[dryer_id]
+        while pending and pending[0][0] <= now:
+            due, rule_id = heapq.heappop(pending)
+            rule_state = self._rules.get(rule_id)
+            # skip removed rules and conditions that stopped holding meanwhile
+            if rule_state is None or rule_state.due != due or rule_state.fired:
+                continue
+            rule_state.due, rule_state.fired = None, True
+            triggered.append(rule_state)
+
+        triggered_at = datetime.now()
+        return [
+            RuleEvent(
+                rule=rule_state.rule,
+                observed=observed[rule_state.rule.metric],
+                time_seconds=now,
+                triggered_at=triggered_at,
+            )
+            for rule_state in triggered
+        ]
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1000)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, events: list[RuleEvent]):
+        for queue in self.subscribers:
+            for event in events:
+                if queue.full():
+                    # drop the oldest event rather than blocking the tick
+                    queue.get_nowait()
+                queue.put_nowait(event)
@@ -0,0 +1,268 @@
+"""Scripted scenarios replayed in virtual time.
+
+A scenario is a list of timed commands and queries, written in YAML or JSON:
+
+    name: pause-and-resume
+    time_speed: 10
+    steps:
+      - reset
+      - wait: 2h
+      - pause
+      - wait: 20m
+      - resume
+      - query: after-resume
+
+`wait` advances the virtual wall clock, the other steps are the commands of
+the server (`reset`, `pause`, `resume`, `fast_forward`) and `query`, which
+records the current state. Pausing and resuming follow the live simulation of
+the server: the state stays frozen while paused but the clock runs on, so a
+resume carries on where the clock is by then (unlike a fork, whose clock
+stops). Nothing sleeps: a scenario runs on a `Simulation` clock with an
+explicit `now`, so thousands of them run in seconds, spread over a process
+pool. Every query is a row of the results,
+written as a Parquet or Arrow file.
+
+    python -m drymulator.scenario scenarios/*.yaml -o results.parquet
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import importlib.resources
+import json
+import os
+from pathlib import Path
+import re
+from typing import Literal, Optional
+
+import pyarrow as pa
+import pyarrow.feather
+import pyarrow.parquet
+from pydantic import field_validator, model_validator
+from sqlmodel import Field, SQLModel
+import yaml
+
+from .library import DEFAULT_TRAJECTORY, TrajectoryLibrary, load_trajectory
+from .simulation import Simulation
+
+# virtual wall-clock time at which every scenario starts
+EPOCH = datetime(2000, 1, 1)
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+SCHEMA = pa.schema(
+    [
+        ("scenario", pa.string()),
+        ("query", pa.string()),
+        ("elapsed_seconds", pa.float64()),
+        ("simulated_seconds", pa.float64()),
+        ("time_seconds", pa.int64()),
+        ("fraction_initial", pa.float64()),
+        ("weight", pa.float64()),
+    ]
+)
+
+
+def parse_duration(value) -> float:
+    """Seconds from a number or a string like `90`, `20m`, `2h` or `1.5d`."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([smhd]?)\s*", str(value))
+    if match is None:
+        raise ValueError(f"invalid duration {value!r}")
+    return float(match[1]) * UNITS[match[2] or "s"]
+
+
+class Step(SQLModel):
+    action: Literal["reset", "pause", "resume", "fast_forward", "wait", "query"]
+    # virtual seconds to wait, or simulated seconds to fast forward
+    seconds: float = Field(default=0.0, ge=0)
+    # reset only, None keeps the current value
+    time_speed: Optional[float] = None
+    trajectory: Optional[str] = None
+    # name of the query in the results
+    label: Optional[str] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def shorthand(cls, data):
+        """Accept `pause`, `wait: 2h` and `query: label` as well as mappings."""
+        if isinstance(data, str):
+            return {"action": data}
+        if isinstance(data, dict) and len(data) == 1 and "action" not in data:
+            ((action, value),) = data.items()
+            if isinstance(value, dict):
+                return {"action": action, **value}
+            if value is None:
+                return {"action": action}
+            if action == "query":
+                return {"action": action, "label": str(value)}
+            return {"action": action, "seconds": value}
+        return data
+
+    @field_validator("seconds", mode="before")
+    @classmethod
+    def duration(cls, value):
+        return parse_duration(value)
+
+
+class Scenario(SQLModel):
+    name: str
+    trajectory: str = DEFAULT_TRAJECTORY
+    time_speed: float = 10.0
+    steps: list[Step]
+
+
+def load_scenarios(path) -> list[Scenario]:
+    """Scenarios of a YAML or JSON file, holding one scenario or a list.
+
+    Scenarios without a name are named after the file (and their position).
+    """
+    path = Path(path)
+    with path.open() as file:
+        data = json.load(file) if path.suffix == ".json" else yaml.safe_load(file)
+    if isinstance(data, dict):
+        data = [data]
+    scenarios = []
+    for position, scenario in enumerate(data):
+        if "name" not in scenario:
+            name = path.stem if len(data) == 1 else f"{path.stem}[{position}]"
+            scenario = {**scenario, "name": name}
+        scenarios.append(Scenario.model_validate(scenario))
+    return scenarios
+
+
+def default_library(
+    directory: Optional[str] = None, memory_budget: int = 512 * 2**20
+) -> TrajectoryLibrary:
+    """Library with the bundled test data pinned as the default trajectory."""
+    library = TrajectoryLibrary(directory, memory_budget)
+    with importlib.resources.as_file(
+        importlib.resources.files("drymulator") / "test_data.csv"
+    ) as path:
+        library.pin(DEFAULT_TRAJECTORY, load_trajectory(path))
+    return library
+
+
+def run_scenario(scenario: Scenario, library: TrajectoryLibrary) -> list[tuple]:
+    """Replay a scenario, returns one row (in `SCHEMA` order) per query."""
+
+    def trajectory(name):
+        try:
+            return library.get(name)
+        except KeyError:
+            raise ValueError(
+                f"Scenario {scenario.name}: unknown trajectory {name}"
+            ) from None
+
+    now = EPOCH
+    simulation = Simulation(
+        trajectory(scenario.trajectory),
+        scenario.trajectory,
+        anchor_time=now,
+        time_speed=scenario.time_speed,
+    )
+    rows = []
+    for position, step in enumerate(scenario.steps):
+        if step.action == "wait":
+            now += timedelta(seconds=step.seconds)
+        elif step.action == "reset":
+            name = step.trajectory or simulation.trajectory_name
+            simulation = Simulation(
+                trajectory(name),
+                name,
+                anchor_time=now,
+                time_speed=step.time_speed or simulation.time_speed,
+            )
+        elif step.action == "pause":
+            simulation.pause(now)
+        elif step.action == "resume":
+            if not simulation.is_active:
+                # the clock ran on since the pause, as the live one does
+                paused = (now - simulation.anchor_time).total_seconds()
+                simulation.fast_forward(paused * simulation.time_speed)
+            simulation.resume(now)
+        elif step.action == "fast_forward":
+            simulation.fast_forward(step.seconds)
+        else:
+            state = simulation.current_state(now)
+            rows.append(
+                (
+                    scenario.name,
+                    step.label or f"step-{position}",
+                    (now - EPOCH).total_seconds(),
+                    simulation.simulated_seconds(now),
+                    state.time_seconds,
+                    state.fraction_initial,
+                    state.weight,
+                )
+            )
+    return rows
+
+
+# library of a worker process, loaded once by `_init_worker`
+_library: Optional[TrajectoryLibrary] = None
+
+
+def _init_worker(directory: Optional[str]):
+    global _library
+    _library = default_library(directory)
+
+
+def _run_chunk(scenarios: list[Scenario]) -> list[tuple]:
+    return [row for scenario in scenarios for row in run_scenario(scenario, _library)]
+
+
+def run_scenarios(
+    scenarios: list[Scenario],
+    trajectory_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> pa.Table:
+    """Run scenarios over `workers` processes (all cores by default).
+
+    Scenarios are sent to the workers in chunks, so the cost of a task is
+    shared by many scenarios; with a single worker they run in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(scenarios) <= 1:
+        _init_worker(trajectory_dir)
+        rows = _run_chunk(scenarios)
+    else:
+        size = max(1, len(scenarios) // (workers * 4))
+        chunks = [scenarios[i : i + size] for i in range(0, len(scenarios), size)]
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(trajectory_dir,)
+        ) as executor:
+            rows = [row for chunk in executor.map(_run_chunk, chunks) for row in chunk]
+    columns = zip(*rows) if rows else [()] * len(SCHEMA)
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, SCHEMA)],
+        schema=SCHEMA,
+    )
+
+
+def write_results(table: pa.Table, path):
+    """Write the results as Parquet, or Arrow IPC for `.arrow` and `.feather`."""
+    path = Path(path)
+    if path.suffix in (".arrow", ".feather"):
+        pyarrow.feather.write_feather(table, path)
+    else:
+        pyarrow.parquet.write_table(table, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="YAML or JSON scenario files")
+    parser.add_argument("-o", "--output", default="results.parquet")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--trajectory-dir", default=None)
+    args = parser.parse_args(argv)
+
+    scenarios = [scenario for path in args.files for scenario in load_scenarios(path)]
+    table = run_scenarios(scenarios, args.trajectory_dir, args.workers)
+    write_results(table, args.output)
+    print(f"{len(scenarios)} scenarios, {table.num_rows} queries -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
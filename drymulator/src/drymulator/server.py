@@ -1,59 +1,166 @@
+import asyncio
 from contextlib import asynccontextmanager
-from typing import Optional
+import logging
+import time
+from typing import Literal, Optional
 
-from fastapi import FastAPI, Depends
-from sqlmodel import Field, Session, SQLModel, create_engine, func, select, delete
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlmodel import Session, SQLModel, create_engine, func, select, delete, insert
 from datetime import datetime
 import csv
 import importlib.resources
 from pydantic_settings import BaseSettings
+import numpy as np
+
+from .models import (
+    BatchCreate,
+    BatchPublic,
+    CommandCreate,
+    CommandResult,
+    Config,
+    ConfigChange,
+    ConfigCreate,
+    ConfigPublic,
+    CurrentState,
+    EnsemblePublic,
+    EstimatePublic,
+    FleetDryerPublic,
+    FleetGroupPublic,
+    FleetMetric,
+    FaultCreate,
+    ForecastPublic,
+    FaultPublic,
+    ForkPublic,
+    HistoryState,
+    IngestPublic,
+    Reading,
+    ReadingCreate,
+    RuleCreate,
+    RulePublic,
+    SimilarRunPublic,
+    StatePublic,
+    TrajectoryPublic,
+)
+from . import checkpoint
+from .anomaly import AnomalyDetector
+from .ensemble import run_ensemble
+from .estimation import MoistureFilter
+from .export import (
+    COMMANDS_SCHEMA,
+    MEDIA_TYPES,
+    READINGS_SCHEMA,
+    STATES_SCHEMA,
+    TRAJECTORY_SCHEMA,
+    ExportFormat,
+    row_batches,
+    served_batches,
+    stream_batches,
+    trajectory_batches,
+)
+from .faults import FaultInjectionMiddleware, FaultInjector
+from .fleet import Fleet
+from .hub import StateHub
+from .forecast import Forecasts, end_seconds, forecast
+from .library import DEFAULT_TRAJECTORY, TrajectoryLibrary
+from .live import LiveDryers
+from .profiling import ProfilingMiddleware
+from .rules import RuleEngine
+from .simulation import ForkLimitError, Simulation, SimulationRegistry
+from .similar import SimilarityIndex
+from .singleflight import SingleFlight
+from .trajectory import SAMPLE_DTYPE, Trajectory, state_json
 
 
 # automatically loads settings from the enviroment variables
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./test.db"
+    max_forks: int = 1000
+    # how often (in real seconds) the rules are evaluated
+    tick_seconds: float = 1.0
+    # write a folded-stack profile of sampled requests to this directory,
+    # requests with an X-Profile header and, if set, every Nth request
+    profile_dir: Optional[str] = None
+    profile_every: int = 0
+    # library of named trajectories (csv or npz files), and how much memory
+    # the loaded ones can take before the least recently used are evicted
+    trajectory_dir: str = "trajectories"
+    trajectory_memory_mb: float = 512
+    # faults (latency, errors, stale readings, dropouts) injected from the
+    # start, more can be added with POST /faults; the seed makes them
+    # reproducible
+    fault_file: Optional[str] = None
+    fault_seed: Optional[int] = None
+    # readings from POST /ingest are stored every `ingest_flush_seconds`, or
+    # as soon as `ingest_buffer_size` are pending
+    ingest_flush_seconds: float = 1.0
+    ingest_buffer_size: int = 10_000
+    # sensor-backed dryer served when no dryer_id is given, so that clients
+    # of the live simulation read the real dryer without changes
+    live_dryer_id: Optional[str] = None
+    # Kalman filter of the readings: noise of a weight reading and spectral
+    # density of the changes of the drying rate (weight per second)
+    kalman_weight_sigma: float = 0.5
+    kalman_rate_noise: float = 1e-10
+    # anomalies of the readings: z-score of the drying rate beyond which a
+    # reading is a spike, and weight change per hour beyond which it is a jump
+    anomaly_z_threshold: float = 6.0
+    anomaly_max_rate: float = 300.0
+    # fleet states streamed by /fleet/stream every `hub_tick_seconds`, a
+    # subscriber more than `hub_max_frames` behind gets a snapshot instead
+    hub_tick_seconds: float = 1.0
+    hub_max_frames: int = 8
+    # forks, tags, rules and sensor-backed dryers are checkpointed to this
+    # file every `checkpoint_seconds` and on shutdown, and restored on start
+    checkpoint_file: Optional[str] = None
+    checkpoint_seconds: float = 5.0
+    # /state/similar compares runs every `similar_step_seconds` of drying, the
+    # library is scanned for new runs at most every `similar_refresh_seconds`
+    similar_step_seconds: float = 600
+    similar_refresh_seconds: float = 60
 
 
 settings = Settings()
 
+logger = logging.getLogger(__name__)
 
-class ConfigBase(SQLModel):
-    start_time: Optional[datetime] = Field(default=datetime.now())
-    time_speed: Optional[float] = Field(default=10.0)
-    is_active: Optional[bool] = Field(default=True)
-
-
-class Config(ConfigBase, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-
-
-class ConfigPublic(ConfigBase):
-    pass
+BINARY = "application/octet-stream"
+BINARY_RESPONSE = {200: {"content": {BINARY: {}}}}
 
+engine = create_engine(settings.database_url)
 
-class ConfigCreate(ConfigBase):
-    pass
+registry = SimulationRegistry(max_forks=settings.max_forks)
 
+library = TrajectoryLibrary(
+    settings.trajectory_dir, int(settings.trajectory_memory_mb * 2**20)
+)
 
-class StateBase(SQLModel):
-    time_seconds: int
-    fraction_initial: float
-    weight: float
+rules = RuleEngine()
 
+live = LiveDryers()
 
-class HistoryState(StateBase, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+estimates = MoistureFilter(settings.kalman_weight_sigma, settings.kalman_rate_noise)
 
+anomalies = AnomalyDetector(
+    z_threshold=settings.anomaly_z_threshold, max_rate=settings.anomaly_max_rate
+)
 
-class CurrentState(StateBase, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
+fleet = Fleet(registry, live, anomalies)
 
+hub = StateHub(fleet, settings.hub_max_frames)
 
-class StatePublic(StateBase):
-    pass
+forecasts = Forecasts()
 
+faults = FaultInjector(settings.fault_seed)
 
-engine = create_engine(settings.database_url)
+checkpoints = (
+    checkpoint.CheckpointWriter(settings.checkpoint_file)
+    if settings.checkpoint_file is not None
+    else None
+)
+if settings.fault_file is not None:
+    faults.load(settings.fault_file)
 
 
 def create_db_and_tables():
@@ -83,14 +190,54 @@ def maybe_create_config(session: Session):
     session.commit()
 
 
-def reset_current_state(session: Session):
+def reset_current_state(session: Session, trajectory: str):
     session.exec(delete(CurrentState))
-    state = CurrentState.model_validate(
-        session.exec(select(HistoryState).order_by(HistoryState.time_seconds)).first()
-    )
+    state = CurrentState.model_validate(library.get(trajectory).state(0))
     session.add(state)
 
 
+def log_config_change(
+    session: Session, config: Config, changed_at: Optional[datetime] = None
+):
+    """Append the config to the log, to replay what was served later on."""
+    state = session.exec(select(CurrentState)).one()
+    change = ConfigChange.model_validate(
+        config,
+        update={
+            "id": None,
+            "changed_at": changed_at or datetime.now(),
+            "time_seconds": state.time_seconds,
+        },
+    )
+    session.add(change)
+
+
+def live_version(session: Session) -> int:
+    """Version of the live simulation, the id of its latest config change."""
+    return session.exec(select(func.max(ConfigChange.id))).one()
+
+
+def reset_live(
+    session: Session, config: ConfigCreate, changed_at: Optional[datetime] = None
+) -> Config:
+    session.exec(delete(Config))
+    config = Config.model_validate(config)
+    session.add(config)
+    reset_current_state(session, config.trajectory)
+    log_config_change(session, config, changed_at)
+    return config
+
+
+def set_live_active(
+    session: Session, is_active: bool, changed_at: Optional[datetime] = None
+) -> Config:
+    config = session.exec(select(Config)).one()
+    config.is_active = is_active
+    session.add(config)
+    log_config_change(session, config, changed_at)
+    return config
+
+
 def init_state_config(session: Session):
     config = session.exec(select(Config)).first()
     if not config:
@@ -98,7 +245,10 @@ def init_state_config(session: Session):
         session.add(config)
     state = session.exec(select(CurrentState)).first()
     if not state:
-        reset_current_state(session)
+        reset_current_state(session, config.trajectory)
+    if not session.exec(select(ConfigChange.id)).first():
+        # the config has been in effect since it started, at most
+        log_config_change(session, config, min(config.start_time, datetime.now()))
     session.commit()
 
 
@@ -106,97 +256,983 @@ def init_state_config(session: Session):
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     with Session(engine) as session:
-        maybe_create_config(session)
         read_state_test_data(session)
+        # every simulation replaying it shares this single copy in memory
+        library.pin(DEFAULT_TRAJECTORY, Trajectory.from_session(session))
+        if checkpoints is not None:
+            restore_checkpoint(session)
+        maybe_create_config(session)
         init_state_config(session)
+    tasks = [
+        asyncio.create_task(tick_rules()),
+        asyncio.create_task(tick_hub()),
+        asyncio.create_task(tick_readings()),
+    ]
+    if checkpoints is not None:
+        tasks.append(asyncio.create_task(tick_checkpoints()))
     yield
+    for task in tasks:
+        task.cancel()
+    write_readings(live.drain())
+    if checkpoints is not None:
+        checkpoints.write(take_checkpoint(), time.monotonic())
 
 
-def update_current_state(session: Session) -> CurrentState:
+def update_current_state(
+    session: Session, actual_time: Optional[datetime] = None
+) -> CurrentState:
     config = session.exec(select(Config)).one()
     current_state = session.exec(select(CurrentState)).one()
     if not config.is_active:
         return current_state
 
-    actual_time = datetime.now()
+    actual_time = actual_time or datetime.now()
     diff_seconds = (actual_time - config.start_time).total_seconds() * config.time_speed
-    target_state = session.exec(
-        select(HistoryState).order_by(
-            func.abs(HistoryState.time_seconds - diff_seconds)
-        )
-    ).first()
+    target_state = library.get(config.trajectory).state_at(diff_seconds)
+    if target_state.time_seconds == current_state.time_seconds:
+        return current_state
 
     # update current state, don't create a new one
     current_state.time_seconds = target_state.time_seconds
     current_state.fraction_initial = target_state.fraction_initial
     current_state.weight = target_state.weight
 
-    session.add(target_state)
+    session.add(current_state)
     session.commit()
     return current_state
 
 
+current_state_flights = SingleFlight()
+
+
+def current_state_key(config: Config, actual_time: datetime) -> tuple:
+    """Requests with the same key resolve to the same current state."""
+    clock = (config.start_time, config.time_speed, config.trajectory)
+    if not config.is_active:
+        return (*clock, None)
+    diff_seconds = (actual_time - config.start_time).total_seconds() * config.time_speed
+    return (*clock, library.get(config.trajectory).nearest_index(diff_seconds))
+
+
+def current_state_sample(actual_time: datetime) -> tuple[Trajectory, int]:
+    """Trajectory and index of the current state, updating it if needed."""
+    with Session(engine) as session:
+        state = update_current_state(session, actual_time)
+        config = session.exec(select(Config)).one()
+        trajectory = library.get(config.trajectory)
+        return trajectory, trajectory.nearest_index(state.time_seconds)
+
+
+def sample_response(trajectory: Trajectory, index: int, request: Request) -> Response:
+    """Pre-encoded sample of the trajectory, as JSON or binary if accepted."""
+    if BINARY in request.headers.get("accept", ""):
+        return Response(trajectory.binary(index), media_type=BINARY)
+    return Response(trajectory.json(index), media_type="application/json")
+
+
+def state_response(state: StatePublic, request: Request) -> Response:
+    """A state that is not in a trajectory, as JSON or binary if accepted."""
+    if BINARY in request.headers.get("accept", ""):
+        record = np.array(
+            [(state.time_seconds, state.fraction_initial, state.weight)],
+            dtype=SAMPLE_DTYPE,
+        )
+        return Response(record.tobytes(), media_type=BINARY)
+    return Response(state_json(state), media_type="application/json")
+
+
+def get_trajectory(name: str) -> Trajectory:
+    try:
+        return library.get(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown trajectory {name}")
+
+
+async def fetch_trajectory(name: str) -> Trajectory:
+    """Like get_trajectory, but a cold load runs in a worker thread."""
+    trajectory = library.cached(name)
+    if trajectory is None:
+        trajectory = await run_in_threadpool(get_trajectory, name)
+    return trajectory
+
+
+# --- Forks ---
+
+
+def live_simulation(session: Session) -> Simulation:
+    """Snapshot of the live simulation clock, used as the parent of a fork."""
+    config = session.exec(select(Config)).one()
+    trajectory = library.get(config.trajectory)
+    if config.is_active:
+        return Simulation(
+            trajectory,
+            config.trajectory,
+            config.start_time,
+            0.0,
+            config.time_speed,
+            True,
+        )
+    # when paused the live simulation keeps serving the last current state
+    state = session.exec(select(CurrentState)).one()
+    return Simulation(
+        trajectory,
+        config.trajectory,
+        datetime.now(),
+        state.time_seconds,
+        config.time_speed,
+        False,
+    )
+
+
+def get_fork(dryer_id: str) -> Simulation:
+    simulation = registry.get(dryer_id)
+    if simulation is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dryer {dryer_id}")
+    return simulation
+
+
+def dryer_version(
+    session: Session, staged: dict[str, Simulation], dryer_id: Optional[str]
+) -> Optional[int]:
+    """Version of a dryer with the staged changes, None if unknown."""
+    if dryer_id is None:
+        return live_version(session)
+    simulation = staged.get(dryer_id) or registry.get(dryer_id)
+    return None if simulation is None else simulation.version
+
+
+def apply_command(
+    session: Session,
+    staged: dict[str, Simulation],
+    command: CommandCreate,
+    now: datetime,
+) -> CommandResult:
+    """Apply a command of a batch to a staged copy of the fork, or to the
+    session for the live simulation; raises before changing anything."""
+    dryer_id = command.dryer_id
+    simulation = None
+    if dryer_id is not None:
+        simulation = staged.get(dryer_id) or get_fork(dryer_id).copy()
+    version = dryer_version(session, staged, dryer_id)
+    if command.expected_version not in (None, version):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Dryer {dryer_id or 'live'} is at version {version}, "
+            f"not {command.expected_version}",
+        )
+    if command.command == "reset":
+        if command.config is None:
+            raise HTTPException(status_code=422, detail="A reset needs a config")
+        if command.config.trajectory not in library:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Unknown trajectory {command.config.trajectory}",
+            )
+    elif command.command == "fast_forward":
+        if simulation is None:
+            raise HTTPException(
+                status_code=422, detail="Only forks can be fast-forwarded"
+            )
+        if command.seconds is None:
+            raise HTTPException(status_code=422, detail="A fast-forward needs seconds")
+    result = CommandResult(dryer_id=dryer_id, command=command.command, status_code=200)
+
+    if simulation is None:
+        if command.command == "reset":
+            config = reset_live(session, command.config, now)
+        else:
+            config = set_live_active(session, command.command == "resume", now)
+        result.version = live_version(session)
+        result.config = ConfigPublic.model_validate(config)
+        return result
+    if command.command == "reset":
+        simulation.reset(command.config, library.get(command.config.trajectory))
+    elif command.command == "pause":
+        simulation.pause(now)
+    elif command.command == "resume":
+        simulation.resume(now)
+    else:
+        simulation.fast_forward(command.seconds)
+    staged[dryer_id] = simulation
+    result.version = simulation.version
+    result.config = simulation.config()
+    return result
+
+
+# --- Live dryers ---
+
+
+def write_readings(rows: list[dict]):
+    if rows:
+        with Session(engine) as session:
+            session.exec(insert(Reading), params=rows)
+            session.commit()
+
+
+async def flush_readings():
+    await run_in_threadpool(write_readings, live.drain())
+
+
+async def tick_readings():
+    while True:
+        await asyncio.sleep(settings.ingest_flush_seconds)
+        try:
+            await flush_readings()
+        except Exception:
+            logger.exception("failed to store the readings")
+
+
+def reading_at(dryer_id: str, seconds: int) -> StatePublic:
+    """Stored reading of a dryer closest to `seconds`, the earlier on ties."""
+    with Session(engine) as session:
+        readings = select(Reading).where(Reading.dryer_id == dryer_id)
+        before = session.exec(
+            readings.where(Reading.time_seconds <= seconds)
+            .order_by(Reading.time_seconds.desc())
+            .limit(1)
+        ).first()
+        after = session.exec(
+            readings.where(Reading.time_seconds > seconds)
+            .order_by(Reading.time_seconds)
+            .limit(1)
+        ).first()
+    closest = before
+    if after is not None and (
+        before is None or after.time_seconds - seconds < seconds - before.time_seconds
+    ):
+        closest = after
+    return StatePublic.model_validate(closest)
+
+
+# --- Checkpoints ---
+
+
+def take_checkpoint() -> dict[str, np.ndarray]:
+    with Session(engine) as session:
+        config = ConfigPublic.model_validate(session.exec(select(Config)).one())
+        paused_seconds = session.exec(select(CurrentState)).one().time_seconds
+    return checkpoint.take(
+        registry,
+        fleet.tags,
+        rules,
+        live,
+        estimates,
+        anomalies,
+        config,
+        paused_seconds,
+    )
+
+
+async def tick_checkpoints():
+    while True:
+        await asyncio.sleep(settings.checkpoint_seconds)
+        try:
+            arrays, taken = take_checkpoint(), time.monotonic()
+            await run_in_threadpool(checkpoints.write, arrays, taken)
+        except Exception:
+            logger.exception("failed to write a checkpoint")
+
+
+def restore_checkpoint(session: Session):
+    data = checkpoint.load(settings.checkpoint_file)
+    if data is None:
+        return
+    saved = checkpoint.session(data)
+    if not session.exec(select(Config)).first():
+        # the database was lost as well, the live simulation carries on
+        config = Config.model_validate(ConfigCreate.model_validate(saved["config"]))
+        trajectory = library.get(config.trajectory)
+        state = trajectory.state_at(saved["paused_seconds"])
+        session.add(config)
+        session.add(CurrentState.model_validate(state))
+        # in effect from now: what was served before the restart is unknown
+        log_config_change(session, config, datetime.now())
+        session.commit()
+    forks = checkpoint.restore(
+        data, registry, library, fleet.tags, rules, live, estimates, anomalies
+    )
+    refit_forecasts(session)
+    logger.info("restored %d forks from %s", forks, settings.checkpoint_file)
+
+
+def refit_forecasts(session: Session):
+    """Fit the sensor-backed dryers again on their stored readings, the fits
+    are not part of a checkpoint."""
+    rows = session.exec(select(Reading).order_by(Reading.time_seconds)).all()
+    forecasts.observe(
+        [ReadingCreate.model_validate(row) for row in rows if row.dryer_id in live]
+    )
+
+
+# --- Rules ---
+
+
+def evaluate_rules():
+    """Feed the current state of every dryer with rules to the rule engine."""
+    with Session(engine) as session:
+        for dryer_id in rules.dryer_ids():
+            if dryer_id is None:
+                state = live_simulation(session).current_state()
+            elif (simulation := registry.get(dryer_id)) is not None:
+                state = simulation.current_state()
+            elif (state := live.get(dryer_id)) is None:
+                continue
+            rules.publish(rules.update(dryer_id, state))
+
+
+async def tick_rules():
+    while True:
+        await asyncio.sleep(settings.tick_seconds)
+        try:
+            evaluate_rules()
+        except Exception:
+            logger.exception("failed to evaluate the rules")
+
+
+async def tick_hub():
+    while True:
+        await asyncio.sleep(settings.hub_tick_seconds)
+        try:
+            hub.tick(datetime.now().timestamp())
+        except Exception:
+            logger.exception("failed to publish the fleet states")
+
+
 # --- FastAPI App ---
 
 app = FastAPI(lifespan=lifespan)
 
+app.add_middleware(
+    FaultInjectionMiddleware,
+    injector=faults,
+    # faults can always be removed, and streams are not responses to replay
+    skip_paths=["/faults", "/events", "/fleet/stream"],
+)
+
+if settings.profile_dir is not None:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.profile_dir,
+        every=settings.profile_every,
+        # streams never end, there would be no profile to write
+        skip_paths=["/events", "/fleet/stream"],
+    )
+
 
 @app.post("/command/reset")
 async def config(
     config: ConfigCreate,
+    dryer_id: Optional[str] = None,
     session: Session = Depends(get_session),
 ) -> ConfigPublic:
-    session.exec(delete(Config))
-    config = Config.model_validate(config)
-    session.add(config)
-    reset_current_state(session)
+    trajectory = await fetch_trajectory(config.trajectory)
+    if dryer_id is not None:
+        simulation = get_fork(dryer_id)
+        simulation.reset(config, trajectory)
+        registry.sync(dryer_id)
+        return simulation.config()
+    config = reset_live(session, config)
     session.commit()
     return ConfigPublic.model_validate(config)
 
 
 @app.post("/command/pause")
-async def pause(session: Session = Depends(get_session)) -> ConfigPublic:
-    config = session.exec(select(Config)).one()
-    config.is_active = False
-    session.add(config)
+async def pause(
+    dryer_id: Optional[str] = None, session: Session = Depends(get_session)
+) -> ConfigPublic:
+    if dryer_id is not None:
+        simulation = get_fork(dryer_id)
+        simulation.pause()
+        registry.sync(dryer_id)
+        return simulation.config()
+    config = set_live_active(session, False)
     session.commit()
     return ConfigPublic.model_validate(config)
 
 
 @app.post("/command/resume")
-async def resume(session: Session = Depends(get_session)) -> ConfigPublic:
-    config = session.exec(select(Config)).one()
-    config.is_active = True
-    session.add(config)
+async def resume(
+    dryer_id: Optional[str] = None, session: Session = Depends(get_session)
+) -> ConfigPublic:
+    if dryer_id is not None:
+        simulation = get_fork(dryer_id)
+        simulation.resume()
+        registry.sync(dryer_id)
+        return simulation.config()
+    config = set_live_active(session, True)
     session.commit()
     return ConfigPublic.model_validate(config)
 
 
-@app.get("/state/current")
-async def current_state(session: Session = Depends(get_session)) -> StatePublic:
-    state = update_current_state(session)
-    return StatePublic.model_validate(state)
+@app.post("/command/batch")
+async def batch(
+    batch: BatchCreate, response: Response, session: Session = Depends(get_session)
+) -> BatchPublic:
+    """Apply a list of commands to forks and the live simulation, in order.
+
+    The commands of forks are applied to copies of their clocks and those of
+    the live simulation in a single transaction, then the copies replace the
+    clocks with no await in between: no request sees part of a batch. A
+    command with an `expected_version` fails with 409 if its dryer has been
+    changed since. If a command of an `atomic` batch fails none is applied,
+    and the batch answers with the status code of the first failure.
+    """
+    # load the trajectories of the resets beforehand, off the event loop, and
+    # keep them referenced so that none is evicted before it is applied
+    loading = [
+        fetch_trajectory(command.config.trajectory)
+        for command in batch.commands
+        if command.config is not None and command.config.trajectory in library
+    ]
+    _trajectories = await asyncio.gather(*loading)
+    now = datetime.now()
+    staged: dict[str, Simulation] = {}
+    results = []
+    for command in batch.commands:
+        try:
+            results.append(apply_command(session, staged, command, now))
+        except HTTPException as e:
+            results.append(
+                CommandResult(
+                    dryer_id=command.dryer_id,
+                    command=command.command,
+                    status_code=e.status_code,
+                    detail=e.detail,
+                    version=dryer_version(session, staged, command.dryer_id),
+                )
+            )
+    failed = [result for result in results if result.status_code != 200]
+    if batch.atomic and failed:
+        session.rollback()
+        for result in results:
+            # as if the batch had not been sent
+            result.version = dryer_version(session, {}, result.dryer_id)
+            if result.status_code == 200:
+                result.status_code = 424
+                result.detail = "Not applied, another command of the batch failed"
+                result.config = None
+        response.status_code = failed[0].status_code
+        return BatchPublic(applied=False, results=results)
+    session.commit()
+    for dryer_id, simulation in staged.items():
+        registry.simulations[dryer_id] = simulation
+        registry.sync(dryer_id)
+    return BatchPublic(applied=not failed, results=results)
+
+
+@app.post("/command/fork")
+async def fork(
+    dryer_id: Optional[str] = None,
+    fork_id: Optional[str] = None,
+    session: Session = Depends(get_session),
+) -> ForkPublic:
+    """Fork the live simulation (or another fork) into an independent one.
+
+    The fork shares the trajectory with its parent, only its clock is copied.
+    Its id is random unless given as `fork_id` (e.g. by the router, to place
+    it on this node).
+    """
+    parent = live_simulation(session) if dryer_id is None else get_fork(dryer_id)
+    if fork_id is not None and (fork_id in registry or fork_id in live):
+        raise HTTPException(status_code=409, detail=f"Dryer {fork_id} already exists")
+    try:
+        fork_id = registry.add_fork(parent, parent_id=dryer_id, dryer_id=fork_id)
+    except ForkLimitError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return registry.public(fork_id)
+
+
+@app.delete("/command/fork")
+async def discard_fork(dryer_id: str) -> ForkPublic:
+    get_fork(dryer_id)
+    fork = registry.public(dryer_id)
+    registry.remove(dryer_id)
+    fleet.tags.pop(dryer_id, None)
+    forecasts.remove(dryer_id)
+    rules.remove_dryer(dryer_id)
+    return fork
+
+
+@app.post("/command/fast_forward")
+async def fast_forward(dryer_id: str, seconds: float) -> ForkPublic:
+    """Move the clock of a fork forward by `seconds` of simulated time."""
+    get_fork(dryer_id).fast_forward(seconds)
+    registry.sync(dryer_id)
+    return registry.public(dryer_id)
+
+
+@app.get("/state/current", response_model=StatePublic, responses=BINARY_RESPONSE)
+async def current_state(request: Request, dryer_id: Optional[str] = None):
+    """Current state of the simulation.
+
+    Concurrent requests for the same simulated time share a single lookup
+    and commit. The state is served pre-encoded, as a 24 bytes record
+    (int64 time_seconds, float64 fraction_initial, float64 weight) if the
+    request accepts application/octet-stream. For a sensor-backed dryer it is
+    its latest reading, with the anomalies of its latest batch of readings.
+    """
+    dryer_id = dryer_id or settings.live_dryer_id
+    if dryer_id is not None:
+        if (state := live.get(dryer_id)) is not None:
+            state.anomalies = anomalies.anomalies(dryer_id)
+            return state_response(state, request)
+        simulation = get_fork(dryer_id)
+        return sample_response(
+            simulation.trajectory, simulation.current_index(), request
+        )
+    actual_time = datetime.now()
+    # don't hold a connection while waiting, the shared lookup needs one
+    with Session(engine) as session:
+        config = session.exec(select(Config)).one()
+    await fetch_trajectory(config.trajectory)
+    trajectory, index = await current_state_flights.do(
+        current_state_key(config, actual_time),
+        run_in_threadpool,
+        current_state_sample,
+        actual_time,
+    )
+    return sample_response(trajectory, index, request)
 
 
 # need to find a better name for this
-@app.get("/state/time")
+@app.get("/state/time", response_model=StatePublic, responses=BINARY_RESPONSE)
 async def state_time(
-    second_after: int, session: Session = Depends(get_session)
-) -> StatePublic:
-    state = session.exec(
-        select(HistoryState).order_by(
-            func.abs(HistoryState.time_seconds - second_after)
-        )
+    second_after: int,
+    request: Request,
+    trajectory: Optional[str] = None,
+    dryer_id: Optional[str] = None,
+):
+    """Sample of a trajectory, by default the one of the live simulation.
+
+    With the `dryer_id` of a sensor-backed dryer, its closest reading.
+    """
+    if trajectory is None and dryer_id is None:
+        dryer_id = settings.live_dryer_id
+    if dryer_id is not None:
+        if dryer_id not in live:
+            raise HTTPException(status_code=404, detail=f"Unknown dryer {dryer_id}")
+        await flush_readings()
+        state = await run_in_threadpool(reading_at, dryer_id, second_after)
+        return state_response(state, request)
+    if trajectory is None:
+        with Session(engine) as session:
+            trajectory = session.exec(select(Config.trajectory)).one()
+    trajectory = await fetch_trajectory(trajectory)
+    return sample_response(trajectory, trajectory.nearest_index(second_after), request)
+
+
+@app.get("/state/at", response_model=StatePublic, responses=BINARY_RESPONSE)
+async def state_at(
+    wallclock: datetime, request: Request, session: Session = Depends(get_session)
+):
+    """State the live simulation served at a past wall-clock time.
+
+    It is replayed from the log of config changes (resets, pauses and
+    resumes): the last change before `wallclock` and the elapsed time are
+    enough to find the sample, so a late reader gets the value that was
+    current at `wallclock` rather than the one current now.
+    """
+    if wallclock.tzinfo is not None:
+        wallclock = wallclock.astimezone().replace(tzinfo=None)
+    if wallclock > datetime.now():
+        raise HTTPException(status_code=422, detail=f"{wallclock} is in the future")
+    change = session.exec(
+        select(ConfigChange)
+        .where(ConfigChange.changed_at <= wallclock)
+        .order_by(ConfigChange.changed_at.desc(), ConfigChange.id.desc())
     ).first()
-    return state
+    if change is None:
+        raise HTTPException(status_code=404, detail=f"No state served at {wallclock}")
+    trajectory = await fetch_trajectory(change.trajectory)
+    seconds = change.time_seconds
+    if change.is_active:
+        seconds = (wallclock - change.start_time).total_seconds() * change.time_speed
+    return sample_response(trajectory, trajectory.nearest_index(seconds), request)
+
+
+@app.get("/state/estimate")
+async def state_estimate(dryer_id: Optional[str] = None) -> EstimatePublic:
+    """Kalman-filtered weight, moisture and drying rate of a sensor-backed dryer.
+
+    With the anomalies (spike, stall or jump) of its latest batch of readings.
+    """
+    dryer_id = dryer_id or settings.live_dryer_id
+    estimate = estimates.estimate(dryer_id) if dryer_id is not None else None
+    if estimate is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dryer {dryer_id}")
+    estimate.anomalies = anomalies.anomalies(dryer_id) or []
+    return estimate
+
+
+@app.get("/state/forecast")
+async def state_forecast(
+    horizon: Optional[float] = Query(default=None, gt=0),
+    steps: int = Query(default=100, ge=2, le=1000),
+    dryer_id: Optional[str] = None,
+    session: Session = Depends(get_session),
+) -> ForecastPublic:
+    """Predicted weight and fraction initial for the next `horizon` seconds.
+
+    The prediction comes from a Page model fitted on the samples observed so
+    far, kept per dryer and updated with the new samples only. By default it
+    covers the rest of the run, until the moisture ratio reaches 1%.
+    """
+    dryer_id = dryer_id or settings.live_dryer_id
+    if dryer_id is not None and dryer_id in live:
+        fit = forecasts.fit(dryer_id)
+        start_seconds = live.get(dryer_id).time_seconds
+    else:
+        simulation = (
+            get_fork(dryer_id) if dryer_id is not None else live_simulation(session)
+        )
+        index = simulation.current_index()
+        fit = forecasts.follow(dryer_id, simulation.trajectory, index)
+        start_seconds = float(simulation.trajectory.time_seconds[index])
+    model = None if fit is None else fit.model()
+    if model is None:
+        raise HTTPException(
+            status_code=409, detail=f"Not enough samples to forecast {dryer_id}"
+        )
+    if horizon is None:
+        horizon = max(end_seconds(model) - start_seconds, 0) or 3600
+    return forecast(model, start_seconds, horizon, steps)
+
+
+similar = SimilarityIndex(settings.similar_step_seconds)
+
+similar_flights = SingleFlight()
+
+
+def scan_similar():
+    similar.update(library.names(), library.samples)
+
+
+async def update_similar():
+    """Index the new runs of the library, when it was not scanned recently."""
+    if time.monotonic() - similar.updated_at < settings.similar_refresh_seconds:
+        return
+    await similar_flights.do("scan", run_in_threadpool, scan_similar)
+
+
+def read_readings(dryer_id: str) -> tuple[np.ndarray, np.ndarray]:
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Reading.time_seconds, Reading.fraction_initial)
+            .where(Reading.dryer_id == dryer_id)
+            .order_by(Reading.time_seconds)
+        ).all()
+    return np.array([row[0] for row in rows]), np.array([row[1] for row in rows])
+
+
+@app.get("/state/similar")
+async def state_similar(
+    k: int = Query(default=10, ge=1, le=1000),
+    dryer_id: Optional[str] = None,
+    session: Session = Depends(get_session),
+) -> list[SimilarRunPublic]:
+    """Past runs of the library that dried the most alike so far, closest first.
+
+    Their remaining time and final fraction initial hint at how the run will
+    finish. A simulation is not compared with the trajectory it replays.
+    """
+    dryer_id = dryer_id or settings.live_dryer_id
+    if dryer_id is not None and dryer_id in live:
+        await flush_readings()
+        time_seconds, fraction_initial = await run_in_threadpool(
+            read_readings, dryer_id
+        )
+        exclude = []
+    else:
+        simulation = (
+            get_fork(dryer_id) if dryer_id is not None else live_simulation(session)
+        )
+        end = simulation.current_index() + 1
+        time_seconds = simulation.trajectory.time_seconds[:end]
+        fraction_initial = simulation.trajectory.fraction_initial[:end]
+        exclude = [simulation.trajectory_name]
+    await update_similar()
+    return similar.query(time_seconds, fraction_initial, k, exclude)
+
+
+def export_rows(statement, schema, batch_size: int):
+    """Rows of a query as record batches, fetched `batch_size` at a time."""
+    with Session(engine) as session:
+        result = session.exec(statement.execution_options(yield_per=batch_size))
+        yield from row_batches(result, schema, batch_size)
+
+
+def export_served(batch_size: int):
+    with Session(engine) as session:
+        changes = session.exec(
+            select(ConfigChange)
+            .order_by(ConfigChange.changed_at, ConfigChange.id)
+            .execution_options(yield_per=batch_size)
+        )
+        yield from served_batches(changes, get_trajectory, datetime.now(), batch_size)
+
+
+@app.get("/export/{table}")
+async def export(
+    table: Literal["trajectory", "states", "commands"],
+    format: ExportFormat = "parquet",
+    trajectory: Optional[str] = None,
+    dryer_id: Optional[str] = None,
+    batch_size: int = Query(default=65_536, ge=1, le=1_000_000),
+) -> StreamingResponse:
+    """Stream a run as Parquet or Arrow IPC, in record batches.
+
+    - `trajectory`: the samples of a trajectory, by default the live one.
+    - `states`: the states served by the live simulation, one row each time
+      it changed, or the readings of a sensor-backed dryer with `dryer_id`.
+    - `commands`: the resets, pauses and resumes of the live simulation.
+
+    Batches are encoded and sent one at a time, so memory does not grow with
+    the length of the run. Both formats load directly with pandas or polars
+    (`pd.read_parquet(url)`, `pl.read_ipc_stream(url)`).
+    """
+    if table == "trajectory":
+        if trajectory is None:
+            with Session(engine) as session:
+                trajectory = session.exec(select(Config.trajectory)).one()
+        schema = TRAJECTORY_SCHEMA
+        batches = trajectory_batches(await fetch_trajectory(trajectory), batch_size)
+    elif table == "commands":
+        schema = COMMANDS_SCHEMA
+        statement = select(*(getattr(ConfigChange, name) for name in schema.names))
+        batches = export_rows(
+            statement.order_by(ConfigChange.changed_at, ConfigChange.id),
+            schema,
+            batch_size,
+        )
+    elif dryer_id is not None:
+        if dryer_id not in live:
+            raise HTTPException(status_code=404, detail=f"Unknown dryer {dryer_id}")
+        await flush_readings()
+        schema = READINGS_SCHEMA
+        statement = select(*(getattr(Reading, name) for name in schema.names))
+        batches = export_rows(
+            statement.where(Reading.dryer_id == dryer_id).order_by(
+                Reading.time_seconds
+            ),
+            schema,
+            batch_size,
+        )
+    else:
+        schema = STATES_SCHEMA
+        batches = export_served(batch_size)
+    extension = "parquet" if format == "parquet" else "arrows"
+    return StreamingResponse(
+        stream_batches(schema, batches, format),
+        media_type=MEDIA_TYPES[format],
+        headers={"content-disposition": f'attachment; filename="{table}.{extension}"'},
+    )
+
+
+@app.get("/trajectories")
+async def trajectories() -> list[TrajectoryPublic]:
+    return library.public()
+
+
+@app.get("/state/ensemble")
+async def ensemble(
+    target_weight: float,
+    n: int = Query(default=1000, ge=1, le=100_000),
+    horizon_seconds: float = Query(default=6 * 3600, gt=0),
+    steps: int = Query(default=100, ge=2, le=1000),
+    k_sigma: float = Query(default=0.1, ge=0),
+    n_sigma: float = Query(default=0.02, ge=0),
+    weight_sigma: float = Query(default=0.02, ge=0),
+    noise_sigma: float = Query(default=0.1, ge=0),
+    seed: Optional[int] = None,
+    dryer_id: Optional[str] = None,
+    session: Session = Depends(get_session),
+) -> EnsemblePublic:
+    """Percentile bands of `n` perturbed runs from the current simulated time.
+
+    The runs perturb the drying kinetics fitted on the trajectory, the initial
+    weight and the sensor noise.
+    """
+    if dryer_id is not None:
+        simulation = get_fork(dryer_id)
+        trajectory = simulation.trajectory
+        start_seconds = simulation.simulated_seconds()
+    else:
+        config = session.exec(select(Config)).one()
+        trajectory = await fetch_trajectory(config.trajectory)
+        start_seconds = update_current_state(session).time_seconds
+    return run_ensemble(
+        trajectory.kinetics,
+        n=n,
+        start_seconds=start_seconds,
+        horizon_seconds=horizon_seconds,
+        steps=steps,
+        target_weight=target_weight,
+        k_sigma=k_sigma,
+        n_sigma=n_sigma,
+        weight_sigma=weight_sigma,
+        noise_sigma=noise_sigma,
+        seed=seed,
+    )
 
 
 @app.get("/state/config")
-async def get_config(session: Session = Depends(get_session)) -> ConfigPublic:
+async def get_config(
+    dryer_id: Optional[str] = None, session: Session = Depends(get_session)
+) -> ConfigPublic:
+    if dryer_id is not None:
+        return get_fork(dryer_id).config()
     config = session.exec(select(Config)).one()
     return ConfigPublic.model_validate(config)
 
 
+@app.post("/ingest")
+async def ingest(readings: list[ReadingCreate]) -> IngestPublic:
+    """Batch of readings of sensor-backed dryers.
+
+    They are the current state of their dryers right away, and are stored
+    in bulk in the background.
+    """
+    live.ingest(readings)
+    estimates.update(readings)
+    anomalies.update(readings)
+    forecasts.observe(readings)
+    if live.pending >= settings.ingest_buffer_size:
+        await flush_readings()
+    return IngestPublic(accepted=len(readings), pending=live.pending)
+
+
+@app.put("/fleet/tags/{dryer_id}")
+async def set_tags(dryer_id: str, tags: dict[str, str]) -> dict[str, str]:
+    """Replace the tags of a fork or sensor-backed dryer (e.g. `{"line": "2"}`)."""
+    if dryer_id not in fleet:
+        raise HTTPException(status_code=404, detail=f"Unknown dryer {dryer_id}")
+    fleet.tags[dryer_id] = tags
+    return tags
+
+
+@app.get("/fleet/dryers")
+async def fleet_dryers(
+    where: list[str] = Query(default=[]),
+    sort_by: FleetMetric = "remaining_seconds",
+    descending: bool = False,
+    k: int = Query(default=100, ge=1, le=10_000),
+    target_fraction: Optional[float] = None,
+) -> list[FleetDryerPublic]:
+    """Top `k` forks and sensor-backed dryers matching the `where` conditions.
+
+    A condition compares a metric with a number (`remaining_seconds<3600`)
+    or a tag with a value (`line=2`). `remaining_seconds` is the real time
+    until the fraction initial reaches `target_fraction`, by default until
+    the end of the trajectory.
+    """
+    try:
+        return fleet.dryers(
+            datetime.now().timestamp(),
+            where,
+            sort_by,
+            descending,
+            k,
+            target_fraction,
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+
+@app.get("/fleet/aggregate")
+async def fleet_aggregate(
+    metric: FleetMetric = "fraction_initial",
+    group_by: Optional[str] = None,
+    where: list[str] = Query(default=[]),
+    target_fraction: Optional[float] = None,
+) -> list[FleetGroupPublic]:
+    """Count, mean, min and max of a metric over the fleet, per `group_by` tag."""
+    try:
+        return fleet.aggregate(
+            datetime.now().timestamp(), metric, group_by, where, target_fraction
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+
+@app.get("/fleet/stream")
+async def fleet_stream(where: list[str] = Query(default=[])):
+    """Server-sent events stream of the states of the matching dryers.
+
+    The first frame is a snapshot, the following ones only have the dryers
+    that changed (or started matching) and the ids of those that stopped
+    matching or were removed. A client that falls behind skips to a new
+    snapshot.
+    """
+    try:
+        subscriber = hub.subscribe(where)
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+
+    async def stream():
+        try:
+            while True:
+                yield await subscriber.frames.get()
+        finally:
+            hub.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/rules")
+async def add_rule(rule: RuleCreate) -> RulePublic:
+    if rule.dryer_id is not None and rule.dryer_id not in live:
+        get_fork(rule.dryer_id)
+    return rules.add(rule)
+
+
+@app.get("/rules")
+async def list_rules(dryer_id: Optional[str] = None) -> list[RulePublic]:
+    return rules.rules(dryer_id)
+
+
+@app.delete("/rules/{rule_id}")
+async def delete_rule(rule_id: int) -> RulePublic:
+    rule = rules.remove(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail=f"Unknown rule {rule_id}")
+    return rule
+
+
+@app.post("/faults")
+async def add_fault(fault: FaultCreate) -> FaultPublic:
+    """Inject latency, errors, stale readings or dropouts in matching requests."""
+    return faults.add(fault)
+
+
+@app.get("/faults")
+async def list_faults() -> list[FaultPublic]:
+    return faults.faults()
+
+
+@app.delete("/faults/{fault_id}")
+async def delete_fault(fault_id: int) -> FaultPublic:
+    fault = faults.remove(fault_id)
+    if fault is None:
+        raise HTTPException(status_code=404, detail=f"Unknown fault {fault_id}")
+    return fault
+
+
+@app.get("/events")
+async def events():
+    """Server-sent events stream of the triggered rules."""
+    queue = rules.subscribe()
+
+    async def stream():
+        try:
+            while True:
+                event = await queue.get()
+                yield f"data: {event.model_dump_json()}\n\n"
+        finally:
+            rules.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
 if __name__ == "__main__":
     import uvicorn
 
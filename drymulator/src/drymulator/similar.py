@@ -0,0 +1,146 @@
+"""Search of the library for the past runs that dried like a partial one.
+
+Every run is indexed by its fraction initial sampled every `step_seconds` of
+elapsed time (held at its last value once the run is over), one row of a
+`runs x steps` float32 matrix. A partial run is sampled on the same grid and
+compared with the same elapsed times of all the runs at once, by the root
+mean square difference over its prefix: a single pass over a few hundred
+columns, milliseconds for thousands of runs. Runs are aligned on the start of
+drying, so no time warping is needed to compare them.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Iterable
+
+import numpy as np
+
+from .models import SimilarRunPublic
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityIndex:
+    """Runs of the library indexed by their sampled fraction initial.
+
+    Only the first `max_steps` steps of a run are indexed, a longer partial
+    run is compared on that prefix.
+    """
+
+    def __init__(self, step_seconds: float = 600, max_steps: int = 1024):
+        self.step_seconds = step_seconds
+        self.max_steps = max_steps
+        self.names: list[str] = []
+        self._rows: dict[str, int] = {}
+        self.features = np.empty((0, 1), dtype=np.float32)
+        self.duration_seconds = np.empty(0)
+        self.final_fraction_initial = np.empty(0)
+        # `time.monotonic` time of the last update
+        self.updated_at = -np.inf
+        # an update swaps the arrays while queries may be reading them
+        self._lock = threading.Lock()
+
+    def _sample(
+        self, time_seconds: np.ndarray, fraction_initial: np.ndarray, steps: int
+    ) -> np.ndarray:
+        grid = np.arange(steps) * self.step_seconds
+        return np.interp(grid, time_seconds, fraction_initial).astype(np.float32)
+
+    def update(
+        self,
+        names: Iterable[str],
+        samples: Callable[[str], tuple[np.ndarray, np.ndarray]],
+    ) -> int:
+        """Index the runs in `names` not indexed yet, drop the others.
+
+        `samples` returns the time and fraction initial of a run, e.g.
+        `TrajectoryLibrary.samples`. Returns the runs added.
+        """
+        names = sorted(names)
+        rows = self._rows
+        loaded = {}
+        for name in names:
+            if name in rows:
+                continue
+            try:
+                time_seconds, fraction_initial = samples(name)
+            except (KeyError, OSError, ValueError):
+                logger.exception("failed to index trajectory %s", name)
+                continue
+            if len(time_seconds):
+                loaded[name] = time_seconds, fraction_initial
+        names = [name for name in names if name in rows or name in loaded]
+        if not loaded and len(names) == len(self.names):
+            self.updated_at = time.monotonic()
+            return 0
+
+        # time and fraction initial at the end of every run
+        ends = np.empty((len(names), 2))
+        for row, name in enumerate(names):
+            if name in loaded:
+                ends[row] = loaded[name][0][-1], loaded[name][1][-1]
+            else:
+                ends[row] = (
+                    self.duration_seconds[rows[name]],
+                    self.final_fraction_initial[rows[name]],
+                )
+        duration_seconds, final_fraction_initial = ends[:, 0], ends[:, 1]
+        steps = int(duration_seconds.max(initial=0) // self.step_seconds) + 1
+        steps = min(steps, self.max_steps)
+        features = np.empty((len(names), steps), dtype=np.float32)
+        for row, name in enumerate(names):
+            if name in loaded:
+                features[row] = self._sample(*loaded[name], steps)
+                continue
+            # rows already indexed only grow, with their final value
+            previous = self.features[rows[name]]
+            width = min(len(previous), steps)
+            features[row, :width] = previous[:width]
+            features[row, width:] = previous[width - 1]
+        with self._lock:
+            self.names = names
+            self._rows = {name: row for row, name in enumerate(names)}
+            self.features = features
+            self.duration_seconds = duration_seconds
+            self.final_fraction_initial = final_fraction_initial
+        self.updated_at = time.monotonic()
+        return len(loaded)
+
+    def query(
+        self,
+        time_seconds: np.ndarray,
+        fraction_initial: np.ndarray,
+        k: int = 10,
+        exclude: Iterable[str] = (),
+    ) -> list[SimilarRunPublic]:
+        """The `k` runs closest to a partial run, closest first."""
+        with self._lock:
+            names, rows, features = self.names, self._rows, self.features
+            duration_seconds = self.duration_seconds
+            final_fraction_initial = self.final_fraction_initial
+        if not len(time_seconds) or not names:
+            return []
+        elapsed = float(time_seconds[-1])
+        steps = min(int(elapsed // self.step_seconds) + 1, features.shape[1])
+        observed = self._sample(time_seconds, fraction_initial, steps)
+        difference = features[:, :steps] - observed
+        distance = np.sqrt(np.einsum("ij,ij->i", difference, difference) / steps)
+        for name in exclude:
+            if name in rows:
+                distance[rows[name]] = np.inf
+        k = min(k, int(np.isfinite(distance).sum()))
+        if k == 0:
+            return []
+        closest = np.argpartition(distance, k - 1)[:k]
+        closest = closest[np.argsort(distance[closest], kind="stable")]
+        return [
+            SimilarRunPublic(
+                name=names[row],
+                distance=float(distance[row]),
+                duration_seconds=float(duration_seconds[row]),
+                remaining_seconds=max(float(duration_seconds[row]) - elapsed, 0),
+                final_fraction_initial=float(final_fraction_initial[row]),
+            )
+            for row in closest
+        ]
@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import uuid
+
+import numpy as np
+
+from .columns import Columns
+from .models import ConfigBase, ConfigPublic, ForkPublic, StatePublic
+from .trajectory import Trajectory
+
+
+class Simulation:
+    """Clock of a simulation replaying a (shared) trajectory.
+
+    The clock is anchored at a wall-clock time: the simulated time is
+    `anchor_seconds` at `anchor_time` and advances by `time_speed` simulated
+    seconds per real second while active. Pausing, resuming and fast-forwarding
+    only move the anchor, so a simulation is a handful of scalars plus a
+    reference to the trajectory. Every change of the clock increments its
+    `version`, for compare-and-set commands.
+    """
+
+    __slots__ = (
+        "trajectory",
+        "trajectory_name",
+        "anchor_time",
+        "anchor_seconds",
+        "time_speed",
+        "is_active",
+        "parent_id",
+        "version",
+    )
+
+    def __init__(
+        self,
+        trajectory: Trajectory,
+        trajectory_name: str,
+        anchor_time: datetime,
+        anchor_seconds: float = 0.0,
+        time_speed: float = 10.0,
+        is_active: bool = True,
+        parent_id: Optional[str] = None,
+        version: int = 0,
+    ):
+        self.trajectory = trajectory
+        self.trajectory_name = trajectory_name
+        self.anchor_time = anchor_time
+        self.anchor_seconds = anchor_seconds
+        self.time_speed = time_speed
+        self.is_active = is_active
+        self.parent_id = parent_id
+        self.version = version
+
+    def simulated_seconds(self, now: Optional[datetime] = None) -> float:
+        if not self.is_active:
+            return self.anchor_seconds
+        now = now or datetime.now()
+        return (
+            self.anchor_seconds
+            + (now - self.anchor_time).total_seconds() * self.time_speed
+        )
+
+    def current_index(self, now: Optional[datetime] = None) -> int:
+        return self.trajectory.nearest_index(self.simulated_seconds(now))
+
+    def current_state(self, now: Optional[datetime] = None) -> StatePublic:
+        return self.trajectory.state(self.current_index(now))
+
+    def config(self) -> ConfigPublic:
+        """Clock expressed as a config, i.e. when the simulated time was zero."""
+        start_time = self.anchor_time
+        if self.time_speed:
+            start_time -= timedelta(seconds=self.anchor_seconds / self.time_speed)
+        return ConfigPublic(
+            start_time=start_time,
+            time_speed=self.time_speed,
+            is_active=self.is_active,
+            trajectory=self.trajectory_name,
+        )
+
+    def reset(self, config: ConfigBase, trajectory: Trajectory):
+        self.trajectory = trajectory
+        self.trajectory_name = config.trajectory
+        self.anchor_time = config.start_time
+        self.anchor_seconds = 0.0
+        self.time_speed = config.time_speed
+        self.is_active = config.is_active
+        self.version += 1
+
+    def pause(self, now: Optional[datetime] = None):
+        if self.is_active:
+            now = now or datetime.now()
+            self.anchor_seconds = self.simulated_seconds(now)
+            self.anchor_time = now
+            self.is_active = False
+            self.version += 1
+
+    def resume(self, now: Optional[datetime] = None):
+        # a clock already running is left as is, version included
+        if not self.is_active:
+            self.anchor_time = now or datetime.now()
+            self.is_active = True
+            self.version += 1
+
+    def fast_forward(self, seconds: float):
+        self.anchor_seconds += seconds
+        self.version += 1
+
+    def copy(self) -> "Simulation":
+        """Same clock, version and parent, to stage changes on."""
+        return Simulation(*(getattr(self, name) for name in self.__slots__))
+
+    def fork(self, parent_id: Optional[str] = None) -> "Simulation":
+        """Child simulation sharing the trajectory but with its own clock."""
+        return Simulation(
+            self.trajectory,
+            self.trajectory_name,
+            self.anchor_time,
+            self.anchor_seconds,
+            self.time_speed,
+            self.is_active,
+            parent_id,
+        )
+
+
+class ForkLimitError(Exception):
+    pass
+
+
+class SimulationRegistry:
+    """Forked simulations, addressed by their dryer id.
+
+    The clocks are also kept in `clocks`, one row per fork, for computations
+    over all forks at once; `sync` has to be called after changing a clock.
+    """
+
+    def __init__(self, max_forks: int):
+        self.max_forks = max_forks
+        self.simulations: dict[str, Simulation] = {}
+        self.clocks = Columns(
+            {
+                # posix timestamp
+                "anchor_time": np.float64,
+                "anchor_seconds": np.float64,
+                "time_speed": np.float64,
+                "is_active": np.bool_,
+                "version": np.int64,
+                "trajectory": object,
+            }
+        )
+
+    def __contains__(self, dryer_id: str) -> bool:
+        return dryer_id in self.simulations
+
+    def __len__(self) -> int:
+        return len(self.simulations)
+
+    def get(self, dryer_id: str) -> Optional[Simulation]:
+        return self.simulations.get(dryer_id)
+
+    def add_fork(
+        self,
+        parent: Simulation,
+        parent_id: Optional[str] = None,
+        dryer_id: Optional[str] = None,
+    ) -> str:
+        if len(self.simulations) >= self.max_forks:
+            raise ForkLimitError(f"at most {self.max_forks} forks can run at once")
+        dryer_id = dryer_id or uuid.uuid4().hex[:12]
+        self.simulations[dryer_id] = parent.fork(parent_id)
+        self.sync(dryer_id)
+        return dryer_id
+
+    def sync(self, dryer_id: str):
+        simulation = self.simulations[dryer_id]
+        self.clocks.set(
+            dryer_id,
+            anchor_time=simulation.anchor_time.timestamp(),
+            anchor_seconds=simulation.anchor_seconds,
+            time_speed=simulation.time_speed,
+            is_active=simulation.is_active,
+            version=simulation.version,
+            trajectory=simulation.trajectory,
+        )
+
+    def remove(self, dryer_id: str) -> Optional[Simulation]:
+        if dryer_id in self.clocks:
+            self.clocks.remove(dryer_id)
+        return self.simulations.pop(dryer_id, None)
+
+    def public(self, dryer_id: str) -> ForkPublic:
+        simulation = self.simulations[dryer_id]
+        return ForkPublic(
+            dryer_id=dryer_id,
+            parent_id=simulation.parent_id,
+            simulated_seconds=simulation.simulated_seconds(),
+            time_speed=simulation.time_speed,
+            is_active=simulation.is_active,
+            version=simulation.version,
+        )
@@ -0,0 +1,25 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Coalesce concurrent calls sharing a key into a single in-flight call.
+
+    The first caller for a key starts the call, the callers arriving while it
+    is still running await the same result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, asyncio.Future] = {}
+        # number of calls actually started, the others were coalesced
+        self.calls = 0
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = asyncio.ensure_future(fn(*args))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        # a caller going away must not cancel the call for everyone else
+        return await asyncio.shield(flight)
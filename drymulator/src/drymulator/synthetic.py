@@ -0,0 +1,186 @@
+"""Synthetic drying trajectories for scale testing.
+
+Every run follows the drying kinetics fitted on the default trajectory with
+its own perturbed rate, exponent and initial weight, plus a slow drift and
+white noise on the weight readings. Runs are generated a block at a time as
+`runs x samples` arrays and written straight to the library formats:
+
+    python -m drymulator.synthetic trajectories/synthetic --count 10000
+    python -m drymulator.synthetic trajectories/long --samples 10000000
+"""
+
+import argparse
+import importlib.resources
+from pathlib import Path
+import sys
+import time
+from typing import Iterator, Literal, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv
+
+from .kinetics import PageModel
+from .library import load_trajectory, save_trajectory
+
+# samples generated at once, bounds the memory to a few hundred MB
+BLOCK_SAMPLES = 2**24
+
+
+def reference_model() -> tuple[PageModel, float]:
+    """Kinetics and duration (seconds) of the default trajectory."""
+    path = importlib.resources.files("drymulator") / "test_data.csv"
+    with importlib.resources.as_file(path) as path:
+        trajectory = load_trajectory(path)
+    return trajectory.kinetics, float(trajectory.time_seconds[-1])
+
+
+def generate(
+    model: PageModel,
+    count: int,
+    samples: int,
+    interval: int = 30,
+    stretch: float = 1.0,
+    k_sigma: float = 0.1,
+    n_sigma: float = 0.02,
+    weight_sigma: float = 0.02,
+    drift_sigma: float = 0.05,
+    noise_sigma: float = 0.1,
+    seed: Optional[int] = None,
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Time, fraction initial and weight of `count` runs of `samples` samples.
+
+    `stretch` slows the kinetics down (a run of `stretch` times the duration
+    dries the same way). The drift is a random walk of `drift_sigma` grams
+    per square root of (stretched) hour, the noise is white with `noise_sigma`
+    grams; the fraction initial is derived from the noisy weight, as it is for
+    a logger.
+    """
+    rng = np.random.default_rng(seed)
+    time_seconds = np.arange(samples, dtype=np.int64) * interval
+    with np.errstate(divide="ignore"):
+        log_time = np.log(time_seconds / stretch).astype(np.float32)
+    # in stretched time as well, for long runs not to drift away
+    drift_step = np.float32(drift_sigma * np.sqrt(interval / stretch / 3600))
+    runs = max(BLOCK_SAMPLES // samples, 1)
+    for start in range(0, count, runs):
+        n = min(runs, count - start)
+        k = (model.k * np.exp(rng.normal(0.0, k_sigma, n))).astype(np.float32)
+        exponent = np.maximum(model.n * (1 + rng.normal(0.0, n_sigma, n)), 0.05)
+        w0 = (model.w0 * (1 + rng.normal(0.0, weight_sigma, n))).astype(np.float32)
+
+        # t**n as exp(n ln t), then updated in place to the weight
+        weight = np.exp(np.multiply.outer(exponent.astype(np.float32), log_time))
+        weight *= -k[:, None]
+        np.exp(weight, out=weight)
+        weight *= model.f0 - model.f_eq
+        weight += 1 - model.f0 + model.f_eq
+        weight *= w0[:, None]
+        noise = rng.standard_normal(weight.shape, dtype=np.float32)
+        noise *= drift_step
+        np.cumsum(noise, axis=1, out=noise)
+        weight += noise
+        weight += noise_sigma * rng.standard_normal(weight.shape, dtype=np.float32)
+
+        fraction_initial = weight / w0[:, None]
+        fraction_initial += np.float32(model.f0 - 1)
+        for run in range(n):
+            yield time_seconds, fraction_initial[run], weight[run]
+
+
+def write(
+    path: Path,
+    time_seconds: np.ndarray,
+    fraction_initial: np.ndarray,
+    weight: np.ndarray,
+):
+    if path.suffix == ".csv":
+        table = pa.table(
+            {
+                "time_seconds": time_seconds,
+                "fraction_initial": fraction_initial,
+                "weight": weight,
+            }
+        )
+        pyarrow.csv.write_csv(table, path)
+    else:
+        save_trajectory(path, time_seconds, fraction_initial, weight)
+
+
+def generate_library(
+    directory: str,
+    count: int = 1,
+    samples: int = 5762,
+    interval: int = 30,
+    format: Literal["npz", "csv"] = "npz",
+    prefix: str = "run",
+    stretch: Optional[float] = None,
+    **perturbations,
+) -> list[Path]:
+    """Write `count` synthetic trajectories in `directory`, named `prefix-N`.
+
+    By default the kinetics are stretched so that every run has the same
+    shape as the default trajectory, whatever its duration.
+    """
+    model, reference_seconds = reference_model()
+    if stretch is None:
+        stretch = (samples - 1) * interval / reference_seconds
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    width = len(str(count - 1))
+    paths = []
+    runs = generate(model, count, samples, interval, stretch, **perturbations)
+    for number, run in enumerate(runs):
+        path = directory / f"{prefix}-{number:0{width}d}.{format}"
+        write(path, *run)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", help="library directory to write to")
+    parser.add_argument("--count", type=int, default=1, help="trajectories")
+    parser.add_argument("--samples", type=int, default=5762, help="per trajectory")
+    parser.add_argument("--interval", type=int, default=30, help="seconds")
+    parser.add_argument("--format", choices=["npz", "csv"], default="npz")
+    parser.add_argument("--prefix", default="run")
+    parser.add_argument(
+        "--stretch",
+        type=float,
+        help="slow down the kinetics, by default to the duration of the runs",
+    )
+    parser.add_argument("--k-sigma", type=float, default=0.1)
+    parser.add_argument("--n-sigma", type=float, default=0.02)
+    parser.add_argument("--weight-sigma", type=float, default=0.02)
+    parser.add_argument("--drift-sigma", type=float, default=0.05, help="g/sqrt(h)")
+    parser.add_argument("--noise-sigma", type=float, default=0.1, help="g")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    paths = generate_library(
+        args.directory,
+        count=args.count,
+        samples=args.samples,
+        interval=args.interval,
+        format=args.format,
+        prefix=args.prefix,
+        stretch=args.stretch,
+        k_sigma=args.k_sigma,
+        n_sigma=args.n_sigma,
+        weight_sigma=args.weight_sigma,
+        drift_sigma=args.drift_sigma,
+        noise_sigma=args.noise_sigma,
+        seed=args.seed,
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(paths)} trajectories of {args.samples} samples in {elapsed:.1f}s"
+        f" -> {args.directory}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import numpy as np
+
+from .anomaly import AnomalyDetector
+from .kinetics import PageModel
+from .models import ReadingCreate
+
+MODEL = PageModel(k=2e-5, n=1.07, f0=0.9, f_eq=0.03, w0=300.0)
+
+
+def drying(seed: int) -> tuple[np.ndarray, np.ndarray]:
+    t = np.arange(0, 12 * 3600, 30)
+    rng = np.random.default_rng(seed)
+    return t, MODEL.weight(t) + rng.normal(0, 0.05, len(t))
+
+
+def feed(detector: AnomalyDetector, runs: dict, batch: int = 1) -> dict:
+    """Anomalies raised by every run, as {dryer: {index of the batch: names}}."""
+    raised = {dryer_id: {} for dryer_id in runs}
+    length = len(next(iter(runs.values()))[0])
+    for start in range(0, length, batch):
+        detector.update(
+            [
+                ReadingCreate(
+                    dryer_id=dryer_id,
+                    time_seconds=t[index],
+                    fraction_initial=0.9,
+                    weight=weight[index],
+                )
+                for dryer_id, (t, weight) in runs.items()
+                for index in range(start, min(start + batch, length))
+            ]
+        )
+        for dryer_id in runs:
+            if anomalies := detector.anomalies(dryer_id):
+                raised[dryer_id][start // batch] = anomalies
+    return raised
+
+
+def test_anomalies():
+    runs = {name: drying(seed) for seed, name in enumerate("abcd")}
+    runs["a"][1][500] += 1
+    runs["b"][1][500:] += 10
+    # no weight lost for half an hour
+    t, weight = runs["c"]
+    weight[500:560] = weight[500]
+    weight[560:] -= weight[560] - weight[500]
+    raised = feed(AnomalyDetector(), runs)
+
+    assert raised["d"] == {}
+    assert raised["a"] == {500: ["spike"], 501: ["spike"]}
+    assert raised["b"] == {500: ["jump"]}
+    stalled = sorted(raised["c"])
+    assert all(anomalies == ["stall"] for anomalies in raised["c"].values())
+    assert stalled == list(range(stalled[0], stalled[-1] + 1))
+    assert 500 < stalled[0] <= 510
+    # cleared soon after the drying resumes
+    assert 560 <= stalled[-1] <= 600
+
+
+def test_batches():
+    runs = {name: drying(seed) for seed, name in enumerate("ab")}
+    runs["a"][1][500] += 1
+    # readings of a batch arriving out of order
+    runs["b"] = runs["b"][0][::-1], runs["b"][1][::-1]
+    detector = AnomalyDetector()
+    raised = feed(detector, {"a": runs["a"]}, batch=10)
+    assert raised["a"] == {50: ["spike"]}
+    detector.update(
+        [
+            ReadingCreate(dryer_id="b", time_seconds=t, fraction_initial=0.9, weight=w)
+            for t, w in zip(*runs["b"])
+        ]
+    )
+    assert detector.anomalies("b") == []
+    assert detector.flags(["a", "b", "unknown"]).tolist() == [0, 0, 0]
+    assert detector.anomalies("unknown") is None
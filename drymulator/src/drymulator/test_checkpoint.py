@@ -0,0 +1,104 @@
+from datetime import datetime
+
+from . import checkpoint
+from .anomaly import AnomalyDetector
+from .estimation import MoistureFilter
+from .library import TrajectoryLibrary
+from .live import LiveDryers
+from .models import ConfigPublic, ReadingCreate, RuleCreate
+from .rules import RuleEngine
+from .simulation import Simulation, SimulationRegistry
+from .trajectory import Trajectory
+
+NOW = datetime(2025, 1, 1, 12)
+
+
+def sessions():
+    library = TrajectoryLibrary(None, memory_budget=2**20)
+    library.pin("t", Trajectory([0, 30, 60], [1.0, 0.9, 0.8], [100.0, 90.0, 80.0]))
+    registry = SimulationRegistry(max_forks=10)
+    live, estimates, rules = LiveDryers(), MoistureFilter(0.5, 1e-10), RuleEngine()
+    return library, registry, {}, rules, live, estimates, AnomalyDetector()
+
+
+def test_round_trip(tmp_path):
+    library, registry, tags, rules, live, estimates, anomalies = sessions()
+    parent = Simulation(library.get("t"), "t", NOW, anchor_seconds=30, time_speed=2)
+    running = registry.add_fork(parent)
+    paused = registry.add_fork(registry.get(running), parent_id=running)
+    registry.get(paused).pause(NOW)
+    registry.sync(paused)
+    tags[running] = {"line": "2"}
+    readings = [
+        ReadingCreate(dryer_id="real", time_seconds=t, fraction_initial=0.9, weight=w)
+        for t, w in [(0, 300.0), (30, 299.0)]
+    ]
+    live.ingest(readings)
+    estimates.update(readings)
+    anomalies.update(readings)
+    rules.remove(rules.add(RuleCreate(metric="weight", op="below", value=1)).id)
+    rule = RuleCreate(dryer_id=running, metric="weight", op="below", value=95)
+    rule = rules.add(rule)
+    config = ConfigPublic(start_time=NOW, time_speed=5, is_active=False)
+
+    path = tmp_path / "checkpoint.npz"
+    arrays = checkpoint.take(
+        registry, tags, rules, live, estimates, anomalies, config, 60
+    )
+    writer = checkpoint.CheckpointWriter(path)
+    writer.write(arrays, 2.0)
+    # an older checkpoint finishing late does not replace it
+    older = checkpoint.take(
+        registry, {}, RuleEngine(), live, estimates, anomalies, config, 0
+    )
+    writer.write(older, 1.0)
+    assert [file.name for file in tmp_path.iterdir()] == ["checkpoint.npz"]
+
+    library, registry2, tags2, rules2, live2, estimates2, anomalies2 = sessions()
+    data = checkpoint.load(path)
+    restored = checkpoint.restore(
+        data, registry2, library, tags2, rules2, live2, estimates2, anomalies2
+    )
+    assert restored == 2
+    for dryer_id in (running, paused):
+        before, after = registry.get(dryer_id), registry2.get(dryer_id)
+        assert after.simulated_seconds(NOW) == before.simulated_seconds(NOW)
+        assert after.is_active == before.is_active
+        assert after.parent_id == before.parent_id
+    assert registry2.clocks.keys == registry.clocks.keys
+    assert tags2 == tags
+    assert rules2.rules() == [rule]
+    assert rules2.add(RuleCreate(metric="weight", op="below", value=1)).id == 3
+    assert live2.get("real") == live.get("real")
+    assert estimates2.estimate("real") == estimates.estimate("real")
+    assert anomalies2.states["mean"].tolist() == anomalies.states["mean"].tolist()
+    saved = checkpoint.session(data)
+    assert ConfigPublic.model_validate(saved["config"]) == config
+    assert saved["paused_seconds"] == 60
+
+
+def test_old_checkpoint(tmp_path):
+    library, registry, tags, rules, live, estimates, anomalies = sessions()
+    live.ingest(
+        [ReadingCreate(dryer_id="real", time_seconds=0, fraction_initial=0.5, weight=1)]
+    )
+    config = ConfigPublic(start_time=NOW)
+    arrays = checkpoint.take(
+        registry, tags, rules, live, estimates, anomalies, config, 0
+    )
+    # saved before the latest readings had their derived quantities
+    del arrays["live/f0"], arrays["live/drying_rate"]
+    path = tmp_path / "checkpoint.npz"
+    checkpoint.CheckpointWriter(path).write(arrays, 1.0)
+
+    library, registry, tags, rules, live, estimates, anomalies = sessions()
+    data = checkpoint.load(path)
+    checkpoint.restore(data, registry, library, tags, rules, live, estimates, anomalies)
+    state = live.get("real")
+    assert state.moisture_ratio == 1
+    assert state.dry_basis_moisture == 1
+    assert state.drying_rate is None
+
+
+def test_missing(tmp_path):
+    assert checkpoint.load(tmp_path / "checkpoint.npz") is None
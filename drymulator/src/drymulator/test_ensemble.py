@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from .ensemble import run_ensemble
+from .kinetics import PageModel
+
+
+@pytest.fixture
+def model():
+    return PageModel(k=2e-5, n=1.07, f0=0.9, f_eq=0.03, w0=300.0)
+
+
+def test_fit_recovers_parameters(model):
+    time_seconds = np.arange(0, 172_800, 30)
+    fraction = model.fraction(time_seconds)
+    fitted = PageModel.fit(time_seconds, fraction, model.weight(time_seconds))
+    assert fitted.n == pytest.approx(model.n, rel=0.05)
+    assert fitted.weight(36_000) == pytest.approx(model.weight(36_000), rel=0.01)
+
+
+def test_ensemble_without_perturbations(model):
+    target_weight = float(model.weight(40_000))
+    ensemble = run_ensemble(
+        model,
+        100,
+        10_000,
+        3600,
+        5,
+        target_weight,
+        k_sigma=0,
+        n_sigma=0,
+        weight_sigma=0,
+        noise_sigma=0,
+    )
+    assert ensemble.time_seconds[0] == 10_000
+    assert ensemble.time_to_target_p50 == pytest.approx(30_000, rel=1e-3)
+    assert ensemble.weight_p5 == pytest.approx(ensemble.weight_p95, rel=1e-5)
+    assert ensemble.weight_p50[-1] == pytest.approx(model.weight(13_600), rel=1e-5)
+
+
+def test_ensemble_bands(model):
+    ensemble = run_ensemble(model, 10_000, 0, 6 * 3600, 50, 50.0, seed=0)
+    assert ensemble.reachable_fraction == 1.0
+    assert ensemble.time_to_target_p5 < ensemble.time_to_target_p50
+    assert ensemble.time_to_target_p50 < ensemble.time_to_target_p95
+    assert np.all(np.array(ensemble.weight_p5) < np.array(ensemble.weight_p95))
+
+
+def test_unreachable_target(model):
+    # below the dry matter plus equilibrium moisture
+    ensemble = run_ensemble(model, 100, 0, 3600, 5, 1.0, seed=0)
+    assert ensemble.reachable_fraction == 0.0
+    assert ensemble.time_to_target_p50 is None
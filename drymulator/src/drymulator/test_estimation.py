@@ -0,0 +1,47 @@
+import numpy as np
+
+from .estimation import MoistureFilter
+from .models import ReadingCreate
+
+
+def test_filter_noisy_weight():
+    rng = np.random.default_rng(0)
+    dryers = 50
+    # every dryer loses weight at its own constant rate, read every 30s
+    rates = rng.uniform(2, 10, dryers)  # per hour
+    filter = MoistureFilter(weight_sigma=2.0, rate_noise=1e-12)
+
+    def readings(seconds):
+        weight = 300 - rates * seconds / 3600
+        return [
+            ReadingCreate(
+                dryer_id=f"dryer-{dryer}",
+                time_seconds=seconds,
+                fraction_initial=0.9,
+                weight=weight[dryer] + rng.normal(0, 2.0),
+            )
+            for dryer in range(dryers)
+        ]
+
+    for seconds in range(0, 4 * 3600, 60):
+        # two readings per dryer in the same batch, out of order
+        filter.update(readings(seconds + 30) + readings(seconds))
+
+    duration = 4 * 3600 - 30
+    estimates = [filter.estimate(f"dryer-{dryer}") for dryer in range(dryers)]
+    assert all(estimate.time_seconds == duration for estimate in estimates)
+    errors = np.array([e.weight for e in estimates]) - (300 - rates * duration / 3600)
+    stds = np.array([e.weight_std for e in estimates])
+    # much better than a single reading, and consistent with its uncertainty
+    assert stds.max() < 1.0
+    assert np.abs(errors).max() < 4 * stds.max()
+    drying_rates = np.array([e.drying_rate for e in estimates])
+    rate_stds = np.array([e.drying_rate_std for e in estimates])
+    assert rate_stds.max() < 0.5
+    assert np.abs(drying_rates - rates).max() < 4 * rate_stds.max()
+
+    # the moisture follows the filtered weight, from the first reading
+    first = estimates[0]
+    w0 = 300 - rates[0] * 30 / 3600
+    assert abs(first.fraction_initial - (0.9 + (first.weight - w0) / w0)) < 0.01
+    assert filter.estimate("unknown") is None
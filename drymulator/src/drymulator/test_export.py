@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from .export import (
+    TRAJECTORY_SCHEMA,
+    served_batches,
+    stream_batches,
+    trajectory_batches,
+)
+from .models import ConfigChange
+from .trajectory import Trajectory
+
+START = datetime(2025, 1, 1, 12)
+
+
+@pytest.fixture
+def trajectory():
+    return Trajectory([0, 30, 60, 90], [1.0, 0.9, 0.8, 0.7], [100.0, 90.0, 80.0, 70.0])
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_stream_batches(trajectory, format):
+    chunks = list(
+        stream_batches(TRAJECTORY_SCHEMA, trajectory_batches(trajectory, 3), format)
+    )
+    # a chunk per batch, the last one with the footer
+    assert len(chunks) >= 2
+    data = pa.py_buffer(b"".join(chunks))
+    if format == "parquet":
+        table = pq.read_table(data)
+    else:
+        table = pa.ipc.open_stream(data).read_all()
+    assert table.column("weight").to_pylist() == [100, 90, 80, 70]
+
+
+def change(seconds: float, is_active: bool, time_seconds: int) -> ConfigChange:
+    return ConfigChange(
+        changed_at=START + timedelta(seconds=seconds),
+        start_time=START,
+        time_speed=1,
+        is_active=is_active,
+        trajectory="t",
+        time_seconds=time_seconds,
+    )
+
+
+def test_served_batches(trajectory):
+    changes = [change(0, True, 0), change(50, False, 60)]
+    until = START + timedelta(hours=1)
+    batches = served_batches(changes, lambda name: trajectory, until, 2)
+    table = pa.Table.from_batches(list(batches))
+    # switches half way between samples while running, frozen once paused
+    assert table.column("time_seconds").to_pylist() == [0, 30, 60, 60]
+    assert [t - START for t in table.column("wallclock").to_pylist()] == [
+        timedelta(seconds=seconds) for seconds in (0, 15, 45, 50)
+    ]
@@ -0,0 +1,104 @@
+import itertools
+import time
+
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from .faults import FaultInjectionMiddleware, FaultInjector
+from .models import FaultCreate
+
+
+def make_client():
+    app = FastAPI()
+    counter = itertools.count()
+
+    @app.get("/state/current")
+    async def current(request: Request, dryer_id: str = "live"):
+        reading = next(counter)
+        if "application/octet-stream" in request.headers.get("accept", ""):
+            return Response(bytes([reading]), media_type="application/octet-stream")
+        return {"dryer_id": dryer_id, "reading": reading}
+
+    @app.post("/command/reset")
+    async def reset():
+        return {"reset": next(counter)}
+
+    injector = FaultInjector(seed=0)
+    app.add_middleware(FaultInjectionMiddleware, injector=injector)
+    return TestClient(app), injector
+
+
+def test_no_faults():
+    client, _ = make_client()
+    response = client.get("/state/current")
+    assert response.json() == {"dryer_id": "live", "reading": 0}
+    assert "x-injected-fault" not in response.headers
+
+
+def test_errors_per_dryer():
+    client, injector = make_client()
+    fault = injector.add(FaultCreate(dryer_id="a", error_rate=1, error_status=502))
+    response = client.get("/state/current", params={"dryer_id": "a"})
+    assert response.status_code == 502
+    assert response.headers["x-injected-fault"] == "error"
+    assert client.get("/state/current", params={"dryer_id": "b"}).status_code == 200
+
+    injector.remove(fault.id)
+    assert client.get("/state/current", params={"dryer_id": "a"}).status_code == 200
+
+
+def test_latency():
+    client, injector = make_client()
+    injector.add(FaultCreate(path="/state/*", latency_ms=50))
+    start = time.perf_counter()
+    client.get("/state/current")
+    assert time.perf_counter() - start >= 0.05
+
+
+def test_stale_readings():
+    client, injector = make_client()
+    injector.add(FaultCreate(stale_rate=1))
+    first = client.get("/state/current")
+    assert "x-injected-fault" not in first.headers
+    stale = client.get("/state/current")
+    assert stale.headers["x-injected-fault"] == "stale"
+    assert stale.json() == first.json()
+    # other requests have their own previous response
+    assert client.get("/state/current", params={"dryer_id": "a"}).json()["reading"]
+
+
+def test_stale_commands():
+    client, injector = make_client()
+    injector.add(FaultCreate(stale_rate=1))
+    first = client.post("/command/reset")
+    second = client.post("/command/reset")
+    assert "x-injected-fault" not in second.headers
+    assert second.json()["reset"] == first.json()["reset"] + 1
+
+
+def test_stale_binary():
+    client, injector = make_client()
+    injector.add(FaultCreate(stale_rate=1))
+    first = client.get("/state/current")
+    binary = {"accept": "application/octet-stream"}
+    response = client.get("/state/current", headers=binary)
+    assert "x-injected-fault" not in response.headers
+    assert response.headers["content-type"] == "application/octet-stream"
+    stale = client.get("/state/current", headers=binary)
+    assert stale.headers["x-injected-fault"] == "stale"
+    assert stale.content == response.content
+    assert client.get("/state/current").json() == first.json()
+
+
+def test_dropout():
+    client, injector = make_client()
+    fault = injector.add(FaultCreate(dropout_rate=1, dropout_seconds=0.05))
+    response = client.get("/state/current")
+    assert response.status_code == 503
+    assert response.headers["x-injected-fault"] == "dropout"
+
+    # the dropout lasts even when no new one starts
+    injector._faults[fault.id] = fault.model_copy(update={"dropout_rate": 0})
+    assert client.get("/state/current").status_code == 503
+    time.sleep(0.05)
+    assert client.get("/state/current").status_code == 200
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from .fleet import Fleet
+from .live import LiveDryers
+from .models import ReadingCreate
+from .simulation import Simulation, SimulationRegistry
+from .trajectory import Trajectory
+
+NOW = datetime(2025, 1, 1, 12)
+
+
+@pytest.fixture
+def fleet():
+    trajectory = Trajectory(
+        [0, 30, 60, 90], [1.0, 0.9, 0.8, 0.7], [100.0, 90.0, 80.0, 70.0]
+    )
+    registry = SimulationRegistry(max_forks=10)
+    fleet = Fleet(registry, LiveDryers())
+    # simulated seconds at NOW: 0, 30 and 60, plus a paused one at 30
+    for seconds, line in [(0, "1"), (30, "1"), (60, "2")]:
+        parent = Simulation(trajectory, "t", NOW, anchor_seconds=seconds, time_speed=1)
+        fleet.tags[registry.add_fork(parent)] = {"line": line}
+    paused = Simulation(trajectory, "t", NOW, anchor_seconds=30, is_active=False)
+    fleet.tags[registry.add_fork(paused)] = {"line": "2"}
+    reading = ReadingCreate(
+        dryer_id="real", time_seconds=10, fraction_initial=0.5, weight=50
+    )
+    fleet.live.ingest([reading])
+    return fleet
+
+
+def test_state(fleet):
+    ids, columns = fleet.state(NOW.timestamp())
+    assert len(ids) == 5 and ids[-1] == "real"
+    assert columns["time_seconds"].tolist() == [0, 30, 60, 30, 10]
+    remaining = columns["remaining_seconds"].tolist()
+    assert remaining[:3] == [90, 60, 30]
+    assert remaining[3] != remaining[3] and remaining[4] != remaining[4]  # NaN
+
+    # 10s later with a target reached at 60 simulated seconds
+    ids, columns = fleet.state(NOW.timestamp() + 10, target_fraction=0.8)
+    assert columns["remaining_seconds"][:3].tolist() == [50, 20, 0]
+
+
+def test_dryers(fleet):
+    now = NOW.timestamp()
+    soon = fleet.dryers(now, where=["remaining_seconds<=60"])
+    assert [d.remaining_seconds for d in soon] == [30, 60]
+    assert soon[0].tags == {"line": "2"}
+
+    heaviest = fleet.dryers(now, sort_by="weight", descending=True, k=2)
+    assert [d.weight for d in heaviest] == [100, 90]
+    assert [d.dryer_id for d in fleet.dryers(now, where=["line=2"], k=1)] == [
+        soon[0].dryer_id
+    ]
+    with pytest.raises(ValueError):
+        fleet.dryers(now, where=["line<2"])
+
+
+def test_aggregate(fleet):
+    now = NOW.timestamp()
+    groups = fleet.aggregate(now, "fraction_initial", group_by="line")
+    by_line = {group.group: group for group in groups}
+    assert by_line["1"].count == 2 and by_line["1"].mean == pytest.approx(0.95)
+    assert (by_line["2"].min, by_line["2"].max) == (0.8, 0.9)
+    # the sensor-backed dryer has no line
+    assert by_line[None].mean == 0.5
+
+    (everything,) = fleet.aggregate(now, "weight", where=["weight<95"])
+    assert everything.count == 4 and everything.max == 90
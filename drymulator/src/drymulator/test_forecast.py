@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from .forecast import Forecasts, PageFit, end_seconds, forecast
+from .kinetics import PageModel
+from .models import ReadingCreate
+from .trajectory import Trajectory
+
+TRUE = PageModel(k=2e-4, n=1.1, f0=0.9, f_eq=0.05, w0=300.0)
+
+
+def test_incremental_fit():
+    t = np.arange(0, 8 * 3600, 30.0)
+    fit = PageFit(TRUE.f0, TRUE.w0)
+    assert fit.model() is None
+    # fed in uneven chunks, as readings arrive
+    for chunk in np.array_split(np.arange(len(t)), [1, 7, 100, 500]):
+        fit.add(t[chunk], TRUE.fraction(t[chunk]))
+    model = fit.model()
+    assert fit.model() is model
+    assert model.n == pytest.approx(TRUE.n, rel=0.05)
+    assert model.f_eq == pytest.approx(TRUE.f_eq, abs=0.005)
+    assert np.abs(model.fraction(t) - TRUE.fraction(t)).max() < 0.005
+    assert len(fit._kept) <= fit.keep
+
+    curves = forecast(model, 3600, end_seconds(model) - 3600, steps=10)
+    assert curves.time_seconds[0] == 3600 and len(curves.weight) == 10
+    assert curves.fraction_initial[-1] == pytest.approx(
+        TRUE.f_eq + 0.01 * (TRUE.f0 - TRUE.f_eq), abs=0.005
+    )
+
+
+def test_follow_simulation():
+    t = np.arange(0, 4 * 3600, 30.0)
+    trajectory = Trajectory(t, TRUE.fraction(t), TRUE.weight(t))
+    forecasts = Forecasts()
+    fit = forecasts.follow("fork", trajectory, 100)
+    assert fit.samples == 101
+    assert forecasts.follow("fork", trajectory, 300) is fit
+    assert fit.samples == 301
+    # moving backwards starts over
+    restarted = forecasts.follow("fork", trajectory, 50)
+    assert restarted is not fit and restarted.samples == 51
+
+
+def test_observe_readings():
+    forecasts = Forecasts()
+    for start in range(0, 3 * 3600, 600):
+        forecasts.observe(
+            [
+                ReadingCreate(
+                    dryer_id="real",
+                    time_seconds=seconds,
+                    fraction_initial=TRUE.fraction(seconds),
+                    weight=TRUE.weight(seconds),
+                )
+                for seconds in range(start, start + 600, 30)
+            ]
+        )
+    # readings are added to the fit by batch, and all of them when forecast
+    assert forecasts.fits["real"].samples == forecasts.batch
+    model = forecasts.fit("real").model()
+    assert forecasts.fits["real"].samples == 3 * 3600 // 30
+    assert model.n == pytest.approx(TRUE.n, rel=0.1)
@@ -0,0 +1,146 @@
+from datetime import datetime
+import json
+
+import pytest
+
+from .anomaly import AnomalyDetector
+from .fleet import Fleet
+from .hub import StateHub
+from .live import LiveDryers
+from .models import ReadingCreate
+from .simulation import Simulation, SimulationRegistry
+from .trajectory import Trajectory
+
+NOW = datetime(2025, 1, 1, 12)
+
+
+def frames(subscriber) -> list[dict]:
+    received = []
+    while not subscriber.frames.empty():
+        frame = subscriber.frames.get_nowait()
+        assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+        received.append(json.loads(frame[6:]))
+    return received
+
+
+def reading(dryer_id: str, seconds: int) -> ReadingCreate:
+    return ReadingCreate(
+        dryer_id=dryer_id, time_seconds=seconds, fraction_initial=0.5, weight=50
+    )
+
+
+@pytest.fixture
+def hub():
+    trajectory = Trajectory(
+        [0, 30, 60, 90], [1.0, 0.9, 0.8, 0.7], [100.0, 90.0, 80.0, 70.0]
+    )
+    registry = SimulationRegistry(max_forks=10)
+    fleet = Fleet(registry, LiveDryers())
+    running = Simulation(trajectory, "t", NOW, time_speed=1)
+    fleet.tags[registry.add_fork(running)] = {"line": "1"}
+    paused = Simulation(trajectory, "t", NOW, anchor_seconds=60, is_active=False)
+    fleet.tags[registry.add_fork(paused)] = {"line": "2"}
+    fleet.live.ingest([reading("real", 0)])
+    return StateHub(fleet, max_frames=2)
+
+
+def test_deltas(hub):
+    everything = hub.subscribe()
+    now = NOW.timestamp()
+    hub.tick(now)
+    (snapshot,) = frames(everything)
+    assert snapshot["snapshot"] and len(snapshot["states"]) == 3
+    # the states are those served by /state/current, derived quantities included
+    assert snapshot["states"]["real"] == {
+        "time_seconds": 0,
+        "fraction_initial": 0.5,
+        "weight": 50.0,
+        "dry_basis_moisture": 1.0,
+        "moisture_ratio": 1.0,
+        "drying_rate": None,
+    }
+    live_state = hub.fleet.live.get("real").model_dump(exclude={"anomalies"})
+    assert snapshot["states"]["real"] == live_state
+    paused = list(hub.fleet.tags)[1]
+    trajectory = hub.fleet.registry.get(paused).trajectory
+    assert snapshot["states"][paused] == json.loads(trajectory.json(2))
+
+    # nothing changed, nothing sent
+    hub.tick(now + 1)
+    assert frames(everything) == []
+    # only the running fork and the new reading
+    hub.fleet.live.ingest([reading("real", 1)])
+    hub.tick(now + 30)
+    (delta,) = frames(everything)
+    assert not delta["snapshot"] and len(delta["states"]) == 2
+    assert delta["states"]["real"]["time_seconds"] == 1
+
+    fork = next(iter(hub.fleet.tags))
+    hub.fleet.registry.remove(fork)
+    hub.tick(now + 31)
+    assert frames(everything)[0]["removed"] == [fork]
+
+    # values that are not finite are null, the frame is still valid JSON
+    broken = ReadingCreate(
+        dryer_id="broken", time_seconds=0, fraction_initial=0.5, weight=float("inf")
+    )
+    hub.fleet.live.ingest([broken])
+    hub.tick(now + 32)
+    assert frames(everything)[0]["states"]["broken"]["weight"] is None
+
+
+def test_filter_by_tag(hub):
+    line_2 = hub.subscribe(["line=2"])
+    hub.tick(NOW.timestamp())
+    (snapshot,) = frames(line_2)
+    (fork,) = snapshot["states"]
+    assert hub.fleet.tags[fork] == {"line": "2"}
+
+    # the real dryer joins the line, the fork leaves it
+    hub.fleet.tags["real"] = {"line": "2"}
+    hub.fleet.tags[fork] = {"line": "1"}
+    hub.tick(NOW.timestamp() + 1)
+    (delta,) = frames(line_2)
+    assert list(delta["states"]) == ["real"] and delta["removed"] == [fork]
+    with pytest.raises(ValueError):
+        hub.subscribe(["line<2"])
+
+
+def test_slow_subscriber(hub):
+    slow, fast = hub.subscribe(), hub.subscribe()
+    now = NOW.timestamp()
+    for tick in range(5):
+        hub.fleet.live.ingest([reading("real", tick)])
+        hub.tick(now + tick)
+        frames(fast)
+    # stale deltas dropped, a snapshot of the latest states instead
+    received = frames(slow)
+    assert slow.dropped > 0 and len(received) <= 2
+    assert received[0]["snapshot"]
+    assert received[-1]["states"]["real"]["time_seconds"] == 4
+
+
+def test_anomalies():
+    anomalies = AnomalyDetector()
+    fleet = Fleet(SimulationRegistry(max_forks=10), LiveDryers(), anomalies)
+    hub = StateHub(fleet)
+    subscriber = hub.subscribe()
+
+    def ingest(seconds: int, weight: float):
+        readings = [
+            ReadingCreate(
+                dryer_id="real",
+                time_seconds=seconds,
+                fraction_initial=0.5,
+                weight=weight,
+            )
+        ]
+        fleet.live.ingest(readings)
+        anomalies.update(readings)
+        hub.tick(NOW.timestamp() + seconds)
+        return frames(subscriber)[-1]["states"]["real"]
+
+    assert "anomalies" not in ingest(0, 100)
+    assert ingest(30, 50)["anomalies"] == ["jump"]
+    # cleared by the next batch of readings
+    assert "anomalies" not in ingest(60, 50)
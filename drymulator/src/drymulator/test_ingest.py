@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from .ingest import ingest_csv
+from .library import load_trajectory
+
+START = datetime(2024, 5, 1, 8)
+
+
+@pytest.fixture
+def log(tmp_path):
+    # irregular timestamps (about every 7s), a weight dropping by 0.01 per
+    # second, an extra column, a missing reading, a duplicate and a sample
+    # out of order
+    rng = np.random.default_rng(0)
+    seconds = np.cumsum(rng.uniform(1, 13, 2000)).round()
+    seconds = np.unique(np.concatenate([[0], seconds]))
+    lines = ["Timestamp,Ambient [C],Mass [g]"]
+    for second in seconds:
+        timestamp = START + timedelta(seconds=float(second))
+        lines.append(f"{timestamp:%Y-%m-%d %H:%M:%S},21.5,{300 - second / 100}")
+    lines.insert(50, lines[49])
+    lines.insert(100, lines[60])
+    lines[200] = lines[200].rsplit(",", 1)[0] + ","
+    path = tmp_path / "log.csv"
+    path.write_text("\n".join(lines) + "\n")
+    return path, seconds[-1]
+
+
+@pytest.mark.parametrize("block_size", [4096, 2**20])
+def test_ingest(log, tmp_path, block_size):
+    path, duration = log
+    progress = []
+    stats = ingest_csv(
+        path,
+        tmp_path / "apples" / "run.npz",
+        time_column="Timestamp",
+        weight_column="Mass [g]",
+        initial_moisture=0.9,
+        block_size=block_size,
+        progress=progress.append,
+    )
+    assert stats.dropped == 3
+    assert stats.rows == len(path.read_text().splitlines()) - 1
+    assert len(progress) > 1 or block_size > stats.bytes
+
+    trajectory = load_trajectory(tmp_path / "apples" / "run.npz")
+    assert trajectory.time_seconds.dtype == np.int32
+    np.testing.assert_array_equal(
+        trajectory.time_seconds, np.arange(0, duration + 1, 30)
+    )
+    expected = 300 - trajectory.time_seconds / 100
+    np.testing.assert_allclose(trajectory.weight, expected, rtol=1e-6)
+    np.testing.assert_allclose(
+        trajectory.fraction_initial, expected / 300 - 0.1, atol=1e-6
+    )
+
+
+def test_needs_fraction_or_moisture(log, tmp_path):
+    with pytest.raises(ValueError):
+        ingest_csv(log[0], tmp_path / "run.npz", time_column="Timestamp")
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+import gc
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from . import library as library_module
+from .library import TrajectoryLibrary, load_trajectory, save_trajectory
+from .trajectory import Trajectory
+
+
+@pytest.fixture
+def directory(tmp_path):
+    (tmp_path / "apples").mkdir()
+    for run in range(3):
+        save_trajectory(
+            tmp_path / "apples" / f"run-{run}.npz",
+            np.arange(0, 3000, 30),
+            np.linspace(0.9, 0.1, 100),
+            np.linspace(296.16, 40.0, 100),
+        )
+    (tmp_path / "tomatoes.csv").write_text(
+        "time_seconds,fraction_initial,weight\n0.0,0.9,100.5\n30.0,0.8,90.25\n"
+    )
+    return tmp_path
+
+
+def test_names_and_lazy_loading(directory):
+    library = TrajectoryLibrary(directory, memory_budget=2**30)
+    library.pin("default", Trajectory([0], [0.9], [1.0]))
+    assert library.names() == [
+        "apples/run-0",
+        "apples/run-1",
+        "apples/run-2",
+        "default",
+        "tomatoes",
+    ]
+    assert [t.name for t in library.public() if t.resident] == ["default"]
+
+    tomatoes = library.get("tomatoes")
+    assert tomatoes.state_at(40).weight == 90.25
+    assert library.get("tomatoes") is tomatoes
+    with pytest.raises(KeyError):
+        library.get("pears")
+    with pytest.raises(KeyError):
+        library.get("../outside")
+
+
+def test_compact_storage(directory):
+    library = TrajectoryLibrary(directory, memory_budget=2**30)
+    trajectory = library.get("apples/run-0")
+    assert trajectory.time_seconds.dtype == np.int32
+    assert trajectory.weight.dtype == np.float32
+    # float32 values are served with their shortest repr
+    assert trajectory.state(0).weight == 296.16
+    assert b'"weight":296.16,' in trajectory.json(0)
+
+
+def test_json_encoding():
+    trajectory = Trajectory([0, 30], [0.5, 1e-05], [300.0, -0.0])
+    first, second = (json.loads(trajectory.json(index)) for index in range(2))
+    assert first == trajectory.state(0).model_dump(exclude={"anomalies"})
+    # floats stay floats, and an undefined quantity is null
+    assert b'"weight":300.0,' in trajectory.json(0)
+    assert second["fraction_initial"] == 1e-05 and second["weight"] == 0.0
+    assert Trajectory([0], [1.0], [100.0]).json(0).endswith(b'"drying_rate":null}')
+
+
+def test_derived_quantities(directory):
+    trajectory = TrajectoryLibrary(directory, 2**30).get("apples/run-0")
+    # 0.9 of water, 0.1 of dry matter at the start
+    assert trajectory.state(0).dry_basis_moisture == 9.0
+    state = trajectory.state_at(1500)
+    assert state.dry_basis_moisture == pytest.approx(state.fraction_initial / 0.1)
+    assert state.moisture_ratio == pytest.approx(state.fraction_initial / 0.9)
+    # 256.16 g lost in 2970 s, at the ends the window holds half the samples
+    assert state.drying_rate == pytest.approx(256.16 / 2970 * 3600)
+    assert trajectory.state(0).drying_rate == trajectory.state(99).drying_rate
+
+    tomatoes = TrajectoryLibrary(directory, 2**30).get("tomatoes")
+    assert tomatoes.state(0).drying_rate == pytest.approx(10.25 / 30 * 3600)
+    alone = Trajectory([0], [1.0], [100.0])
+    assert alone.state(0).dry_basis_moisture is None
+    assert alone.state(0).drying_rate is None
+
+
+def test_lru_eviction(directory):
+    size = TrajectoryLibrary(directory, 0).get("apples/run-0").nbytes
+    library = TrajectoryLibrary(directory, memory_budget=2 * size)
+    library.get("apples/run-0")
+    library.get("apples/run-1")
+    library.get("apples/run-0")
+    library.get("apples/run-2")  # evicts run-1, the least recently used
+    gc.collect()
+    resident = [t.name for t in library.public() if t.resident]
+    assert resident == ["apples/run-0", "apples/run-2"]
+    assert library.resident_bytes <= library.memory_budget
+
+
+def test_evicted_but_in_use_is_reused(directory):
+    library = TrajectoryLibrary(directory, memory_budget=0)
+    in_use = library.get("apples/run-0")
+    library.get("apples/run-1")
+    assert library.get("apples/run-0") is in_use
+
+
+def test_concurrent_loads(directory, monkeypatch):
+    loads = []
+    release = threading.Event()
+
+    def slow_load(path):
+        loads.append(path.name)
+        if path.suffix == ".npz":
+            release.wait(5)
+        return load_trajectory(path)
+
+    monkeypatch.setattr(library_module, "load_trajectory", slow_load)
+    library = TrajectoryLibrary(directory, memory_budget=2**30)
+    with ThreadPoolExecutor(4) as executor:
+        waiting = [executor.submit(library.get, "apples/run-0") for _ in range(3)]
+        while not loads:
+            time.sleep(0.01)
+        # the cache stays usable while a trajectory is being loaded
+        assert library.get("tomatoes").state(0).weight == 100.5
+        release.set()
+        trajectories = [future.result() for future in waiting]
+    assert loads == ["run-0.npz", "tomatoes.csv"]
+    assert all(trajectory is trajectories[0] for trajectory in trajectories)
@@ -0,0 +1,71 @@
+from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+
+from .profiling import ProfilingMiddleware, StackProfiler
+
+
+def work():
+    return sum(i * i for i in range(10_000))
+
+
+def test_stack_profiler():
+    profiler = StackProfiler()
+    profiler.start()
+    work()
+    profiler.stop()
+    folded = profiler.folded()
+    line = next(line for line in folded.splitlines() if "test_profiling:work" in line)
+    stack, microseconds = line.rsplit(" ", 1)
+    assert stack.index("test_stack_profiler") < stack.index("work")
+    assert int(microseconds) > 0
+
+
+def dependency():
+    return work()
+
+
+def make_client(tmp_path, every=0):
+    app = FastAPI()
+
+    @app.get("/work")
+    async def endpoint():
+        return work()
+
+    @app.get("/threadpool")
+    async def threadpool(value: int = Depends(dependency)):
+        return value + await run_in_threadpool(work)
+
+    app.add_middleware(ProfilingMiddleware, directory=tmp_path, every=every)
+    return TestClient(app)
+
+
+def test_profile_on_header(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/work")
+    assert "x-profile-file" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+    response = client.get("/work", headers={"X-Profile": "1"})
+    assert response.json() == work()
+    profile = tmp_path / response.headers["x-profile-file"]
+    assert profile.name.endswith("-GET-work.folded")
+    assert "test_profiling:work" in profile.read_text()
+
+
+def test_profile_threadpool(tmp_path):
+    client = make_client(tmp_path)
+    response = client.get("/threadpool", headers={"X-Profile": "1"})
+    assert response.json() == 2 * work()
+    lines = (tmp_path / response.headers["x-profile-file"]).read_text().splitlines()
+    threads = [line.split(";")[:2] for line in lines if "work" in line]
+    # the sync dependency and the function handed to the threadpool
+    assert ["AnyIO worker thread", "drymulator.test_profiling:dependency"] in threads
+    assert ["AnyIO worker thread", "drymulator.test_profiling:work"] in threads
+
+
+def test_profile_every(tmp_path):
+    client = make_client(tmp_path, every=3)
+    profiled = ["x-profile-file" in client.get("/work").headers for _ in range(6)]
+    assert profiled == [False, False, True, False, False, True]
+    assert len(list(tmp_path.iterdir())) == 2
@@ -0,0 +1,340 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+import socket
+import subprocess
+import sys
+import time
+
+from fastapi.testclient import TestClient
+import httpx
+import pytest
+
+from .router import HashRing, _fleet_frames, create_app, settings
+
+
+def test_hash_ring():
+    nodes = [f"http://node-{number}" for number in range(4)]
+    ring = HashRing(nodes)
+    keys = [f"dryer-{number}" for number in range(10_000)]
+    placed = {key: ring.node(key) for key in keys}
+    counts = [list(placed.values()).count(node) for node in nodes]
+    assert min(counts) > 1500
+
+    # a fifth node takes about a fifth of the keys, from every other node
+    bigger = HashRing(nodes + ["http://node-4"])
+    moved = [key for key in keys if bigger.node(key) != placed[key]]
+    assert 1000 < len(moved) < 3000
+    assert all(bigger.node(key) == "http://node-4" for key in moved)
+    assert ring.node(ring.key_on(nodes[2])) == nodes[2]
+
+
+def test_fleet_frames():
+    def frame(snapshot, states, removed=()):
+        states = {dryer_id: {"weight": weight} for dryer_id, weight in states.items()}
+        frame = {"time": 0, "snapshot": snapshot, "states": states}
+        return b"data: %s\n\n" % json.dumps({**frame, "removed": removed}).encode()
+
+    events = [
+        (0, frame(True, {"a": 1, "b": 1})),
+        # deltas of a node are folded into the first snapshot until every
+        # node has sent its own
+        (0, frame(False, {"a": 2}, ["b"])),
+        (1, frame(True, {"c": 1})),
+        (1, frame(False, {"c": 2})),
+        # a node resynced: its dryers missing from its new snapshot are removed
+        (0, frame(True, {"d": 1})),
+    ]
+
+    async def main():
+        async def source():
+            for event in events:
+                yield event
+
+        return [
+            json.loads(event.removeprefix(b"data: "))
+            async for event in _fleet_frames(source(), 2)
+        ]
+
+    merged = asyncio.run(main())
+    assert [(frame["snapshot"], frame["removed"]) for frame in merged] == [
+        (True, []),
+        (False, []),
+        (False, ["a"]),
+    ]
+    assert merged[0]["states"] == {"a": {"weight": 2}, "c": {"weight": 1}}
+    assert merged[1]["states"] == {"c": {"weight": 2}}
+    assert merged[2]["states"] == {"d": {"weight": 1}}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str):
+    for _ in range(100):
+        try:
+            httpx.get(f"{url}/trajectories").raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+
+
+@pytest.fixture(scope="module")
+def nodes(tmp_path_factory):
+    """Two drymulator nodes in their own processes."""
+    processes, urls = [], []
+    for number in range(2):
+        port = free_port()
+        directory = tmp_path_factory.mktemp(f"node-{number}")
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{directory}/node.db",
+            "PYTHONPATH": str(Path(__file__).parents[1]),
+            "TICK_SECONDS": "0.2",
+            "HUB_TICK_SECONDS": "0.2",
+        }
+        command = [sys.executable, "-m", "uvicorn", "drymulator.server:app"]
+        processes.append(
+            subprocess.Popen(
+                [*command, "--port", str(port), "--log-level", "warning"],
+                env=env,
+                cwd=directory,
+            )
+        )
+        urls.append(f"http://localhost:{port}")
+    for url in urls:
+        wait_for(url)
+    yield urls
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+@pytest.fixture(scope="module")
+def router_url(nodes):
+    """The router of the nodes in its own process, the test client would read
+    the endless streams to their end."""
+    port = free_port()
+    env = {
+        **os.environ,
+        "ROUTER_NODES": ",".join(nodes),
+        "PYTHONPATH": str(Path(__file__).parents[1]),
+    }
+    command = [sys.executable, "-m", "uvicorn", "drymulator.router:app"]
+    process = subprocess.Popen(
+        [*command, "--port", str(port), "--log-level", "warning"], env=env
+    )
+    url = f"http://localhost:{port}"
+    wait_for(url)
+    yield url
+    process.terminate()
+    process.wait()
+
+
+def frames(response: httpx.Response):
+    for line in response.iter_lines():
+        if line.startswith("data: "):
+            yield json.loads(line.removeprefix("data: "))
+
+
+def test_router(nodes):
+    with TestClient(create_app(nodes)) as client:
+        client.post("/command/reset", json={"time_speed": 1})
+        config = client.post("/command/pause").json()
+        for url in nodes:
+            assert httpx.get(f"{url}/state/config").json() == config
+
+        forks = [client.post("/command/fork").json()["dryer_id"] for _ in range(20)]
+        # a fork of a fork lands on the node of its parent
+        child = client.post("/command/fork", params={"dryer_id": forks[0]}).json()
+        assert child["parent_id"] == forks[0]
+        forks.append(child["dryer_id"])
+        for dryer_id in forks:
+            response = client.get("/state/current", params={"dryer_id": dryer_id})
+            assert response.status_code == 200
+        # both nodes have some of the forks
+        counts = [
+            httpx.get(f"{url}/fleet/aggregate").json()[0]["count"] for url in nodes
+        ]
+        assert sum(counts) == 21 and min(counts) > 0
+
+        readings = [
+            {
+                "dryer_id": f"real-{number}",
+                "time_seconds": 0,
+                "fraction_initial": 0.9,
+                "weight": 300 + number,
+            }
+            for number in range(10)
+        ]
+        assert client.post("/ingest", json=readings).json()["accepted"] == 10
+        client.put("/fleet/tags/real-3", json={"line": "2"})
+        (line,) = client.get(
+            "/fleet/aggregate", params={"metric": "weight", "group_by": "line"}
+        ).json()[1:]
+        assert line == {"group": "2", "count": 1, "mean": 303, "min": 303, "max": 303}
+        params = {"metric": "weight"}
+        (everything,) = client.get("/fleet/aggregate", params=params).json()
+        assert everything["count"] == 31
+
+        # any boolean the nodes accept, e.g. True as sent by requests
+        for descending in ("true", "True", "1", "yes"):
+            params = {"sort_by": "weight", "descending": descending, "k": 3}
+            heaviest = client.get("/fleet/dryers", params=params).json()
+            assert [dryer["dryer_id"] for dryer in heaviest] == [
+                "real-9",
+                "real-8",
+                "real-7",
+            ]
+        response = client.get("/fleet/dryers", params={"where": "line<2"})
+        assert response.status_code == 422
+
+
+def test_router_streams(nodes, router_url):
+    ring = HashRing(nodes, settings.router_replicas)
+    # a sensor-backed dryer on each node
+    dryer_ids = [ring.key_on(node) for node in nodes]
+
+    def ingest(weight: float):
+        readings = [
+            {
+                "dryer_id": dryer_id,
+                "time_seconds": 0,
+                "fraction_initial": 0.9,
+                "weight": weight,
+            }
+            for dryer_id in dryer_ids
+        ]
+        httpx.post(f"{router_url}/ingest", json=readings).raise_for_status()
+
+    ingest(300)
+    with httpx.stream("GET", f"{router_url}/fleet/stream") as response:
+        stream = frames(response)
+        # one snapshot of the dryers of both nodes, then deltas only
+        first = next(stream)
+        assert first["snapshot"] and set(dryer_ids) <= set(first["states"])
+        ingest(200)
+        weights = {}
+        for frame in stream:
+            assert not frame["snapshot"]
+            for dryer_id, state in frame["states"].items():
+                weights[dryer_id] = state["weight"]
+            if set(dryer_ids) <= set(weights):
+                break
+        assert [weights[dryer_id] for dryer_id in dryer_ids] == [200, 200]
+
+    with httpx.stream("GET", f"{router_url}/events") as response:
+        rule = {"metric": "weight", "op": "below", "value": 250}
+        added = []
+        for dryer_id in dryer_ids:
+            rule["dryer_id"] = dryer_id
+            added.append(httpx.post(f"{router_url}/rules", json=rule).json())
+        stream = frames(response)
+        triggered = [next(stream)["rule"] for _ in dryer_ids]
+        # under the ids the router gave them
+        assert sorted(triggered, key=lambda rule: rule["id"]) == sorted(
+            added, key=lambda rule: rule["id"]
+        )
+
+    response = httpx.get(f"{router_url}/fleet/stream", params={"where": "line<2"})
+    assert response.status_code == 422
+
+
+def test_router_batch(nodes):
+    ring = HashRing(nodes, settings.router_replicas)
+    with TestClient(create_app(nodes)) as client:
+        # a fork on each node
+        forks: dict[str, str] = {}
+        while len(forks) < len(nodes):
+            dryer_id = client.post("/command/fork").json()["dryer_id"]
+            forks.setdefault(ring.node(dryer_id), dryer_id)
+        first, second = forks[nodes[0]], forks[nodes[1]]
+
+        commands = [
+            {"dryer_id": first, "command": "pause"},
+            {"dryer_id": first, "command": "resume"},
+        ]
+        response = client.post("/command/batch", json={"commands": commands})
+        assert response.json()["applied"]
+        version = response.json()["results"][-1]["version"]
+
+        commands = [
+            {"dryer_id": first, "command": "pause"},
+            {"dryer_id": second, "command": "pause"},
+        ]
+        response = client.post("/command/batch", json={"commands": commands})
+        assert response.status_code == 422
+        assert "several nodes" in response.json()["detail"]
+
+        # not atomic: split by node, the results in the order of the commands
+        commands = [
+            {"dryer_id": second, "command": "fast_forward", "seconds": 60},
+            {"dryer_id": first, "command": "pause", "expected_version": version},
+            {"command": "pause"},
+            {"dryer_id": second, "command": "pause", "expected_version": version + 5},
+        ]
+        batch = {"commands": commands, "atomic": False}
+        response = client.post("/command/batch", json=batch).json()
+        assert not response["applied"]
+        assert [result["dryer_id"] for result in response["results"]] == [
+            second,
+            first,
+            None,
+            second,
+        ]
+        statuses = [result["status_code"] for result in response["results"]]
+        assert statuses == [200, 200, 200, 409]
+        for url in nodes:
+            assert not httpx.get(f"{url}/state/config").json()["is_active"]
+
+        response = client.post("/command/batch", json={"commands": [{}]})
+        assert response.status_code == 422
+
+
+def test_router_rules_and_faults(nodes):
+    ring = HashRing(nodes, settings.router_replicas)
+    with TestClient(create_app(nodes)) as client:
+        # a fork on each node
+        forks: dict[str, str] = {}
+        while len(forks) < len(nodes):
+            dryer_id = client.post("/command/fork").json()["dryer_id"]
+            forks.setdefault(ring.node(dryer_id), dryer_id)
+
+        rule = {"metric": "weight", "op": "below", "value": 1}
+        added = [
+            client.post("/rules", json={**rule, "dryer_id": dryer_id}).json()
+            for dryer_id in forks.values()
+        ]
+        for node, dryer_id in forks.items():
+            (on_node,) = httpx.get(
+                f"{node}/rules", params={"dryer_id": dryer_id}
+            ).json()
+            assert on_node["dryer_id"] == dryer_id
+        # listed from every node, under ids that tell them apart
+        listed = client.get("/rules").json()
+        assert all(rule in listed for rule in added)
+        assert len({rule["id"] for rule in listed}) == len(listed)
+        params = {"dryer_id": added[1]["dryer_id"]}
+        assert client.get("/rules", params=params).json() == [added[1]]
+        for rule in added:
+            assert client.delete(f"/rules/{rule['id']}").json() == rule
+            assert client.delete(f"/rules/{rule['id']}").status_code == 404
+        assert not any(rule in client.get("/rules").json() for rule in added)
+
+        # a fault of a dryer is injected by the node serving it
+        node, dryer_id = list(forks.items())[1]
+        fault = {"path": "/state/current", "dryer_id": dryer_id, "error_rate": 1}
+        fault = client.post("/faults", json=fault).json()
+        (on_node,) = httpx.get(f"{node}/faults").json()
+        assert on_node["dryer_id"] == dryer_id
+        response = client.get("/state/current", params={"dryer_id": dryer_id})
+        assert response.headers["x-injected-fault"] == "error"
+        assert client.get("/faults").json() == [fault]
+        assert client.delete(f"/faults/{fault['id']}").json() == fault
+        response = client.get("/state/current", params={"dryer_id": dryer_id})
+        assert response.status_code == 200
+        assert client.get("/faults").json() == []
@@ -0,0 +1,92 @@
+from .models import RuleCreate, StatePublic
+from .rules import RuleEngine, ThresholdIndex
+
+
+def state(time_seconds, weight, fraction_initial=0.5):
+    return StatePublic(
+        time_seconds=time_seconds, weight=weight, fraction_initial=fraction_initial
+    )
+
+
+def triggered(events):
+    return sorted(event.rule.id for event in events)
+
+
+def test_threshold_index_crossed():
+    index = ThresholdIndex()
+    engine = RuleEngine()
+    for value in (10, 20, 30):
+        index.add(engine.add(RuleCreate(metric="weight", op="below", value=value)))
+        index.add(engine.add(RuleCreate(metric="weight", op="above", value=value)))
+    assert index.crossed(35, 25) == [5, 6]
+    assert index.crossed(25, 35) == [5, 6]
+    assert index.crossed(30, 20) == [5, 4]  # x < 30 starts, x > 20 stops holding
+    assert index.crossed(12, 18) == []
+
+
+def test_threshold_rule():
+    engine = RuleEngine()
+    rule = engine.add(RuleCreate(metric="weight", op="below", value=100))
+    assert engine.update(None, state(0, 150)) == []
+    events = engine.update(None, state(30, 99))
+    assert triggered(events) == [rule.id]
+    assert events[0].observed == 99
+    # edge triggered: no new event while the condition holds
+    assert engine.update(None, state(60, 98)) == []
+    engine.update(None, state(90, 101))
+    assert triggered(engine.update(None, state(120, 97))) == [rule.id]
+
+
+def test_rule_already_holding_triggers():
+    engine = RuleEngine()
+    engine.update("a", state(0, 50))
+    rule = engine.add(RuleCreate(dryer_id="a", metric="weight", op="below", value=100))
+    assert triggered(engine.update("a", state(30, 49))) == [rule.id]
+    # other dryers are not affected
+    assert engine.update("b", state(30, 49)) == []
+
+
+def test_rate_and_duration_rule():
+    engine = RuleEngine()
+    # stalled: less than 1 g lost per hour for 10 minutes
+    rule = engine.add(
+        RuleCreate(metric="drying_rate", op="below", value=1, for_seconds=600)
+    )
+    engine.update(None, state(0, 100))
+    engine.update(None, state(3600, 90))  # 10 g/h
+    assert engine.update(None, state(3900, 89.99)) == []  # stalled from here
+    assert engine.update(None, state(4200, 89.98)) == []
+    assert triggered(engine.update(None, state(4500, 89.97))) == [rule.id]
+    assert engine.update(None, state(5000, 89.96)) == []
+
+
+def test_duration_interrupted():
+    engine = RuleEngine()
+    engine.add(RuleCreate(metric="weight", op="below", value=100, for_seconds=60))
+    engine.update(None, state(0, 110))
+    engine.update(None, state(30, 90))
+    engine.update(None, state(60, 110))
+    assert engine.update(None, state(120, 110)) == []
+
+
+def test_remove_rule():
+    engine = RuleEngine()
+    rule = engine.add(RuleCreate(metric="weight", op="below", value=100))
+    engine.update(None, state(0, 150))
+    engine.remove(rule.id)
+    assert engine.update(None, state(30, 50)) == []
+    assert len(engine) == 0
+
+
+def test_dryer_ids():
+    engine = RuleEngine()
+    rules = [
+        engine.add(RuleCreate(dryer_id=dryer_id, metric="weight", op="below", value=1))
+        for dryer_id in ["a", "a", "b", None]
+    ]
+    assert engine.dryer_ids() == ["a", "b", None]
+    engine.remove(rules[0].id)
+    assert engine.dryer_ids() == ["a", "b", None]
+    engine.remove(rules[1].id)
+    engine.remove_dryer("b")
+    assert engine.dryer_ids() == [None]
@@ -0,0 +1,61 @@
+import pyarrow.parquet
+import pytest
+
+from .scenario import Scenario, load_scenarios, main, run_scenarios
+
+PAUSE_RESUME = """
+name: pause-and-resume
+time_speed: 10
+steps:
+  - reset
+  - wait: 2h
+  - query: before-pause
+  - pause
+  - wait: 20m
+  - query: paused
+  - resume
+  - wait: 60
+  - fast_forward: {seconds: 1m}
+  - query
+"""
+
+
+def test_pause_resume_in_virtual_time(tmp_path):
+    path = tmp_path / "pause.yaml"
+    path.write_text(PAUSE_RESUME)
+    (scenario,) = load_scenarios(path)
+
+    table = run_scenarios([scenario], workers=1).to_pydict()
+    assert table["query"] == ["before-pause", "paused", "step-9"]
+    assert table["elapsed_seconds"] == [7200, 8400, 8460]
+    # the state is frozen while paused, but the clock runs on as the live one
+    assert table["simulated_seconds"] == [72000, 72000, 84660]
+    assert table["time_seconds"] == [72000, 72000, 84660]
+    assert table["weight"][0] == table["weight"][1] > table["weight"][2]
+
+
+def test_batch_over_processes(tmp_path):
+    scenarios = [
+        Scenario(
+            name=f"speed-{speed}",
+            time_speed=speed,
+            steps=["reset", {"wait": "1h"}, "query"],
+        )
+        for speed in range(1, 41)
+    ]
+    path = tmp_path / "scenarios.json"
+    path.write_text(
+        "[" + ",".join(scenario.model_dump_json() for scenario in scenarios) + "]"
+    )
+
+    output = tmp_path / "results.parquet"
+    main([str(path), "-o", str(output), "-j", "2"])
+    table = pyarrow.parquet.read_table(output).to_pydict()
+    assert table["scenario"] == [scenario.name for scenario in scenarios]
+    assert table["simulated_seconds"] == [speed * 3600 for speed in range(1, 41)]
+
+
+def test_unknown_trajectory():
+    scenario = Scenario(name="missing", steps=[{"reset": {"trajectory": "nope"}}])
+    with pytest.raises(ValueError, match="unknown trajectory nope"):
+        run_scenarios([scenario], workers=1)
@@ -1,12 +1,44 @@
 from fastapi.testclient import TestClient
 from fastapi.encoders import jsonable_encoder
-from .server import app, ConfigCreate
+from sqlmodel import Session, delete
+from . import checkpoint
+from .anomaly import AnomalyDetector
+from .estimation import MoistureFilter
+from .live import LiveDryers
+from .models import Config, ConfigChange, ConfigPublic, CurrentState
+from .rules import RuleEngine
+from .server import (
+    app,
+    ConfigCreate,
+    engine,
+    evaluate_rules,
+    forecasts,
+    init_state_config,
+    live,
+    refit_forecasts,
+    restore_checkpoint,
+    rules,
+    settings,
+    write_readings,
+)
+from .simulation import SimulationRegistry
+from .trajectory import SAMPLE_DTYPE
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
 import time
+from datetime import datetime, timedelta
 
-client = TestClient(app)
 
+@pytest.fixture(scope="module")
+def client():
+    # entering the client runs the lifespan, which creates and fills the db
+    with TestClient(app) as client:
+        yield client
 
-def test_reset():
+
+def test_reset(client):
     config = jsonable_encoder(
         ConfigCreate(time_speed=0.1)
     )  # make sure there is no update before we query
@@ -21,9 +53,11 @@ def test_reset():
     assert state0["time_seconds"] == 0
     current_state = client.get("/state/current").json()
     assert current_state == state0
+    # a simulation has no sensor, hence no anomalies field
+    assert "anomalies" not in current_state
 
 
-def test_not_active():
+def test_not_active(client):
     config = ConfigCreate(
         time_speed=100, is_active=False
     )  # fast time speed to can see change
@@ -37,7 +71,7 @@ def test_not_active():
     assert new_val == prev_val
 
 
-def test_pause():
+def test_pause(client):
     config = ConfigCreate(
         time_speed=100, is_active=True
     )  # fast time speed to can see change
@@ -50,7 +84,7 @@ def test_pause():
     assert new_val == prev_val
 
 
-def test_resume():
+def test_resume(client):
     config = ConfigCreate(
         time_speed=100, is_active=False
     )  # fast time speed to can see change
@@ -62,3 +96,415 @@ def test_resume():
     new_val = client.get("/state/current").json()
     assert new_val != prev_val
     assert new_val["time_seconds"] > prev_val["time_seconds"]
+
+
+def test_fork(client):
+    config = ConfigCreate(time_speed=100, is_active=False)
+    client.post("/command/reset", json=jsonable_encoder(config))
+    live = client.get("/state/current").json()
+
+    fork = client.post("/command/fork").json()
+    assert fork["parent_id"] is None
+    assert fork["is_active"] is False
+    dryer_id = fork["dryer_id"]
+    assert client.get("/state/current", params={"dryer_id": dryer_id}).json() == live
+
+    # fast forwarding the fork doesn't disturb the live simulation
+    fork = client.post(
+        "/command/fast_forward", params={"dryer_id": dryer_id, "seconds": 1800}
+    ).json()
+    assert fork["simulated_seconds"] == live["time_seconds"] + 1800
+    forked = client.get("/state/current", params={"dryer_id": dryer_id}).json()
+    assert forked["time_seconds"] == live["time_seconds"] + 1800
+    assert client.get("/state/current").json() == live
+
+    # a fork of a fork starts from the same point but has its own clock
+    child = client.post("/command/fork", params={"dryer_id": dryer_id}).json()
+    assert child["parent_id"] == dryer_id
+    client.post("/command/resume", params={"dryer_id": child["dryer_id"]})
+    time.sleep(1)
+    child_state = client.get(
+        "/state/current", params={"dryer_id": child["dryer_id"]}
+    ).json()
+    assert child_state["time_seconds"] > forked["time_seconds"]
+    assert client.get("/state/current", params={"dryer_id": dryer_id}).json() == forked
+
+    response = client.delete("/command/fork", params={"dryer_id": dryer_id})
+    assert response.status_code == 200
+    response = client.get("/state/current", params={"dryer_id": dryer_id})
+    assert response.status_code == 404
+
+
+def test_batch(client):
+    config = ConfigCreate(time_speed=100, is_active=True)
+    client.post("/command/reset", json=jsonable_encoder(config))
+    forks = [client.post("/command/fork").json() for _ in range(3)]
+    dryer_ids = [fork["dryer_id"] for fork in forks]
+    assert [fork["version"] for fork in forks] == [0, 0, 0]
+
+    commands = [{"dryer_id": dryer_id, "command": "pause"} for dryer_id in dryer_ids]
+    commands.append({"command": "pause"})
+    response = client.post("/command/batch", json={"commands": commands})
+    assert response.status_code == 200
+    batch = response.json()
+    assert batch["applied"] is True
+    assert [result["version"] for result in batch["results"][:3]] == [1, 1, 1]
+    assert not any(result["config"]["is_active"] for result in batch["results"])
+    live_version = batch["results"][3]["version"]
+    assert client.get("/state/config").json()["is_active"] is False
+    paused = [
+        client.get("/state/current", params={"dryer_id": dryer_id}).json()
+        for dryer_id in dryer_ids
+    ]
+
+    # a stale version rejects the whole batch
+    commands = [
+        {"dryer_id": dryer_ids[0], "command": "resume", "expected_version": 1},
+        {"command": "resume", "expected_version": live_version},
+        {"dryer_id": dryer_ids[1], "command": "resume", "expected_version": 0},
+        {"dryer_id": "unknown", "command": "resume"},
+    ]
+    response = client.post("/command/batch", json={"commands": commands})
+    assert response.status_code == 409
+    batch = response.json()
+    assert batch["applied"] is False
+    results = batch["results"]
+    assert [result["status_code"] for result in results] == [424, 424, 409, 404]
+    assert [result["version"] for result in results] == [1, live_version, 1, None]
+    assert client.get("/state/config").json()["is_active"] is False
+    time.sleep(0.1)
+    params = {"dryer_id": dryer_ids[0]}
+    assert client.get("/state/current", params=params).json() == paused[0]
+
+    # otherwise only the failed commands are not applied
+    commands = [
+        {"dryer_id": dryer_ids[0], "command": "fast_forward", "seconds": 600},
+        {"dryer_id": dryer_ids[0], "command": "resume", "expected_version": 2},
+        {"dryer_id": dryer_ids[1], "command": "fast_forward"},
+        {"command": "resume", "expected_version": live_version},
+    ]
+    response = client.post(
+        "/command/batch", json={"commands": commands, "atomic": False}
+    )
+    assert response.status_code == 200
+    batch = response.json()
+    assert batch["applied"] is False
+    results = batch["results"]
+    assert [result["status_code"] for result in results] == [200, 200, 422, 200]
+    assert [result["version"] for result in results[:3]] == [2, 3, 1]
+    assert results[3]["version"] > live_version
+    assert client.get("/state/config").json()["is_active"] is True
+    state = client.get("/state/current", params=params).json()
+    assert state["time_seconds"] >= paused[0]["time_seconds"] + 600
+    params = {"dryer_id": dryer_ids[1]}
+    assert client.get("/state/current", params=params).json() == paused[1]
+
+    # resuming a running fork is a no-op, its version stays put
+    command = {"dryer_id": dryer_ids[0], "command": "resume", "expected_version": 3}
+    for _ in range(2):
+        response = client.post("/command/batch", json={"commands": [command]})
+        assert response.status_code == 200
+        assert response.json()["results"][0]["version"] == 3
+
+    for dryer_id in dryer_ids:
+        client.delete("/command/fork", params={"dryer_id": dryer_id})
+
+
+def test_ensemble(client):
+    config = ConfigCreate(time_speed=100, is_active=False)
+    client.post("/command/reset", json=jsonable_encoder(config))
+    response = client.get(
+        "/state/ensemble",
+        params={"target_weight": 100, "n": 500, "steps": 10, "seed": 0},
+    )
+    assert response.status_code == 200
+    ensemble = response.json()
+    assert ensemble["n"] == 500
+    assert len(ensemble["weight_p50"]) == 10
+    assert ensemble["time_to_target_p5"] <= ensemble["time_to_target_p95"]
+
+
+def test_rules(client):
+    config = ConfigCreate(time_speed=100, is_active=False)
+    client.post("/command/reset", json=jsonable_encoder(config))
+    dryer_id = client.post("/command/fork").json()["dryer_id"]
+
+    rule = {"dryer_id": dryer_id, "metric": "weight", "op": "below", "value": 250}
+    rule = client.post("/rules", json=rule).json()
+    assert client.get("/rules", params={"dryer_id": dryer_id}).json() == [rule]
+
+    queue = rules.subscribe()
+    evaluate_rules()
+    assert queue.empty()
+    client.post("/command/fast_forward", params={"dryer_id": dryer_id, "seconds": 7200})
+    evaluate_rules()
+    assert queue.get_nowait().rule.id == rule["id"]
+    rules.unsubscribe(queue)
+
+    assert client.delete(f"/rules/{rule['id']}").status_code == 200
+    assert client.delete(f"/rules/{rule['id']}").status_code == 404
+    unknown = {"dryer_id": "unknown", "metric": "weight", "op": "below", "value": 1}
+    assert client.post("/rules", json=unknown).status_code == 404
+
+
+def test_binary_state(client):
+    json_state = client.get("/state/time", params={"second_after": 100}).json()
+    response = client.get(
+        "/state/time",
+        params={"second_after": 100},
+        headers={"Accept": "application/octet-stream"},
+    )
+    assert response.headers["content-type"] == "application/octet-stream"
+    record = np.frombuffer(response.content, dtype=SAMPLE_DTYPE)[0]
+    assert record["time_seconds"] == json_state["time_seconds"] == 90
+    assert record["weight"] == json_state["weight"]
+
+
+def test_unknown_trajectory(client):
+    config = jsonable_encoder(ConfigCreate(trajectory="unknown"))
+    assert client.post("/command/reset", json=config).status_code == 404
+    names = [t["name"] for t in client.get("/trajectories").json()]
+    assert "default" in names
+
+
+def test_faults(client):
+    dryer_id = client.post("/command/fork").json()["dryer_id"]
+    fault = {"path": "/state/current", "dryer_id": dryer_id, "error_rate": 1}
+    fault = client.post("/faults", json=fault).json()
+    assert client.get("/faults").json() == [fault]
+
+    response = client.get("/state/current", params={"dryer_id": dryer_id})
+    assert response.status_code == 500
+    assert response.headers["x-injected-fault"] == "error"
+    assert client.get("/state/current").status_code == 200
+
+    assert client.delete(f"/faults/{fault['id']}").status_code == 200
+    assert client.delete(f"/faults/{fault['id']}").status_code == 404
+    response = client.get("/state/current", params={"dryer_id": dryer_id})
+    assert response.status_code == 200
+
+
+def test_ingest(client):
+    readings = [
+        {"dryer_id": "real-1", "time_seconds": t, "fraction_initial": f, "weight": w}
+        for t, f, w in [(0, 0.9, 300.0), (60, 0.8, 270.0), (30, 0.85, 285.0)]
+    ]
+    readings.append({**readings[0], "dryer_id": "real-2"})
+    response = client.post("/ingest", json=readings)
+    assert response.json()["accepted"] == 4
+
+    # the late reading does not replace the current state
+    state = client.get("/state/current", params={"dryer_id": "real-1"}).json()
+    assert state == {
+        "time_seconds": 60,
+        "fraction_initial": 0.8,
+        "weight": 270.0,
+        # relative to the earliest reading, at 0.9
+        "dry_basis_moisture": pytest.approx(8.0),
+        "moisture_ratio": pytest.approx(0.8 / 0.9),
+        "drying_rate": 1800.0,
+        # losing weight faster than max_rate
+        "anomalies": ["jump"],
+    }
+    state = client.get("/state/current", params={"dryer_id": "real-2"}).json()
+    assert state["anomalies"] == []
+    response = client.get(
+        "/state/current",
+        params={"dryer_id": "real-1"},
+        headers={"Accept": "application/octet-stream"},
+    )
+    assert np.frombuffer(response.content, dtype=SAMPLE_DTYPE)[0]["weight"] == 270
+
+    params = {"dryer_id": "real-1", "second_after": 40}
+    assert client.get("/state/time", params=params).json()["weight"] == 285
+    params = {"dryer_id": "real-2", "second_after": 40}
+    assert client.get("/state/time", params=params).json()["weight"] == 300
+    params = {"dryer_id": "unknown", "second_after": 40}
+    assert client.get("/state/time", params=params).status_code == 404
+
+
+def test_fleet(client):
+    dryer_id = client.post("/command/fork").json()["dryer_id"]
+    assert client.put(f"/fleet/tags/{dryer_id}", json={"line": "7"}).status_code == 200
+    assert client.put("/fleet/tags/unknown", json={}).status_code == 404
+
+    (dryer,) = client.get("/fleet/dryers", params={"where": "line=7"}).json()
+    assert dryer["dryer_id"] == dryer_id
+    (group,) = client.get(
+        "/fleet/aggregate", params={"metric": "weight", "group_by": "line"}
+    ).json()[-1:]
+    assert group == {
+        "group": "7",
+        "count": 1,
+        "mean": dryer["weight"],
+        "min": dryer["weight"],
+        "max": dryer["weight"],
+    }
+    response = client.get("/fleet/dryers", params={"where": "weight<heavy"})
+    assert response.status_code == 422
+
+
+def test_estimate(client):
+    readings = [
+        {
+            "dryer_id": "noisy",
+            "time_seconds": t,
+            "fraction_initial": 0.9,
+            "weight": 300 - t / 60 + (-1) ** (t // 30),
+        }
+        for t in range(0, 3600, 30)
+    ]
+    client.post("/ingest", json=readings)
+    estimate = client.get("/state/estimate", params={"dryer_id": "noisy"}).json()
+    assert estimate["time_seconds"] == 3570
+    assert abs(estimate["weight"] - (300 - 3570 / 60)) < 3 * estimate["weight_std"]
+    assert abs(estimate["drying_rate"] - 60) < 3 * estimate["drying_rate_std"]
+    assert estimate["anomalies"] == []
+    reading = {**readings[-1], "time_seconds": 3600, "weight": 300}
+    client.post("/ingest", json=[reading])
+    estimate = client.get("/state/estimate", params={"dryer_id": "noisy"}).json()
+    assert estimate["anomalies"] == ["jump"]
+    dryers = client.get("/fleet/dryers", params={"k": 1000}).json()
+    assert [d["anomalies"] for d in dryers if d["dryer_id"] == "noisy"] == [["jump"]]
+    params = {"dryer_id": "unknown"}
+    assert client.get("/state/estimate", params=params).status_code == 404
+
+
+def test_forecast(client):
+    dryer_id = client.post("/command/fork").json()["dryer_id"]
+    params = {"dryer_id": dryer_id}
+    client.post("/command/pause", params=params)
+    client.post("/command/fast_forward", params={**params, "seconds": 3600})
+    response = client.get("/state/forecast", params={**params, "steps": 5})
+    assert response.status_code == 200
+    forecast = response.json()
+    assert len(forecast["weight"]) == 5
+    assert forecast["time_seconds"][0] >= 3600
+    assert forecast["weight"][-1] < forecast["weight"][0]
+    params = {"dryer_id": dryer_id, "horizon": 600}
+    forecast = client.get("/state/forecast", params=params).json()
+    assert forecast["time_seconds"][-1] - forecast["time_seconds"][0] == 600
+
+    readings = [
+        {"dryer_id": "few", "time_seconds": 0, "fraction_initial": 0.9, "weight": 300}
+    ]
+    client.post("/ingest", json=readings)
+    response = client.get("/state/forecast", params={"dryer_id": "few"})
+    assert response.status_code == 409
+
+
+def test_refit_forecasts(client):
+    readings = [
+        {"dryer_id": "refit", "time_seconds": t, "fraction_initial": f, "weight": w}
+        for t, f, w in [(0, 0.9, 300), (600, 0.8, 267), (1200, 0.72, 240)]
+    ]
+    client.post("/ingest", json=readings)
+    params = {"dryer_id": "refit", "steps": 5}
+    forecast = client.get("/state/forecast", params=params).json()
+    write_readings(live.drain())
+
+    # restarted from a checkpoint, before and after the readings are refitted
+    forecasts.remove("refit")
+    assert client.get("/state/forecast", params=params).status_code == 409
+    with Session(engine) as session:
+        refit_forecasts(session)
+    assert client.get("/state/forecast", params=params).json() == forecast
+
+
+def test_restore_paused(client, tmp_path, monkeypatch):
+    start_time = datetime.now() - timedelta(seconds=3)
+    config = ConfigCreate(start_time=start_time, time_speed=60, is_active=True)
+    client.post("/command/reset", json=jsonable_encoder(config))
+    paused = client.get("/state/current").json()
+    assert paused["time_seconds"] >= 180
+    config = ConfigPublic.model_validate(client.post("/command/pause").json())
+
+    # a checkpoint of the paused live simulation alone, then the database is lost
+    path = tmp_path / "checkpoint.npz"
+    arrays = checkpoint.take(
+        SimulationRegistry(max_forks=1),
+        {},
+        RuleEngine(),
+        LiveDryers(),
+        MoistureFilter(0.5, 1e-10),
+        AnomalyDetector(),
+        config,
+        paused["time_seconds"],
+    )
+    checkpoint.CheckpointWriter(path).write(arrays, 1.0)
+    monkeypatch.setattr(settings, "checkpoint_file", str(path))
+    restored_at = datetime.now()
+    with Session(engine) as session:
+        for table in (Config, CurrentState, ConfigChange):
+            session.exec(delete(table))
+        session.commit()
+        restore_checkpoint(session)
+        init_state_config(session)
+
+    assert client.get("/state/current").json() == paused
+    # the restored config is only known to be in effect from the restore
+    params = {"wallclock": (restored_at - timedelta(seconds=1)).isoformat()}
+    assert client.get("/state/at", params=params).status_code == 404
+    params = {"wallclock": datetime.now().isoformat()}
+    assert client.get("/state/at", params=params).json() == paused
+    # the clock ran on, as if the server had not restarted
+    client.post("/command/resume")
+    resumed = client.get("/state/current").json()
+    assert resumed["time_seconds"] >= paused["time_seconds"]
+
+
+def test_state_at(client):
+    start_time = datetime.now() - timedelta(seconds=1000)
+    config = ConfigCreate(start_time=start_time, time_speed=1, is_active=True)
+    client.post("/command/reset", json=jsonable_encoder(config))
+    served_at = datetime.now()
+    current_state = client.get("/state/current").json()
+    client.post("/command/pause")
+
+    # while running, the sample at the elapsed time
+    elapsed = (served_at - start_time).total_seconds()
+    params = {"wallclock": served_at.isoformat()}
+    expected = client.get("/state/time", params={"second_after": round(elapsed)})
+    assert client.get("/state/at", params=params).json() == expected.json()
+    # once paused, the state it froze on
+    params = {"wallclock": datetime.now().isoformat()}
+    assert client.get("/state/at", params=params).json() == current_state
+
+    params = {"wallclock": "2000-01-01T00:00:00"}
+    assert client.get("/state/at", params=params).status_code == 404
+    params = {"wallclock": (datetime.now() + timedelta(hours=1)).isoformat()}
+    assert client.get("/state/at", params=params).status_code == 422
+
+
+def test_export(client):
+    response = client.get("/export/trajectory")
+    assert response.headers["content-type"] == "application/vnd.apache.parquet"
+    trajectory = pq.read_table(pa.py_buffer(response.content))
+    assert trajectory.num_rows == 5762
+
+    params = {"format": "arrow", "batch_size": 100}
+    response = client.get("/export/states", params=params)
+    states = pa.ipc.open_stream(response.content).read_all()
+    assert states.num_rows > 0
+    commands = client.get("/export/commands", params={"format": "arrow"})
+    commands = pa.ipc.open_stream(commands.content).read_all()
+    assert commands.num_rows > 1
+    assert states.column("wallclock")[0] == commands.column("changed_at")[0]
+
+
+def test_similar(client):
+    trajectory = client.get("/export/trajectory", params={"format": "arrow"})
+    samples = pa.ipc.open_stream(trajectory.content).read_all().slice(0, 120)
+    readings = [{"dryer_id": "twin", **sample} for sample in samples.to_pylist()]
+    client.post("/ingest", json=readings)
+    response = client.get("/state/similar", params={"dryer_id": "twin", "k": 5})
+    assert response.status_code == 200
+    [similar] = response.json()
+    assert similar["name"] == "default"
+    assert similar["distance"] < 1e-6
+    assert similar["remaining_seconds"] == similar["duration_seconds"] - 3570
+
+    # a simulation is not compared with the trajectory it replays
+    dryer_id = client.post("/command/fork").json()["dryer_id"]
+    response = client.get("/state/similar", params={"dryer_id": dryer_id})
+    assert response.json() == []
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from .kinetics import PageModel
+from .similar import SimilarityIndex
+
+
+def run(k: float, hours: float = 10) -> tuple[np.ndarray, np.ndarray]:
+    t = np.arange(0, hours * 3600, 30)
+    return t, PageModel(k=k, n=1.1, f0=0.9, f_eq=0.05, w0=300.0).fraction(t)
+
+
+RUNS = {f"run-{i}": run(k) for i, k in enumerate(np.geomspace(5e-5, 5e-4, 20))}
+
+
+def test_closest_runs():
+    index = SimilarityIndex(step_seconds=600)
+    assert index.update(RUNS, RUNS.__getitem__) == 20
+    assert index.features.shape == (20, 60)
+
+    t, fraction = RUNS["run-7"]
+    rng = np.random.default_rng(0)
+    noisy = fraction[:240] + rng.normal(0, 0.002, 240)
+    similar = index.query(t[:240], noisy, k=3)
+    assert similar[0].name == "run-7"
+    assert {run.name for run in similar[1:]} == {"run-6", "run-8"}
+    assert similar[0].distance < 0.005 < similar[1].distance
+    assert similar[0].remaining_seconds == pytest.approx(t[-1] - t[239])
+    assert similar[0].final_fraction_initial == pytest.approx(fraction[-1])
+
+    similar = index.query(t[:240], noisy, k=3, exclude=["run-7"])
+    assert "run-7" not in [run.name for run in similar]
+    assert index.query(t[:0], noisy[:0]) == []
+
+
+def test_incremental_update():
+    index = SimilarityIndex(step_seconds=600)
+    index.update(["run-0", "run-1"], RUNS.__getitem__)
+    before = index.features.copy()
+
+    # a longer run widens the matrix, the indexed rows hold their final value
+    loaded = []
+    runs = {**RUNS, "long": run(1e-4, hours=20)}
+
+    def samples(name):
+        loaded.append(name)
+        return runs[name]
+
+    assert index.update(["run-0", "run-1", "long"], samples) == 1
+    assert loaded == ["long"]
+    assert index.names == ["long", "run-0", "run-1"]
+    assert index.features.shape == (3, 120)
+    assert np.array_equal(index.features[1, :60], before[0])
+    assert np.all(index.features[1, 60:] == before[0, -1])
+
+    # removed runs are dropped, missing ones skipped
+    assert index.update(["long", "gone"], samples) == 0
+    assert index.names == ["long"]
+    t, fraction = runs["long"]
+    assert index.query(t, fraction, k=5)[0].name == "long"
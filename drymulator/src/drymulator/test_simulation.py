@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from .models import ConfigCreate
+from .simulation import ForkLimitError, Simulation, SimulationRegistry
+from .trajectory import SAMPLE_DTYPE, Trajectory
+
+
+@pytest.fixture
+def trajectory():
+    return Trajectory([0, 30, 60, 90], [1.0, 0.9, 0.8, 0.7], [100.0, 90.0, 80.0, 70.0])
+
+
+def test_nearest_index(trajectory):
+    assert trajectory.nearest_index(-10) == 0
+    assert trajectory.nearest_index(14) == 0
+    assert trajectory.nearest_index(15) == 0  # ties go to the earlier sample
+    assert trajectory.nearest_index(16) == 1
+    assert trajectory.nearest_index(1000) == 3
+    assert trajectory.state_at(61).weight == 80.0
+
+
+def test_trajectory_read_only(trajectory):
+    with pytest.raises(ValueError):
+        trajectory.weight[0] = 0.0
+
+
+def test_clock(trajectory):
+    t0 = datetime(2025, 1, 1)
+    simulation = Simulation(trajectory, "default", t0, time_speed=10.0)
+    assert simulation.simulated_seconds(t0 + timedelta(seconds=3)) == 30.0
+
+    simulation.pause(t0 + timedelta(seconds=3))
+    assert simulation.simulated_seconds(t0 + timedelta(seconds=60)) == 30.0
+    simulation.resume(t0 + timedelta(seconds=60))
+    assert simulation.simulated_seconds(t0 + timedelta(seconds=63)) == 60.0
+    # resuming a running clock changes nothing, not even its version
+    version = simulation.version
+    simulation.resume(t0 + timedelta(seconds=62))
+    assert simulation.version == version
+    assert simulation.simulated_seconds(t0 + timedelta(seconds=63)) == 60.0
+    assert simulation.config().start_time == t0 + timedelta(seconds=57)
+
+    simulation.fast_forward(30)
+    assert simulation.current_state(t0 + timedelta(seconds=63)).time_seconds == 90
+
+    config = ConfigCreate(start_time=t0, time_speed=1.0, is_active=False)
+    simulation.reset(config, trajectory)
+    assert simulation.simulated_seconds() == 0.0
+
+
+def test_fork_shares_trajectory(trajectory):
+    registry = SimulationRegistry(max_forks=2)
+    parent = Simulation(trajectory, "default", datetime(2025, 1, 1), is_active=False)
+    dryer_id = registry.add_fork(parent)
+    fork = registry.get(dryer_id)
+    assert fork.trajectory is parent.trajectory
+
+    fork.fast_forward(60)
+    assert parent.simulated_seconds() == 0.0
+    assert registry.public(dryer_id).simulated_seconds == 60.0
+
+    registry.add_fork(fork, parent_id=dryer_id)
+    with pytest.raises(ForkLimitError):
+        registry.add_fork(parent)
+
+
+def test_encoded_samples(trajectory):
+    state = trajectory.state(1)
+    assert trajectory.json(1) == state.model_dump_json(exclude={"anomalies"}).encode()
+    record = np.frombuffer(trajectory.binary(3), dtype=SAMPLE_DTYPE)[0]
+    assert record["time_seconds"] == 90
+    assert record["weight"] == 70.0
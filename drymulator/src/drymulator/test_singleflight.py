@@ -0,0 +1,46 @@
+import asyncio
+
+from .singleflight import SingleFlight
+
+
+async def slow_double(value, started):
+    started.append(value)
+    await asyncio.sleep(0.01)
+    return value * 2
+
+
+def test_coalesce_same_key():
+    async def main():
+        flights, started = SingleFlight(), []
+        results = await asyncio.gather(
+            *(flights.do("a", slow_double, 1, started) for _ in range(10)),
+            flights.do("b", slow_double, 2, started),
+        )
+        return flights, started, results
+
+    flights, started, results = asyncio.run(main())
+    assert results == [2] * 10 + [4]
+    assert started == [1, 2]
+    assert flights.calls == 2
+
+
+def test_new_call_after_completion():
+    async def main():
+        flights, started = SingleFlight(), []
+        await flights.do("a", slow_double, 1, started)
+        await flights.do("a", slow_double, 1, started)
+        return started
+
+    assert asyncio.run(main()) == [1, 1]
+
+
+def test_cancelled_caller_does_not_cancel_flight():
+    async def main():
+        flights, started = SingleFlight(), []
+        first = asyncio.ensure_future(flights.do("a", slow_double, 1, started))
+        second = asyncio.ensure_future(flights.do("a", slow_double, 1, started))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 2
@@ -0,0 +1,29 @@
+import numpy as np
+
+from .library import TrajectoryLibrary
+from .synthetic import generate, generate_library, reference_model
+
+
+def test_generate():
+    model, _ = reference_model()
+    runs = list(generate(model, count=3, samples=1000, interval=60, seed=0))
+    assert len(runs) == 3
+    time_seconds, fraction_initial, weight = runs[0]
+    assert time_seconds[-1] == 999 * 60
+    assert abs(fraction_initial[0] - model.f0) < 0.01
+    # drying, despite the noise
+    assert fraction_initial[-100:].mean() < fraction_initial[:100].mean() - 0.3
+    assert not np.array_equal(runs[0][2], runs[1][2])
+    again = list(generate(model, count=3, samples=1000, interval=60, seed=0))
+    assert np.array_equal(again[2][2], runs[2][2])
+
+
+def test_generate_library(tmp_path):
+    generate_library(tmp_path, count=2, samples=500, seed=0)
+    generate_library(tmp_path / "csv", count=1, samples=500, format="csv", seed=0)
+    library = TrajectoryLibrary(tmp_path, memory_budget=2**20)
+    assert library.names() == ["csv/run-0", "run-0", "run-1"]
+    trajectory = library.get("csv/run-0")
+    assert len(trajectory) == 500
+    # stretched to the default duration, the run dries as much
+    assert trajectory.fraction_initial[-1] < 0.1
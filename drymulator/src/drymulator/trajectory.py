@@ -0,0 +1,212 @@
+from functools import cached_property
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from sqlmodel import Session, select
+
+from .kinetics import PageModel
+from .models import HistoryState, StatePublic
+
+# binary encoding of a sample, little-endian and 24 bytes long
+SAMPLE_DTYPE = np.dtype(
+    [("time_seconds", "<i8"), ("fraction_initial", "<f8"), ("weight", "<f8")]
+)
+
+
+# drying rates are averaged over this window, the readings are too coarse
+# (and noisy) for the change between two consecutive ones
+RATE_WINDOW_SECONDS = 600
+
+DERIVED = ("dry_basis_moisture", "moisture_ratio", "drying_rate")
+
+
+def derived_quantities(
+    time_seconds: np.ndarray, fraction_initial: np.ndarray, weight: np.ndarray
+) -> dict[str, np.ndarray]:
+    """`DERIVED` quantities of every sample of a run, NaN when undefined.
+
+    The drying rate of a sample is the weight lost per hour between the
+    samples `RATE_WINDOW_SECONDS / 2` before and after it.
+    """
+    t = np.asarray(time_seconds, dtype=np.float64)
+    f = np.asarray(fraction_initial, dtype=np.float64)
+    w = np.asarray(weight, dtype=np.float64)
+    f0 = f[0] if len(f) else np.nan
+    before = np.searchsorted(t, t - RATE_WINDOW_SECONDS / 2)
+    after = np.searchsorted(t, t + RATE_WINDOW_SECONDS / 2, side="right") - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        derived = {
+            "dry_basis_moisture": f / (1 - f0),
+            "moisture_ratio": f / f0,
+            "drying_rate": (w[before] - w[after]) / (t[after] - t[before]) * 3600,
+        }
+    for values in derived.values():
+        values[~np.isfinite(values)] = np.nan
+    return derived
+
+
+def _as_float64(values: np.ndarray) -> np.ndarray:
+    """Values as float64, float32 ones through their shortest decimal repr."""
+    if values.dtype == np.float32:
+        decimal = pc.cast(pa.array(values), pa.string())
+        return pc.cast(decimal, pa.float64()).to_numpy()
+    return values
+
+
+def _text(value: str) -> pa.Scalar:
+    # 64-bit offsets, the JSON of a long trajectory can take more than 2 GiB
+    return pa.scalar(value, pa.large_string())
+
+
+def _json_numbers(values: np.ndarray) -> pa.Array:
+    """Shortest JSON repr of every value: floats keep a fraction (`300.0`) and
+    an undefined one is null."""
+    array = pa.array(values)
+    text = pc.cast(array, pa.large_string())
+    if not pa.types.is_floating(array.type):
+        return text
+    integral = pc.match_substring_regex(text, r"^-?[0-9]+$")
+    fraction = pc.binary_join_element_wise(text, _text(".0"), _text(""))
+    text = pc.if_else(integral, fraction, text)
+    return pc.if_else(pc.is_finite(array), text, _text("null"))
+
+
+def encode_states(columns: dict[str, np.ndarray]) -> pa.Array:
+    """`StatePublic` JSON of every row of the `columns`, put together from
+    the fields column by column, as large strings."""
+    parts = []
+    for position, (name, values) in enumerate(columns.items()):
+        parts.append(_text(("{" if position == 0 else ",") + f'"{name}":'))
+        parts.append(_json_numbers(values))
+    parts.append(_text("}"))
+    return pc.binary_join_element_wise(*parts, _text(""))
+
+
+def state_json(state: StatePublic) -> bytes:
+    """`StatePublic` JSON of a state that is not a sample of a trajectory.
+
+    Encoded as the samples are: undefined quantities are null, and there is
+    no `anomalies` field unless the state has some.
+    """
+    exclude = {"anomalies"} if state.anomalies is None else None
+    return state.model_dump_json(exclude=exclude).encode()
+
+
+class Trajectory:
+    """In-memory, read-only copy of a drying trajectory.
+
+    The arrays are never written after loading, so any number of simulations
+    can share the same instance without copying it. The `DERIVED` quantities
+    are computed once, and every sample is encoded once, as JSON (with them)
+    and as a `SAMPLE_DTYPE` record (without), so that serving it is only a
+    matter of slicing bytes.
+
+    A `compact` trajectory stores the time as int32 (when it fits) and the
+    values as float32; they are served with their shortest float32 repr, so
+    `296.16` stays `296.16` instead of `296.1600036621094`.
+    """
+
+    def __init__(self, time_seconds, fraction_initial, weight, compact=False):
+        time_seconds = np.asarray(time_seconds)
+        if compact and time_seconds.max(initial=0) < 2**31:
+            self.time_seconds = time_seconds.astype(np.int32)
+        else:
+            self.time_seconds = time_seconds.astype(np.int64)
+        value_dtype = np.float32 if compact else np.float64
+        self.fraction_initial = np.asarray(fraction_initial, dtype=value_dtype)
+        self.weight = np.asarray(weight, dtype=value_dtype)
+        derived = derived_quantities(
+            self.time_seconds,
+            _as_float64(self.fraction_initial),
+            _as_float64(self.weight),
+        )
+        self.dry_basis_moisture = derived["dry_basis_moisture"].astype(value_dtype)
+        self.moisture_ratio = derived["moisture_ratio"].astype(value_dtype)
+        self.drying_rate = derived["drying_rate"].astype(value_dtype)
+        for array in (self.time_seconds, self.fraction_initial, self.weight):
+            array.flags.writeable = False
+        for name in DERIVED:
+            getattr(self, name).flags.writeable = False
+        self._encode()
+
+    def _encode(self):
+        # the binary records are a single copy of the arrays
+        names = ["time_seconds", "fraction_initial", "weight", *DERIVED]
+        encoded = encode_states({name: getattr(self, name) for name in names})
+        _, offsets, data = encoded.buffers()
+        self._json = memoryview(data)
+        self._json_offsets = np.frombuffer(offsets, dtype=np.int64)
+        records = np.empty(len(self), dtype=SAMPLE_DTYPE)
+        records["time_seconds"] = self.time_seconds
+        records["fraction_initial"] = _as_float64(self.fraction_initial)
+        records["weight"] = _as_float64(self.weight)
+        self._binary = records.tobytes()
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the samples and their encodings."""
+        return (
+            self.time_seconds.nbytes
+            + self.fraction_initial.nbytes
+            + self.weight.nbytes
+            + sum(getattr(self, name).nbytes for name in DERIVED)
+            + len(self._json)
+            + self._json_offsets.nbytes
+            + len(self._binary)
+        )
+
+    @classmethod
+    def from_session(cls, session: Session) -> "Trajectory":
+        rows = session.exec(
+            select(
+                HistoryState.time_seconds,
+                HistoryState.fraction_initial,
+                HistoryState.weight,
+            ).order_by(HistoryState.time_seconds)
+        ).all()
+        time_seconds, fraction_initial, weight = zip(*rows) if rows else ((), (), ())
+        return cls(time_seconds, fraction_initial, weight)
+
+    def __len__(self) -> int:
+        return len(self.time_seconds)
+
+    @cached_property
+    def kinetics(self) -> PageModel:
+        """Drying kinetics fitted on the whole trajectory, computed once."""
+        return PageModel.fit(self.time_seconds, self.fraction_initial, self.weight)
+
+    def nearest_index(self, seconds: float) -> int:
+        """Index of the sample closest to `seconds`, the earlier one on ties."""
+        index = int(np.searchsorted(self.time_seconds, seconds))
+        if index == 0:
+            return 0
+        if index == len(self):
+            return index - 1
+        before, after = self.time_seconds[index - 1], self.time_seconds[index]
+        return index - 1 if seconds - before <= after - seconds else index
+
+    def nearest_indices(self, seconds: np.ndarray) -> np.ndarray:
+        """`nearest_index` of every value of `seconds` at once."""
+        if len(self) == 1:
+            return np.zeros(len(seconds), dtype=np.intp)
+        index = np.clip(np.searchsorted(self.time_seconds, seconds), 1, len(self) - 1)
+        before, after = self.time_seconds[index - 1], self.time_seconds[index]
+        return np.where(seconds - before <= after - seconds, index - 1, index)
+
+    def state(self, index: int) -> StatePublic:
+        return StatePublic.model_validate_json(self.json(index))
+
+    def state_at(self, seconds: float) -> StatePublic:
+        return self.state(self.nearest_index(seconds))
+
+    def json(self, index: int) -> bytes:
+        """`StatePublic` JSON of a sample."""
+        return bytes(
+            self._json[self._json_offsets[index] : self._json_offsets[index + 1]]
+        )
+
+    def binary(self, index: int) -> bytes:
+        """`SAMPLE_DTYPE` record of a sample."""
+        size = SAMPLE_DTYPE.itemsize
+        return self._binary[index * size : (index + 1) * size]
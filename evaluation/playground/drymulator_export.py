@@ -0,0 +1,34 @@
+"""
+Load runs exported by the drymulator into polars.
+"""
+
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import polars as pl
+
+drymulator_url = "http://localhost:7435"
+
+
+def load_run(table: str, url: str = drymulator_url, **params) -> pl.DataFrame:
+    """
+    Load a table of the current run, streamed by `/export/{table}` as Arrow IPC.
+
+    Args:
+        table: "trajectory", "states" or "commands".
+        url: The drymulator to export from.
+        params: Other query parameters of the export, e.g. `dryer_id`.
+
+    Returns:
+        The table as a polars DataFrame.
+    """
+    query = urlencode({"format": "arrow", **params})
+    with urlopen(f"{url}/export/{table}?{query}") as response:
+        return pl.read_ipc_stream(response)
+
+
+if __name__ == "__main__":
+    states = load_run("states")
+    commands = load_run("commands")
+    print(commands)
+    print(states.join_asof(commands, left_on="wallclock", right_on="changed_at"))
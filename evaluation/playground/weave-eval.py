@@ -3,9 +3,10 @@ import weave
 from super_cat_client import SuperCatClient
 from cheshire_cat_api.config import Config
 import re
-from drymulator_client.api.default import current_state_state_current_get
 from drymulator_client.client import Client
+from drymulator_client.models import StatePublic
 import asyncio
+from datetime import datetime
 import pandas as pd
 from pyprojroot import here
 from weave.scorers import HallucinationFreeScorer, EmbeddingSimilarityScorer
@@ -21,9 +22,11 @@ drymulator_url = "http://localhost:7435"
 class CatModel(weave.Model):
     @weave.op()
     async def predict(self, prompt: str) -> dict:
+        # the cat reads the state somewhere in between, the scorer replays both ends
+        sent_at = datetime.now().isoformat()
         with SuperCatClient(config) as client:
             response = client.send(prompt)
-        return response
+        return {**response, "sent_at": sent_at, "received_at": datetime.now().isoformat()}
 
 
 weave.init("smart-drying-unitus/declarative-eval")
@@ -38,10 +41,18 @@ def drymulator_weight_eval(output: dict) -> dict:
     is_correct = False
     try:
         llm_weight = float(re.search(r"\d+(\.\d+)?", output["text"])[0])
+        # states served while the cat was answering, the weight only goes down
         with Client(drymulator_url) as client:
-            state = current_state_state_current_get.sync(client=client)
-            real_weight = state.weight
-        is_correct = abs(llm_weight - real_weight) < 0.1
+            first, last = (
+                StatePublic.from_dict(
+                    client.get_httpx_client()
+                    .get("/state/at", params={"wallclock": output[key]})
+                    .raise_for_status()
+                    .json()
+                )
+                for key in ("sent_at", "received_at")
+            )
+        is_correct = last.weight - 0.1 < llm_weight < first.weight + 0.1
     except ValueError:
         print("Failed to extract weight from response")
         is_correct = False
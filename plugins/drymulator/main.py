@@ -7,8 +7,8 @@ Interface with the drying simulator (drymulator)
 """
 
 from cat.mad_hatter.decorators import tool, hook
+from drymulator_client import get_client
 from drymulator_client.api.default import current_state_state_current_get
-from drymulator_client.client import Client
 
 
 ###########
@@ -37,15 +37,19 @@ def agent_prompt_prefix(prefix, cat) -> str:
     return prefix
 
 
+def current_state(cat):
+    """Query the current state, through the client shared by every tool call."""
+    settings = cat.mad_hatter.get_plugin().load_settings()
+    client = get_client(settings["server_url"], http2=settings.get("http2", False))
+    return current_state_state_current_get.sync(client=client)
+
+
 @tool()
 def current_weight(tool_input, cat):
     """
     Query the drying system to get the current weight of the product.
     """
-    settings = cat.mad_hatter.get_plugin().load_settings()
-    with Client(settings["server_url"]) as client:
-        state = current_state_state_current_get.sync(client=client)
-        return str(state.weight)
+    return str(current_state(cat).weight)
 
 
 @tool()
@@ -53,7 +57,31 @@ def current_fraction_initial(tool_input, cat):
     """
     Query the drying system to get the current weight of the product.
     """
-    settings = cat.mad_hatter.get_plugin().load_settings()
-    with Client(settings["server_url"]) as client:
-        state = current_state_state_current_get.sync(client=client)
-        return str(state.fraction_initial)
\ No newline at end of file
+    return str(current_state(cat).fraction_initial)
+
+
+@tool()
+def current_dry_basis_moisture(tool_input, cat):
+    """
+    Query the drying system to get the current moisture content of the product on
+    dry basis (kg of water per kg of dry matter).
+    """
+    return str(current_state(cat).dry_basis_moisture)
+
+
+@tool()
+def current_moisture_ratio(tool_input, cat):
+    """
+    Query the drying system to get the current moisture ratio of the product (dry
+    basis moisture content over the initial one, from 1 down to 0).
+    """
+    return str(current_state(cat).moisture_ratio)
+
+
+@tool()
+def current_drying_rate(tool_input, cat):
+    """
+    Query the drying system to get the current drying rate of the product (grams of
+    weight lost per hour).
+    """
+    return str(current_state(cat).drying_rate)
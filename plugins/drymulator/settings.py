@@ -7,6 +7,7 @@ class DrymulatorSettings(BaseModel):
     server_url: AnyHttpUrl = (
         "http://localhost:7435"  # random unique port for the drymulator server
     )
+    http2: bool = False  # needs the h2 package, HTTP/1.1 without it
 
 
 # Give your settings model to the Cat.